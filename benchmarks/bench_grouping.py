@@ -0,0 +1,89 @@
+'''
+Benchmark de la agrupación de respuestas multi-estación de valores/climatologicos/diarios.
+
+Compara el algoritmo anterior (O(n²): cada registro copiaba todas las fechas de todas las estaciones)
+con group_historical_records (una sola pasada por indicativo).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_grouping --stations 25 --days 365
+
+Con el tamaño completo (25 estaciones x 365 días) el algoritmo anterior tarda varios minutos
+y necesita más de 1 GB de memoria; usar --skip-legacy para medir solo la versión nueva.
+'''
+import argparse
+import time
+import tracemalloc
+from datetime import date, timedelta
+from scripts.utils import format_historical_weather_data, group_historical_records
+
+
+def build_payload(stations, days):
+    '''Genera una respuesta sintética de la AEMET: un registro por estación y día'''
+    start = date(2025, 1, 1)
+    payload = []
+    for s in range(stations):
+        for d in range(days):
+            payload.append({
+                "fecha": (start + timedelta(days=d)).isoformat(),
+                "indicativo": f"{1000 + s}X",
+                "nombre": f"ESTACION {s}",
+                "provincia": "MADRID",
+                "tmed": "12,4", "prec": "0,0", "tmin": "6,1", "tmax": "18,7",
+                "velmedia": "2,5", "racha": "9,7", "hrMedia": "61", "hrMax": "88", "hrMin": "35"
+            })
+    return payload
+
+
+def legacy_grouping(data):
+    '''Algoritmo anterior de fetch_historical_station_data'''
+    grouped_station = []
+    for i in range(len(data)):
+        station_info = {
+            "town_code": data[i].get('indicativo', 'no_data'),
+            "province": data[i].get('provincia', 'no_data'),
+            "town": data[i].get('nombre', 'no_data'),
+            "date": {}
+        }
+        for day_data in data:
+            date_str = day_data.get('fecha', 'no_data')
+            station_info["date"][date_str] = {
+                date_str: format_historical_weather_data(day_data)
+            }
+        grouped_station.append(station_info)
+    return grouped_station
+
+
+def measure(func, payload):
+    '''Devuelve (segundos, pico de memoria en MB, nº de registros) de func(payload)'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(payload)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=25)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--skip-legacy', action='store_true', help="No ejecutar el algoritmo anterior (es muy lento)")
+    args = parser.parse_args()
+
+    payload = build_payload(args.stations, args.days)
+    print(f"Payload: {args.stations} estaciones x {args.days} días = {len(payload)} registros")
+
+    results = [("group_historical_records", *measure(group_historical_records, payload))]
+    if not args.skip_legacy:
+        results.insert(0, ("legacy O(n²)", *measure(legacy_grouping, payload)))
+
+    for name, elapsed, peak, records in results:
+        print(f"{name:<26} {elapsed:>10.3f} s  {peak:>10.1f} MB pico  {records:>6} registros")
+
+    if len(results) == 2:
+        print(f"Mejora: {results[0][1] / results[1][1]:.0f}x en CPU, {results[0][2] / results[1][2]:.0f}x en memoria")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+'''
+Benchmark de process_historical_data (preparación de los datos históricos para los csv).
+
+Compara el algoritmo anterior (un diccionario por fila y float() celda a celda)
+con la versión por columnas, que convierte con pd.to_numeric solo los valores distintos de cada columna.
+Los datos incluyen columnas solo con enteros (humedad relativa) y se comprueba que el csv es idéntico,
+tanto completo como estación a estación (modo streaming).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_historical_csv --stations 900 --days 365
+'''
+import argparse
+import logging
+import random
+import time
+from datetime import date, timedelta
+import pandas as pd
+from scripts.csv_convert import HISTORICAL_METRICS, process_historical_data
+
+SPECIAL_VALUES = ['Ip', 'Acum', 'no_data']
+# La AEMET da la humedad relativa como entero ('85'): columnas sin ningún decimal
+INTEGER_KEYS = set(HISTORICAL_METRICS['humedad_relativa'])
+
+
+def build_data(stations, days):
+    '''Genera un weather_data.json sintético (con valores especiales y claves ausentes) y su ema_codes'''
+    rng = random.Random(0)
+    keys = [key for metric_keys in HISTORICAL_METRICS.values() for key in metric_keys]
+    start = date(2025, 1, 1)
+    ts = "2025-04-10T13:00:00+00:00"
+
+    all_data, ema_codes = {}, {}
+    for s in range(stations):
+        code = f"{1000 + s}X"
+        ema_codes[f"MUNICIPIO {s}"] = code
+        dates = {}
+        for d in range(days):
+            day = (start + timedelta(days=d)).isoformat()
+            values = {}
+            for key in keys:
+                roll = rng.random()
+                if roll < 0.03:
+                    continue
+                if roll < 0.06:
+                    values[key] = rng.choice(SPECIAL_VALUES)
+                elif key in INTEGER_KEYS:
+                    values[key] = str(rng.randint(10, 100))
+                else:
+                    values[key] = f"{rng.uniform(-5, 40):.1f}".replace('.', ',')
+            dates[day] = {'values': {day: values}, 'ts_insert': ts, 'ts_update': ts}
+        all_data[code] = {"town_code": code, "province": "MADRID", "town": f"ESTACION {s}", "date": dates}
+    return all_data, ema_codes, keys
+
+
+def legacy_process(all_data, ema_codes, keys):
+    '''Algoritmo anterior de process_historical_data'''
+    all_dfs = []
+    for town, code in ema_codes.items():
+        if code in all_data:
+            data = []
+            for date_str, values in all_data[code]['date'].items():
+                common_fields = {
+                    'date': date_str,
+                    'province': all_data[code]['province'],
+                    'town': all_data[code]['town'],
+                    'ts_insert': values['ts_insert'],
+                    'ts_update': values['ts_update']
+                }
+                meteo_values = values['values'].get(date_str, {})
+                for key in keys:
+                    if key in meteo_values:
+                        name_str = meteo_values[key]
+                        if name_str in SPECIAL_VALUES:
+                            common_fields[key] = name_str
+                        else:
+                            common_fields[key] = float(str(name_str).replace(',', '.'))
+                    else:
+                        common_fields[key] = 'no_data'
+                data.append(common_fields)
+            if data:
+                all_dfs.append(pd.DataFrame(data))
+    return all_dfs
+
+
+def measure(func, *args):
+    '''Devuelve (segundos, DataFrame concatenado) de func(*args)'''
+    start = time.perf_counter()
+    df = pd.concat(func(*args), ignore_index=True)
+    return time.perf_counter() - start, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    all_data, ema_codes, keys = build_data(args.stations, args.days)
+    print(f"Datos: {args.stations} estaciones x {args.days} días x {len(keys)} claves")
+
+    # process_historical_data registra cada municipio; se silencia para no medir el log
+    logging.disable(logging.INFO)
+
+    legacy_time, legacy_df = measure(legacy_process, all_data, ema_codes, keys)
+    new_time, new_df = measure(process_historical_data, all_data, ema_codes, keys)
+    typed_time, _ = measure(lambda *a: process_historical_data(*a, typed=True), all_data, ema_codes, keys)
+
+    print(f"{'legacy (celda a celda)':<28} {legacy_time:>8.2f} s")
+    print(f"{'vectorizado':<28} {new_time:>8.2f} s")
+    print(f"{'vectorizado tipado':<28} {typed_time:>8.2f} s")
+    # Lo que importa es que los csv generados sean idénticos (los dtypes intermedios pueden variar)
+    same_csv = legacy_df.to_csv(index=False) == new_df.to_csv(index=False)
+    # El modo streaming construye un DataFrame por estación: cada uno debe coincidir también por separado
+    same_stations = all(
+        legacy_process(all_data, {town: code}, keys)[0].to_csv(index=False)
+        == process_historical_data(all_data, {town: code}, keys)[0].to_csv(index=False)
+        for town, code in list(ema_codes.items())[:50]
+    )
+    print(f"Mejora: {legacy_time / new_time:.1f}x | csv idéntico: {same_csv} | por estación: {same_stations}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+'''
+Benchmark de extremo a extremo contra el servidor AEMET simulado (benchmarks/mock_aemet.py).
+
+Copia el paquete scripts/ a un directorio temporal (los json y journals se escriben junto a él),
+arranca el servidor local y ejecuta cada escenario en un proceso aparte apuntando AEMET_BASE_URL al servidor:
+    inventory           obtain_and_group_stations_codes (crea codes_group.json)
+    historical          historical_data
+    historical_parallel historical_data(mode="parallel")
+    historical_replay   data_from_error_journal
+    prediction          prediction_data_by_town (secuencial)
+    prediction_async    prediction_data_by_town(mode="async")
+    prediction_pipeline prediction_data_by_town(mode="pipeline")
+    prediction_replay   prediction_data_from_error_journal
+El inventario y las recuperaciones se ejecutan sin fallos inyectados.
+
+Para cada uno muestra el tiempo total, las peticiones atendidas por el servidor, peticiones/s,
+los 429 y errores inyectados, las entradas en el journal de errores y el pico de memoria del proceso.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_mock_api --towns 8132 --stations 900 --days 90 --latency 0.02 --error-rate 0.01
+
+El limitador de peticiones se desactiva por defecto (--rate-limit) para medir el cliente y no la cuota.
+Con --autotune se activa el control AIMD (AEMET_RATE_AUTOTUNE): partiendo de --rate-limit, la tasa aprendida
+se guarda en json/rate_state.json del directorio de trabajo y la hereda el siguiente escenario, p.ej.:
+    python -m benchmarks.bench_mock_api --autotune --rate-limit 1 --key-rate 5 --scenarios historical,historical_parallel
+Con --outage-after/--outage-seconds el servidor responde 503 a todo durante un tramo de cada escenario con fallos,
+para ver el circuito (AEMET_BREAKER_*) y el presupuesto de reintentos (AEMET_RETRY_BUDGET) en acción.
+'''
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import date, timedelta
+
+if __package__:
+    from .mock_aemet import MockAEMETServer, town_codes
+else:
+    from mock_aemet import MockAEMETServer, town_codes
+
+SCENARIOS = ['inventory', 'historical', 'historical_parallel', 'historical_replay', 'prediction', 'prediction_async', 'prediction_pipeline', 'prediction_replay']
+# Sin fallos inyectados: el inventario prepara codes_group.json y la recuperación debe poder vaciar los journals
+FAULT_FREE_SCENARIOS = {'inventory', 'historical_replay', 'prediction_replay'}
+
+_project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_workdir(towns):
+    '''Copia scripts/ a un directorio temporal y crea json/towns_codes.json con los municipios simulados'''
+    workdir = tempfile.mkdtemp(prefix='aemet_bench_')
+    shutil.copytree(
+        os.path.join(_project_dir, 'scripts'),
+        os.path.join(workdir, 'scripts'),
+        ignore=shutil.ignore_patterns('__pycache__')
+    )
+    os.makedirs(os.path.join(workdir, 'json'))
+    with open(os.path.join(workdir, 'json', 'towns_codes.json'), 'w', encoding='utf-8') as f:
+        json.dump(town_codes(towns), f, ensure_ascii=False)
+    return workdir
+
+
+def journal_entries(workdir, name):
+    path = os.path.join(workdir, 'error_journal', f'{name}.jsonl')
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def peak_memory_mb():
+    '''Pico de memoria residente del proceso (None si la plataforma no lo ofrece)'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(scenario, workdir, final_date, concurrency):
+    '''Ejecuta un escenario dentro del directorio de trabajo y devuelve su resumen en JSON por stdout'''
+    import time
+    import logging
+    sys.path.insert(0, workdir)
+    import scripts
+    from scripts.http_session import session_stats
+
+    # Sin el log INFO para medir el cliente y no la consola
+    logging.disable(logging.INFO)
+    start = time.perf_counter()
+    if scenario == 'inventory':
+        scripts.obtain_and_group_stations_codes()
+    elif scenario == 'historical':
+        scripts.historical_data(final_date)
+    elif scenario == 'historical_parallel':
+        scripts.historical_data(final_date, mode="parallel", concurrency=concurrency)
+    elif scenario == 'historical_replay':
+        scripts.data_from_error_journal(concurrency=concurrency)
+    elif scenario == 'prediction':
+        scripts.prediction_data_by_town()
+    elif scenario == 'prediction_async':
+        scripts.prediction_data_by_town(mode="async", concurrency=concurrency)
+    elif scenario == 'prediction_pipeline':
+        scripts.prediction_data_by_town(mode="pipeline")
+    elif scenario == 'prediction_replay':
+        scripts.prediction_data_from_error_journal(concurrency=concurrency)
+    wall = time.perf_counter() - start
+
+    from scripts.key_pool import get_key_pool
+    tuned = get_key_pool().rate_states()
+    print(json.dumps({
+        # Tasa media aprendida por clave
+        "rate": sum(state['rate'] for state in tuned.values()) / len(tuned) if tuned else None,
+        "wall": wall,
+        "client_requests": session_stats()['requests'],
+        "peak_mb": peak_memory_mb()
+    }))
+
+
+def run_scenario(scenario, server, workdir, args, env):
+    '''Lanza el escenario en un proceso aparte y combina su resumen con los contadores del servidor'''
+    final_date = (date(2025, 1, 1) + timedelta(days=args.days - 1)).isoformat()
+    server.reset_counters()
+    outage = None
+    if args.outage_seconds and scenario not in FAULT_FREE_SCENARIOS:
+        outage = threading.Timer(args.outage_after, server.outage, [args.outage_seconds])
+        outage.start()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', scenario, '--workdir', workdir,
+         '--final-date', final_date, '--concurrency', str(args.concurrency)],
+        env=env,
+        cwd=workdir,
+        stdout=subprocess.PIPE,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+        text=True
+    )
+    if outage is not None:
+        outage.cancel()
+    if completed.returncode != 0 or not completed.stdout.strip():
+        return None
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    counters = server.snapshot()
+    result.update(counters)
+    result['rps'] = counters['requests'] / result['wall'] if result['wall'] else 0.0
+    result['journal'] = journal_entries(workdir, 'error_prediction' if 'prediction' in scenario else 'errors')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--towns', type=int, default=8132)
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--days', type=int, default=90, help='días pedidos por grupo desde 2025-01-01')
+    parser.add_argument('--latency', type=float, default=0.02, help='segundos por petición en el servidor')
+    parser.add_argument('--data-latency', type=float, default=0.0, help='segundos extra por descarga de datos')
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-data-rate', type=float, default=0.0)
+    parser.add_argument('--key-rate', type=float, default=0.0, help='cuota del servidor por clave (peticiones/s)')
+    parser.add_argument('--keys', type=int, default=1, help='claves en AEMET_API_KEYS')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate-limit', type=float, default=1000.0, help='AEMET_RATE_LIMIT del cliente')
+    parser.add_argument('--retry-wait', type=float, default=1.0, help='AEMET_RATE_LIMIT_WAIT tras un 429')
+    parser.add_argument('--autotune', action='store_true', help='activar el control AIMD de la tasa (AEMET_RATE_AUTOTUNE)')
+    parser.add_argument('--rate-max', type=float, default=20.0, help='AEMET_RATE_MAX con --autotune')
+    parser.add_argument('--outage-after', type=float, default=1.0, help='segundos desde el inicio del escenario hasta la caída')
+    parser.add_argument('--outage-seconds', type=float, default=0.0, help='duración de la caída simulada (503 a todo)')
+    parser.add_argument('--breaker-cooldown', type=float, default=2.0, help='AEMET_BREAKER_COOLDOWN del cliente')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--keep', action='store_true', help='no borrar el directorio de trabajo')
+    parser.add_argument('--verbose', action='store_true', help='mostrar el log de los escenarios')
+    # Modo interno: ejecución de un escenario en el proceso hijo
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--final-date', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workdir, args.final_date, args.concurrency)
+        return
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+    workdir = prepare_workdir(args.towns)
+    server = MockAEMETServer(
+        towns=args.towns, stations=args.stations, latency=args.latency, data_latency=args.data_latency,
+        rate_429=args.rate_429, error_rate=args.error_rate, no_data_rate=args.no_data_rate, key_rate=args.key_rate
+    ).start()
+
+    env = dict(
+        os.environ,
+        AEMET_BASE_URL=server.base_url,
+        AEMET_API_KEY='benchmark',
+        AEMET_API_KEYS=','.join(f'benchmark-key-{i}' for i in range(1, args.keys + 1)),
+        AEMET_CACHE='false',
+        AEMET_RATE_LIMIT=str(args.rate_limit),
+        AEMET_RATE_BURST=str(max(1, int(args.rate_limit))),
+        AEMET_RATE_LIMIT_WAIT=str(args.retry_wait),
+        AEMET_RATE_AUTOTUNE='true' if args.autotune else 'false',
+        AEMET_RATE_MAX=str(args.rate_max),
+        AEMET_CONCURRENCY_MAX=str(args.concurrency * 2),
+        AEMET_BREAKER_COOLDOWN=str(args.breaker_cooldown),
+        # El servidor simulado solo aplica la cuota por clave a los metadatos, como la AEMET
+        AEMET_DATOS_RATE_LIMITED=os.getenv('AEMET_DATOS_RATE_LIMITED', 'true'),
+        # El modo json reescribe prediction_data.json completo por municipio
+        AEMET_PREDICTION_STORAGE=os.getenv('AEMET_PREDICTION_STORAGE', 'log')
+    )
+
+    print(f"Servidor simulado: {args.towns} municipios, {args.stations} estaciones, {args.days} días, "
+          f"latencia {args.latency * 1000:.0f} ms (+{args.data_latency * 1000:.0f} ms en datos), 429 {args.rate_429:.1%}, errores {args.error_rate:.1%}, "
+          f"{args.keys} clave(s)" + (f" de {args.key_rate:g} pet/s" if args.key_rate else ""))
+    print(f"Directorio de trabajo: {workdir}\n")
+    header = f"{'escenario':<20} {'tiempo (s)':>10} {'peticiones':>10} {'pet/s':>8} {'429':>6} {'5xx':>6} {'journal':>8} {'pico MB':>8}"
+    if args.autotune:
+        header += f" {'tasa':>6}"
+    print(header)
+    print('-' * len(header))
+
+    try:
+        for scenario in scenarios:
+            if scenario in FAULT_FREE_SCENARIOS:
+                server.rate_429 = server.error_rate = server.no_data_rate = 0.0
+            else:
+                server.rate_429, server.error_rate, server.no_data_rate = args.rate_429, args.error_rate, args.no_data_rate
+
+            result = run_scenario(scenario, server, workdir, args, env)
+            if result is None:
+                print(f"{scenario:<20} falló (usar --verbose para ver el log)")
+                continue
+            peak = f"{result['peak_mb']:.0f}" if result['peak_mb'] is not None else 'n/d'
+            line = (
+                f"{scenario:<20} {result['wall']:>10.2f} {result['requests']:>10} {result['rps']:>8.1f} "
+                f"{result['rate_limited']:>6} {result['errors']:>6} {result['journal']:>8} {peak:>8}"
+            )
+            if args.autotune:
+                # Tasa por clave aprendida al terminar el escenario
+                line += f" {result['rate']:>6.2f}" if result['rate'] is not None else f" {'n/d':>6}"
+            print(line)
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
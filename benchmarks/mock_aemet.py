@@ -0,0 +1,318 @@
+'''
+Servidor local que imita el protocolo en dos pasos de la API de la AEMET, para medir sin gastar cuota.
+
+Cada petición a /opendata/api/... devuelve los metadatos {"descripcion", "estado", "datos"} y la URL
+de 'datos' (/opendata/sh/...) devuelve la carga sintética:
+    - inventario de estaciones (valores/climatologicos/inventarioestaciones/todasestaciones)
+    - valores diarios multi-estación (valores/climatologicos/diarios/datos/fechaini/.../estacion/...)
+    - predicción diaria por municipio (prediccion/especifica/municipio/diaria/<código>)
+
+Se puede configurar la latencia, la proporción de respuestas 429, de errores 500 y de respuestas
+sin datos (estado 404 en los metadatos), una cuota por clave (--key-rate) que responde 429 al superarla
+y caídas temporales (outage) en las que todas las peticiones reciben un 503.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.mock_aemet --port 8080 --latency 0.05 --rate-429 0.01
+y en el .env: AEMET_BASE_URL=http://127.0.0.1:8080/opendata/api
+'''
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = '/opendata/api/'
+DATA_PREFIX = '/opendata/sh/'
+
+
+def town_codes(towns):
+    '''Códigos de municipio sintéticos con el formato de towns_codes.json ({código: nombre})'''
+    return {f"{i:05d}": f"MUNICIPIO {i}" for i in range(1, towns + 1)}
+
+
+def station_codes(stations):
+    '''Indicativos sintéticos de las estaciones del inventario'''
+    return [f"{1000 + i}X" for i in range(stations)]
+
+
+def build_inventory(stations):
+    return [
+        {
+            "latitud": "403000N", "provincia": "MADRID", "altitud": "650",
+            "indicativo": code, "nombre": f"ESTACION {code}", "indsinop": "", "longitud": "034000W"
+        }
+        for code in station_codes(stations)
+    ]
+
+
+def build_historical(codes, init_date, end_date):
+    '''Un registro por estación y día, con los valores como los devuelve la AEMET (coma decimal)'''
+    days = (end_date - init_date).days + 1
+    records = []
+    for code in codes:
+        for d in range(days):
+            day = (init_date + timedelta(days=d)).isoformat()
+            records.append({
+                "fecha": day, "indicativo": code, "nombre": f"ESTACION {code}", "provincia": "MADRID",
+                "altitud": "650", "tmed": "12,4", "prec": "Ip" if d % 11 == 0 else "0,0",
+                "tmin": "6,1", "horatmin": "06:10", "tmax": "18,7", "horatmax": "15:30",
+                "dir": "99", "velmedia": "2,5", "racha": "9,7", "horaracha": "13:20",
+                "hrMedia": "61", "hrMax": "88", "horaHrMax": "06:00", "hrMin": "35", "horaHrMin": "16:00"
+            })
+    return records
+
+
+def build_forecast(code, name):
+    '''Predicción diaria a 7 días de un municipio con la estructura de prediccion/especifica/municipio/diaria'''
+    today = date.today()
+    elaborado = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0).strftime('%Y-%m-%dT%H:%M:%S')
+    periods = ["00-24", "00-12", "12-24", "00-06", "06-12", "12-18", "18-24"]
+    days = []
+    for d in range(7):
+        days.append({
+            "probPrecipitacion": [{"value": 10 * (i % 4), "periodo": p} for i, p in enumerate(periods)],
+            "cotaNieveProv": [{"value": "", "periodo": p} for p in periods],
+            "estadoCielo": [{"value": "12", "periodo": p, "descripcion": "Poco nuboso"} for p in periods],
+            "viento": [{"direccion": "NE", "velocidad": 10, "periodo": p} for p in periods],
+            "rachaMax": [{"value": "", "periodo": p} for p in periods],
+            "temperatura": {"maxima": 24, "minima": 11, "dato": [{"value": 15, "hora": h} for h in (6, 12, 18, 24)]},
+            "sensTermica": {"maxima": 24, "minima": 11, "dato": [{"value": 15, "hora": h} for h in (6, 12, 18, 24)]},
+            "humedadRelativa": {"maxima": 80, "minima": 35, "dato": [{"value": 60, "hora": h} for h in (6, 12, 18, 24)]},
+            "uvMax": 6,
+            "fecha": f"{(today + timedelta(days=d)).isoformat()}T00:00:00"
+        })
+    return [{
+        "origen": {"productor": "Agencia Estatal de Meteorología - AEMET. Gobierno de España"},
+        "elaborado": elaborado,
+        "nombre": name,
+        "provincia": "MADRID",
+        "prediccion": {"dia": days},
+        "id": code,
+        "version": "1.0"
+    }]
+
+
+class MockAEMETServer:
+    '''
+    Servidor HTTP en un hilo (ThreadingHTTPServer, keep-alive) con contadores de peticiones.
+    Los parámetros de inyección de fallos se pueden cambiar mientras está en marcha.
+    '''
+    def __init__(self, host='127.0.0.1', port=0, towns=8132, stations=900,
+                 latency=0.0, rate_429=0.0, error_rate=0.0, no_data_rate=0.0, key_rate=0.0, seed=42, data_latency=0.0):
+        self.towns = town_codes(towns)
+        # Cuota por clave (peticiones/s de metadatos, como la de la AEMET): por encima se responde 429
+        self.key_rate = key_rate
+        self._key_buckets = {}
+        self.stations = stations
+        self.latency = latency
+        # Latencia extra de las descargas de 'datos' (cargas grandes frente a metadatos pequeños)
+        self.data_latency = data_latency
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.no_data_rate = no_data_rate
+        self._outage_until = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_counters()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def root_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self):
+        '''Valor para AEMET_BASE_URL'''
+        return f"{self.root_url}{API_PREFIX.rstrip('/')}"
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {"requests": 0, "metadata": 0, "data": 0, "rate_limited": 0,
+                             "errors": 0, "no_data": 0, "bytes": 0}
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def outage(self, seconds):
+        '''Simula una caída de la AEMET: durante `seconds` segundos todas las peticiones reciben un 503'''
+        with self._lock:
+            self._outage_until = time.monotonic() + seconds
+
+    def _in_outage(self):
+        with self._lock:
+            return time.monotonic() < self._outage_until
+
+    def _roll(self, probability):
+        if probability <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < probability
+
+    def _key_allows(self, api_key):
+        '''Token bucket por clave (ráfaga de un segundo de cuota); False si la clave ha agotado su cuota'''
+        if self.key_rate <= 0:
+            return True
+        with self._lock:
+            current = time.monotonic()
+            tokens, last = self._key_buckets.get(api_key, (self.key_rate, current))
+            tokens = min(self.key_rate, tokens + (current - last) * self.key_rate)
+            allowed = tokens >= 1
+            self._key_buckets[api_key] = (tokens - 1 if allowed else tokens, current)
+            return allowed
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _send(self, handler, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+        self._count('bytes', len(body))
+
+    def _handle(self, handler):
+        self._count('requests')
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = unquote(handler.path.split('?', 1)[0])
+        is_metadata = path.startswith(API_PREFIX)
+        self._count('metadata' if is_metadata else 'data')
+        if self.data_latency and not is_metadata:
+            time.sleep(self.data_latency)
+
+        if is_metadata and not handler.headers.get('api_key'):
+            return self._send(handler, 401, {"descripcion": "API key invalido", "estado": 401})
+        if (is_metadata and not self._key_allows(handler.headers.get('api_key'))) or self._roll(self.rate_429):
+            self._count('rate_limited')
+            return self._send(
+                handler, 429,
+                {"descripcion": "Límite de peticiones o caudal por minuto excedido para este usuario", "estado": 429},
+                {"Retry-After": "1"}
+            )
+        if self._in_outage():
+            self._count('errors')
+            return self._send(handler, 503, {"descripcion": "Servicio no disponible", "estado": 503})
+        if self._roll(self.error_rate):
+            self._count('errors')
+            return self._send(handler, 500, {"descripcion": "Error interno", "estado": 500})
+
+        try:
+            if is_metadata:
+                return self._metadata(handler, path[len(API_PREFIX):])
+            if path.startswith(DATA_PREFIX):
+                return self._data(handler, path[len(DATA_PREFIX):])
+        except (ValueError, KeyError, IndexError):
+            pass
+        return self._send(handler, 404, {"descripcion": "Not Found", "estado": 404})
+
+    def _metadata(self, handler, endpoint):
+        '''Primer paso: {"estado": 200, "datos": URL de la carga} (o estado 404 si "no hay datos")'''
+        parts = endpoint.strip('/').split('/')
+
+        if endpoint.startswith('valores/climatologicos/inventarioestaciones/todasestaciones'):
+            data_path = 'inv'
+        elif endpoint.startswith('valores/climatologicos/diarios/datos/'):
+            # .../fechaini/<fecha>/fechafin/<fecha>/estacion/<indicativos>
+            init, end, codes = parts[5][:10], parts[7][:10], parts[9]
+            date.fromisoformat(init), date.fromisoformat(end)
+            data_path = f'hist/{init}/{end}/{codes}'
+        elif endpoint.startswith('prediccion/especifica/municipio/diaria/'):
+            data_path = f'pred/{parts[4]}'
+        else:
+            return self._send(handler, 404, {"descripcion": "Not Found", "estado": 404})
+
+        if self._roll(self.no_data_rate):
+            self._count('no_data')
+            return self._send(handler, 200, {"descripcion": "No hay datos que satisfagan esos criterios", "estado": 404})
+
+        return self._send(handler, 200, {
+            "descripcion": "exito",
+            "estado": 200,
+            "datos": f"{self.root_url}{DATA_PREFIX}{data_path}",
+            "metadatos": f"{self.root_url}{DATA_PREFIX}metadatos"
+        })
+
+    def _data(self, handler, data_path):
+        '''Segundo paso: la carga sintética de cada endpoint'''
+        kind, _, rest = data_path.partition('/')
+        if kind == 'inv':
+            return self._send(handler, 200, build_inventory(self.stations))
+        if kind == 'hist':
+            init, end, codes = rest.split('/', 2)
+            payload = build_historical(codes.split(','), date.fromisoformat(init), date.fromisoformat(end))
+            return self._send(handler, 200, payload)
+        if kind == 'pred':
+            code = rest.zfill(5)
+            return self._send(handler, 200, build_forecast(code, self.towns.get(code, f"MUNICIPIO {code}")))
+        return self._send(handler, 404, {"descripcion": "Not Found", "estado": 404})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--towns', type=int, default=8132)
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--latency', type=float, default=0.0, help='segundos por petición')
+    parser.add_argument('--data-latency', type=float, default=0.0, help='segundos extra por descarga de datos')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='proporción de respuestas 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='proporción de errores 500')
+    parser.add_argument('--no-data-rate', type=float, default=0.0, help='proporción de metadatos sin datos')
+    parser.add_argument('--key-rate', type=float, default=0.0, help='cuota por clave (peticiones/s, 0 = sin límite)')
+    args = parser.parse_args()
+
+    server = MockAEMETServer(args.host, args.port, args.towns, args.stations, args.latency,
+                             args.rate_429, args.error_rate, args.no_data_rate, args.key_rate,
+                             data_latency=args.data_latency)
+    print(f"Servidor AEMET simulado en {server.base_url} (Ctrl+C para terminar)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Peticiones atendidas: {server.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,8 @@ def main():
             print("** 1️⃣   Generar archivo desde cero                                   **")
             print("** 2️⃣   Reanudar la obtención de la información                      **")
             print("** 3️⃣   Recuperar información histórica desde los errores            **")
+            print("** 4️⃣   Actualizar de forma incremental (solo los días nuevos)        **")
+            print("** 5️⃣   Backfill de un rango de fechas (ventanas en paralelo)         **")
             print("** 0️⃣   Volver                                                       **")
             print("*"*70)
 
@@ -75,9 +77,34 @@ def main():
 
                 case "3":
                     print("** 3️⃣   Recuperar información histórica desde los errores             **\n")
-                    logger.info("Obteniendo información desde errors.json...")
+                    logger.info("Obteniendo información desde errors.jsonl...")
                     data_from_error_journal()
 
+                case "4":
+                    print("** 4️⃣   Actualizar de forma incremental (solo los días nuevos)         **\n")
+                    fecha = input("Introduce la fecha final (YYYY-MM-DD): ")
+                    is_valid, message = date_validation(fecha)
+
+                    if is_valid:
+                        logger.info("📝 Obteniendo solo los días posteriores a lo ya almacenado...")
+                        historical_data(fecha, incremental=True)
+                    else:
+                        logger.error(message)
+
+                case "5":
+                    print("** 5️⃣   Backfill de un rango de fechas (ventanas en paralelo)          **\n")
+                    fecha_inicio = input("Introduce la fecha inicial (YYYY-MM-DD): ")
+                    fecha_fin = input("Introduce la fecha final (YYYY-MM-DD): ")
+                    is_valid, message = date_validation(fecha_inicio)
+                    if is_valid:
+                        is_valid, message = date_validation(fecha_fin)
+
+                    if is_valid:
+                        logger.info("📝 Rellenando el rango de fechas por ventanas...")
+                        backfill_historical(fecha_inicio, fecha_fin)
+                    else:
+                        logger.error(message)
+
                 case "0":
                     continue
 
@@ -90,6 +117,7 @@ def main():
             print("** 2️⃣   Crear humedad_relativa_historico.csv     📝                  **")
             print("** 3️⃣   Crear precipitaciones_historico.csv      📝                  **")
             print("** 4️⃣   Crear viento_historico.csv               📝                  **")
+            print("** 5️⃣   Crear todos los csv históricos (una pasada) 📝               **")
             print("** 0️⃣   Volver                                                       **")
             print("*"*70)
 
@@ -112,6 +140,10 @@ def main():
                     logger.info("📝 Creando viento_historico.csv...")
                     historical_data_to_csv('viento')
 
+                case "5":
+                    logger.info("📝 Creando los cuatro csv históricos en una sola pasada...")
+                    historical_data_to_csv('all')
+
                 case "0":
                     continue
 
@@ -124,6 +156,10 @@ def main():
             print("** 1️⃣   Obtener previsión de los próximos 7 dias                     **")
             print("** 2️⃣   Reanudar obtención de previsión de los próximos 7 dias       **")
             print("** 3️⃣   Recuperar información de predicción desde los errores        **")
+            print("** 4️⃣   Obtener previsión en modo concurrente (asyncio)              **")
+            print("** 5️⃣   Compactar prediction_data.json (log de segmentos)            **")
+            print("** 6️⃣   Actualizar solo las previsiones nuevas (concurrente)         **")
+            print("** 7️⃣   Obtener previsión en modo pipeline (metadatos y descargas)   **")
             print("** 0️⃣   Volver                                                       **")
             print("*"*70)
 
@@ -148,8 +184,27 @@ def main():
 
                 case "3":
                     print("** 3️⃣    Recuperar información de predicción desde los errores         **")
-                    logger.info("Obteniendo información desde error_prediction.json...")
+                    logger.info("Obteniendo información desde error_prediction.jsonl...")
                     prediction_data_from_error_journal()
+
+                case "4":
+                    print("** 4️⃣   Obtener previsión en modo concurrente (asyncio)               **")
+                    logger.info("Obteniendo información en modo concurrente...")
+                    prediction_data_by_town(mode="async")
+
+                case "5":
+                    print("** 5️⃣   Compactar prediction_data.json (log de segmentos)             **")
+                    compact_prediction_data()
+
+                case "6":
+                    print("** 6️⃣   Actualizar solo las previsiones nuevas (concurrente)          **")
+                    logger.info("Actualizando los municipios con una predicción posiblemente nueva...")
+                    prediction_data_by_town(mode="async", refresh=True)
+
+                case "7":
+                    print("** 7️⃣   Obtener previsión en modo pipeline (metadatos y descargas)    **")
+                    logger.info("Obteniendo información en modo pipeline...")
+                    prediction_data_by_town(mode="pipeline")
                     
                 case "0":
                     continue
@@ -167,6 +222,7 @@ def main():
             print("** 6️⃣   Crear prediccion_temperatura.csv             📝             **")
             print("** 7️⃣   Crear prediccion_sens_termica.csv            📝             **")
             print("** 8️⃣   Crear prediccion_humedad_relativa.csv        📝             **")
+            print("** 9️⃣   Crear todos los csv de predicción (una pasada) 📝           **")
             print("** 0️⃣   Volver                                                       **")
             print("*"*70)
 
@@ -196,6 +252,9 @@ def main():
                 case "8":
                     logger.info("📝 Creando prediccion_humedad_relativa.csv...")
                     predictions_to_csv('humedad_relativa')
+                case "9":
+                    logger.info("📝 Creando los ocho csv de predicción en una sola pasada...")
+                    predictions_to_csv('all')
                 case "0":
                     continue
                 case _:
@@ -1,8 +1,16 @@
 from .scriptv3 import historical_data, data_from_error_journal, prediction_data_by_town, prediction_data_by_town, prediction_data_from_error_journal
 from .utils import obtain_and_group_stations_codes, date_validation, check_missing_town_codes, check_missing_group_codes
+from .backfill import backfill_historical, plan_windows
 from .csv_convert import historical_data_to_csv, predictions_to_csv
 from .verify_files import verify_json_docs
-from .tenacity_config import RateLimitException, api_retry
+from .tenacity_config import RateLimitException, api_retry, CircuitBreaker, get_circuit_breaker, get_retry_budget
+from .http_session import configure_session, session_stats, finish_run
+from .rate_limiter import TokenBucket, configure_rate_limiter, get_rate_limiter
+from .prediction_store import load_prediction_data, compact_prediction_data
+from .http_cache import ResponseCache, get_response_cache
+from .key_pool import ApiKeyPool, configure_key_pool, get_key_pool
+from .pipeline import run_pipeline
+from .rate_control import AIMDController
 
 __all__ = [
     'historical_data',
@@ -18,5 +26,25 @@ __all__ = [
     'verify_json_docs',
     'prediction_data_from_error_journal',
     'RateLimitException',
-    'api_retry'
+    'api_retry',
+    'CircuitBreaker',
+    'get_circuit_breaker',
+    'get_retry_budget',
+    'configure_session',
+    'session_stats',
+    'finish_run',
+    'TokenBucket',
+    'configure_rate_limiter',
+    'get_rate_limiter',
+    'load_prediction_data',
+    'compact_prediction_data',
+    'backfill_historical',
+    'plan_windows',
+    'ResponseCache',
+    'get_response_cache',
+    'ApiKeyPool',
+    'configure_key_pool',
+    'get_key_pool',
+    'AIMDController',
+    'run_pipeline'
     ]
\ No newline at end of file
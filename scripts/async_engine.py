@@ -0,0 +1,57 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración del motor asíncrono (se puede sobreescribir desde el .env)
+# La cuota de la AEMET la respeta el limitador global de rate_limiter.py (cada petición HTTP reserva un token)
+ASYNC_CONCURRENCY = int(os.getenv("AEMET_ASYNC_CONCURRENCY", 8))  # municipios en vuelo a la vez
+
+
+async def _run_ordered(items, worker, on_result, concurrency):
+    '''Lanza worker(item) en hilos con concurrencia limitada y entrega los resultados en el orden original'''
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    next_index = 0
+
+    # Pool propio con un hilo por elemento en vuelo: el del loop (asyncio.to_thread) tiene como mucho
+    # min(32, CPUs + 4) hilos y limitaría en silencio una concurrencia mayor
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="async-worker") as executor:
+        async def run_one(index, item):
+            async with semaphore:
+                # Las peticiones son bloqueantes (requests), se ejecutan en el pool de hilos
+                return index, await loop.run_in_executor(executor, worker, item)
+
+        tasks = [asyncio.create_task(run_one(index, item)) for index, item in enumerate(items)]
+
+        for finished in asyncio.as_completed(tasks):
+            index, result = await finished
+            results[index] = result
+
+            # Entregar en orden los resultados consecutivos disponibles
+            while next_index in results:
+                on_result(items[next_index], results.pop(next_index))
+                next_index += 1
+
+
+def run_ordered(items, worker, on_result, concurrency=ASYNC_CONCURRENCY):
+    """
+    Procesa una lista de elementos con varios en vuelo a la vez usando asyncio.
+
+    Args:
+        items: Lista de elementos a procesar
+        worker: Función bloqueante que recibe un elemento y devuelve su resultado
+        on_result: Función que recibe (elemento, resultado), llamada siempre en el orden de items
+        concurrency: Número máximo de elementos en vuelo
+    """
+    if not items:
+        return
+    asyncio.run(_run_ordered(list(items), worker, on_result, max(1, concurrency)))
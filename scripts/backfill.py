@@ -0,0 +1,180 @@
+import os
+import logging
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from .verify_files import verify_json_docs
+from .fetch_station_data import fetch_historical_group
+from .http_session import log_session_stats, finish_run
+from .rate_limiter import log_rate_limiter_stats
+from .http_cache import log_cache_stats
+from .historical_store import HISTORICAL_STORAGE, open_historical_store
+from .watermarks import load_watermarks, save_watermarks, group_watermark
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Configuración del backfill (se puede sobreescribir desde el .env)
+# La cuota de la AEMET la respeta el limitador global de rate_limiter.py (cada petición HTTP reserva un token)
+BACKFILL_WINDOW_DAYS = int(os.getenv("AEMET_BACKFILL_WINDOW_DAYS", 31))   # días por petición
+BACKFILL_CONCURRENCY = int(os.getenv("AEMET_BACKFILL_CONCURRENCY", 4))    # ventanas en vuelo a la vez
+
+
+def plan_windows(start_date, end_date, window_days=BACKFILL_WINDOW_DAYS):
+    '''
+    Divide el rango [start_date, end_date] (YYYY-MM-DD, ambos incluidos) en ventanas consecutivas
+    de como máximo window_days días. Devuelve una lista de tuplas (inicio, fin).
+    '''
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    if start > end:
+        raise ValueError(f"La fecha inicial {start_date} es posterior a la final {end_date}")
+
+    step = timedelta(days=max(1, window_days))
+    windows = []
+    while start <= end:
+        window_end = min(start + step - timedelta(days=1), end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def plan_backfill(groups, start_date, end_date, window_days=BACKFILL_WINDOW_DAYS):
+    '''
+    Plan del backfill: una tarea (grupo, estaciones, inicio, fin) por cada grupo y ventana.
+    Las ventanas de un mismo grupo van seguidas para que los grupos se completen en orden.
+    '''
+    windows = plan_windows(start_date, end_date, window_days)
+    return [
+        (group, stations_codes, window_start, window_end)
+        for group, stations_codes in groups.items()
+        for window_start, window_end in windows
+    ]
+
+
+def _encode_date(date_str):
+    '''YYYY-MM-DD -> fecha codificada para la URL de valores/climatologicos/diarios'''
+    return f"{date_str}T00:00:00UTC".replace(':', '%3A')
+
+
+def _fetch_window(task):
+    '''
+    Descarga una ventana de un grupo (se ejecuta en el pool de hilos).
+    Devuelve (resultado, indicativos cuya petición falló al dividir el grupo).
+    '''
+    group, stations_codes, window_start, window_end = task
+    failed = []
+    result = fetch_historical_group(
+        _encode_date(window_start),
+        _encode_date(window_end),
+        stations_codes.split(','),
+        failed=failed
+    )
+    return result, failed
+
+
+def backfill_historical(
+    start_date,
+    end_date,
+    storage=HISTORICAL_STORAGE,
+    window_days=BACKFILL_WINDOW_DAYS,
+    concurrency=BACKFILL_CONCURRENCY
+):
+    '''
+    Rellena los datos históricos entre start_date y end_date (YYYY-MM-DD) para todos los grupos
+    de codes_group.json, en ventanas de window_days días descargadas en paralelo.
+    Las ventanas se fusionan en el almacenamiento con upserts (se puede repetir sin duplicar datos)
+    y un fallo solo cuesta su ventana, que queda registrada en errors.jsonl.
+    Devuelve un resumen {windows, failed_windows, rows}.
+    '''
+    store = None
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        api_dir = os.path.dirname(script_dir)
+
+        groups = verify_json_docs(
+            json_path_dir=os.path.join(api_dir, 'json', 'codes_group.json'),
+            message="Debes crear primero el archivo de códigos EMA"
+        )
+        if not groups:
+            logger.warning("No hay códigos de estaciones para procesar")
+            return None
+
+        tasks = plan_backfill(groups, start_date, end_date, window_days)
+        logger.info(
+            f"🗓️ Backfill {start_date} → {end_date}: {len(groups)} grupos x "
+            f"{len(tasks) // len(groups)} ventanas de hasta {window_days} días = {len(tasks)} peticiones"
+        )
+
+        store = open_historical_store(storage)
+        watermarks = load_watermarks()
+        contiguous_from = (date.fromisoformat(start_date) - timedelta(days=1)).isoformat()
+        pending_windows = {group: 0 for group in groups}
+        failed_groups = set()
+        for group, *_ in tasks:
+            pending_windows[group] += 1
+
+        rows = 0
+        failed_windows = []
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(_fetch_window, task): task for task in tasks}
+
+            # La fusión se hace en este hilo: el almacenamiento solo lo escribe un hilo
+            for done, future in enumerate(as_completed(futures), 1):
+                group, stations_codes, window_start, window_end = futures[future]
+                try:
+                    result, failed_codes = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Error en {group} ({window_start} → {window_end}): {str(e)}")
+                    result, failed_codes = None, []
+
+                # Una estación que falló dentro de la ventana deja un hueco: la marca del grupo no debe pasarlo
+                if failed_codes:
+                    failed_groups.add(group)
+
+                if result:
+                    now = datetime.now(timezone.utc).isoformat()
+                    for station_data in result:
+                        rows += store.merge_station(station_data, now, overwrite=True)
+                    logger.info(f"[{done}/{len(tasks)}] {group} {window_start} → {window_end} ✅")
+                else:
+                    failed_windows.append((group, window_start, window_end))
+                    failed_groups.add(group)
+                    logger.warning(f"[{done}/{len(tasks)}] {group} {window_start} → {window_end} sin datos")
+
+                # Guardar cuando el grupo tiene todas sus ventanas resueltas
+                pending_windows[group] -= 1
+                if pending_windows[group] == 0:
+                    store.commit()
+                    # La marca de agua solo avanza si el grupo queda completo y sin huecos desde ella
+                    if group not in failed_groups and watermarks.get(group, '') >= contiguous_from:
+                        new_watermark = group_watermark(group, stations_codes.split(','), store, {})
+                        if new_watermark and new_watermark > watermarks[group]:
+                            watermarks[group] = new_watermark
+                            save_watermarks(watermarks)
+
+        store.commit()
+        logger.info(
+            f"✅ Backfill completado. Filas escritas: {rows} | "
+            f"Ventanas fallidas: {len(failed_windows)}/{len(tasks)}"
+        )
+        log_session_stats()
+        log_rate_limiter_stats()
+        log_cache_stats()
+        finish_run()
+        return {"windows": len(tasks), "failed_windows": failed_windows, "rows": rows}
+
+    except ValueError as e:
+        logger.error(f"❌Error en el backfill: {str(e)}")
+    except Exception as e:
+        logger.error(f"❌Error inesperado: {str(e)}", exc_info=True)
+    finally:
+        if store is not None:
+            store.close()
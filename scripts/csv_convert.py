@@ -1,8 +1,12 @@
 import logging
-import json
 import os
+import numpy as np
 import pandas as pd
 from .utils import verify_json_docs
+from .verify_files import iter_json_object_items
+from .prediction_store import load_prediction_data, prediction_data_exists
+from .historical_store import HISTORICAL_STORAGE, open_historical_store
+from .parquet_export import type_historical_frame, type_prediction_frame, write_parquet, ParquetStreamWriter
 
 # Configurar logging
 logging.basicConfig(
@@ -11,266 +15,436 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Generar los csv históricos estación a estación en lugar de cargar todo weather_data.json
+HISTORICAL_CSV_STREAMING = os.getenv("AEMET_CSV_STREAMING", "false").lower() == "true"
+# Formato de exportación: "csv" (csv/...) o "parquet" (parquet/..., columnas tipadas y comprimidas)
+EXPORT_FORMAT = os.getenv("AEMET_EXPORT_FORMAT", "csv")
+
+# Claves de cada csv histórico y columnas comunes a todos ellos
+HISTORICAL_METRICS = {
+    "temperatura": ["avg_t", "max_t", "min_t"],
+    "humedad_relativa": ["avg_rel_hum", "max_rel_hum", "min_rel_hum"],
+    "precipitaciones": ["precip"],
+    "viento": ["avg_vel", "max_vel"],
+}
+HISTORICAL_COMMON_COLUMNS = ['date', 'province', 'town', 'ts_insert', 'ts_update']
+
+# Métricas de predicción: (clave en el JSON, clave del valor, campos extra)
+PREDICTION_METRICS = {
+    "precipitaciones": ("probPrecipitacion", "value", []),
+    "cota_nieve": ("cotaNieveProv", "value", []),
+    "estado_cielo": ("estadoCielo", "value", ["descripcion"]),
+    "viento": ("viento", "velocidad", ["direccion"]),
+    "racha_max": ("rachaMax", "value", []),
+    "temperatura": ("temperatura", None, []),
+    "sens_termica": ("sensTermica", None, []),
+    "humedad_relativa": ("humedadRelativa", None, []),
+}
+PREDICTION_DAYS = ['day_1', 'day_2', 'day_3', 'day_4', 'day_5', 'day_6', 'day_7']
+
 def safe_get_value(data, key, default=0):
     '''Función para reemplazar strings vacíos con 0'''
     value = data.get(key, default)
     return default if value == "" else value
 
-def process_prediction_data(prediction_weather_data: list, name: str, key: str, value: str, extra_fields: list) -> list:
+def fill_prediction_metric(row: dict, day: str, metric_data, name: str, value: str, extra_fields: list):
+    '''Añade a la fila las columnas de una métrica para un día de predicción'''
+    # Para métricas con estructura compleja (temperatura, sensTermica, humedadRelativa)
+    if name in ['temperatura', 'sens_termica', 'humedad_relativa']:
+        row[f'{day}_maxima'] = metric_data.get('maxima', 0)
+        row[f'{day}_minima'] = metric_data.get('minima', 0)
+        
+        for dato in metric_data.get('dato', []):
+            hora = dato.get('hora', '')
+            val = dato.get('value', 0)
+            row[f'{day}_hora{hora}'] = val
+    
+    # Para estado_cielo (con descripción)
+    elif name == "estado_cielo":
+        if isinstance(metric_data, list):
+            for val in metric_data:
+                periodo = val.get('periodo', '').replace('-', '_')  # 00-24 -> 00_24
+                row_val = safe_get_value(val, 'value', "")
+                row_desc = val.get('descripcion', "")
+                
+                # Solo agregar si hay datos
+                if row_val != "" or row_desc != "":
+                    row[f'{day}_{periodo}_value'] = row_val
+                    row[f'{day}_{periodo}_desc'] = row_desc
+
+    elif name == "viento":
+        if isinstance(metric_data, list):
+            for val in metric_data:
+                periodo = val.get('periodo', '').replace('-', '_')
+                velocidad = safe_get_value(val, 'velocidad', 0)
+                direccion = val.get('direccion', '')
+                
+                # Solo agregar si hay datos relevantes
+                if velocidad != 0 or direccion != "":
+                    row[f'{day}_{periodo}_velocidad'] = velocidad
+                    row[f'{day}_{periodo}_direccion'] = direccion
+    
+    # Para otras métricas simples
+    else:
+        if isinstance(metric_data, list):
+            for i, val in enumerate(metric_data, start=1):
+                if isinstance(val, dict):
+                    row[f'{day}_value{i}'] = safe_get_value(val, value)
+                    # Agregar campos extra si existen
+                    for field in extra_fields:
+                        if field in val:
+                            row[f'{day}_{field}{i}'] = val[field]
+                else:
+                    row[f'{day}_value{i}'] = val if val != "" else 0
+        else:
+            row[f'{day}_value'] = safe_get_value(metric_data, value)
+
+def process_prediction_data_batch(prediction_weather_data: list, metrics: dict) -> dict:
     """
-    Procesa los datos de predicción meteorológica para convertirlos en formato CSV.
+    Procesa los datos de predicción para varias métricas recorriendo cada municipio una sola vez.
     
     Args:
         prediction_weather_data: Lista de diccionarios con los datos meteorológicos
-        name: Nombre de la métrica a procesar
-        key: Clave principal en los datos JSON
-        value: Clave del valor principal en los datos JSON
-        extra_fields: Lista de campos adicionales a incluir
+        metrics: Diccionario {nombre: (clave JSON, clave del valor, campos extra)}
         
     Returns:
-        Lista de diccionarios con los datos procesados para CSV
+        Diccionario {nombre: lista de diccionarios con los datos procesados para CSV}
     """
-    processed_data = []
+    processed_data = {name: [] for name in metrics}
     
     for entry in prediction_weather_data:
-        row = {
+        base_row = {
             'id': entry['id'],
             'town': entry['town'],
             'province': entry['province'],
             'fetched_date': entry['fetched'][:10]
         }
+        rows = {name: dict(base_row) for name in metrics}
         
-        # Procesar las predicciones para cada día
-        for day in ['day_1', 'day_2', 'day_3', 'day_4', 'day_5', 'day_6', 'day_7']:
+        # Procesar las predicciones para cada día (todas las métricas a la vez)
+        for day in PREDICTION_DAYS:
             if day in entry['prediction']:
                 day_data = entry['prediction'][day]
                 date_key = next(iter(day_data.keys()))  # Obtiene la primera clave (timestamp)
-                row[f'{day}_date'] = date_key[:10]  # Solo la fecha
-                
-                if key in day_data[date_key]:
-                    metric_data = day_data[date_key][key]
-                    
-                    # Para métricas con estructura compleja (temperatura, sensTermica, humedadRelativa)
-                    if name in ['temperatura', 'sens_termica', 'humedad_relativa']:
-                        row[f'{day}_maxima'] = metric_data.get('maxima', 0)
-                        row[f'{day}_minima'] = metric_data.get('minima', 0)
-                        
-                        for dato in metric_data.get('dato', []):
-                            hora = dato.get('hora', '')
-                            val = dato.get('value', 0)
-                            row[f'{day}_hora{hora}'] = val
-                    
-                    # Para estado_cielo (con descripción)
-                    elif name == "estado_cielo":
-                        if isinstance(metric_data, list):
-                            for val in metric_data:
-                                periodo = val.get('periodo', '').replace('-', '_')  # 00-24 -> 00_24
-                                row_val = safe_get_value(val, 'value', "")
-                                row_desc = val.get('descripcion', "")
-                                
-                                # Solo agregar si hay datos
-                                if row_val != "" or row_desc != "":
-                                    row[f'{day}_{periodo}_value'] = row_val
-                                    row[f'{day}_{periodo}_desc'] = row_desc
-
-                    elif name == "viento":
-                        if isinstance(metric_data, list):
-                            for val in metric_data:
-                                periodo = val.get('periodo', '').replace('-', '_')
-                                velocidad = safe_get_value(val, 'velocidad', 0)
-                                direccion = val.get('direccion', '')
-                                
-                                # Solo agregar si hay datos relevantes
-                                if velocidad != 0 or direccion != "":
-                                    row[f'{day}_{periodo}_velocidad'] = velocidad
-                                    row[f'{day}_{periodo}_direccion'] = direccion
+                day_values = day_data[date_key]
+
+                for name, (key, value, extra_fields) in metrics.items():
+                    row = rows[name]
+                    row[f'{day}_date'] = date_key[:10]  # Solo la fecha
                     
-                    # Para otras métricas simples
-                    else:
-                        if isinstance(metric_data, list):
-                            for i, val in enumerate(metric_data, start=1):
-                                if isinstance(val, dict):
-                                    row[f'{day}_value{i}'] = safe_get_value(val, value)
-                                    # Agregar campos extra si existen
-                                    for field in extra_fields:
-                                        if field in val:
-                                            row[f'{day}_{field}{i}'] = val[field]
-                                else:
-                                    row[f'{day}_value{i}'] = val if val != "" else 0
-                        else:
-                            row[f'{day}_value'] = safe_get_value(metric_data, value)
+                    if key in day_values:
+                        fill_prediction_metric(row, day, day_values[key], name, value, extra_fields)
         
-        processed_data.append(row)
+        for name, row in rows.items():
+            processed_data[name].append(row)
     
     return processed_data
 
-def predictions_to_csv(name: str):
-    '''Función para crear los csv de las predicciones'''
-    match name:
-        case "precipitaciones":
-            key = "probPrecipitacion"
-            value = "value"
-            extra_fields = []
-        case "cota_nieve":
-            key = "cotaNieveProv"
-            value = "value"
-            extra_fields = []
-        case "estado_cielo":
-            key = "estadoCielo"
-            value = "value"
-            extra_fields = ["descripcion"]
-        case "viento":
-            key = "viento"
-            value = "velocidad"
-            extra_fields = ["direccion"]
-        case "racha_max":
-            key = "rachaMax"
-            value = "value"
-            extra_fields = []
-        case "temperatura":
-            key = "temperatura"
-            value = None
-            extra_fields = []
-        case "sens_termica":
-            key = "sensTermica"
-            value = None
-            extra_fields = []
-        case "humedad_relativa":
-            key = "humedadRelativa"
-            value = None
-            extra_fields = []
+def process_prediction_data(prediction_weather_data: list, name: str, key: str, value: str, extra_fields: list) -> list:
+    """
+    Procesa los datos de predicción meteorológica para convertirlos en formato CSV.
+    
+    Args:
+        prediction_weather_data: Lista de diccionarios con los datos meteorológicos
+        name: Nombre de la métrica a procesar
+        key: Clave principal en los datos JSON
+        value: Clave del valor principal en los datos JSON
+        extra_fields: Lista de campos adicionales a incluir
+        
+    Returns:
+        Lista de diccionarios con los datos procesados para CSV
+    """
+    return process_prediction_data_batch(prediction_weather_data, {name: (key, value, extra_fields)})[name]
 
+def predictions_to_csv(name: str, output_format: str = EXPORT_FORMAT):
+    '''
+    Función para crear los csv de las predicciones.
+    Con name="all" se generan los ocho csv recorriendo prediction_data.json una sola vez.
+    Con output_format="parquet" escribe el mismo conjunto de columnas tipado en parquet/prediction.
+    '''
     try:
+        if name == "all":
+            metrics = PREDICTION_METRICS
+        elif name in PREDICTION_METRICS:
+            metrics = {name: PREDICTION_METRICS[name]}
+        else:
+            raise ValueError(f"Métrica de predicción desconocida: {name}")
+
         # Configuración de directorios
         script_dir = os.path.dirname(os.path.abspath(__file__))
         api_dir = os.path.dirname(script_dir)
         prediction_csv_dir = os.path.join(api_dir, 'csv', 'prediction')
-        prediction_weather_dir = os.path.join(api_dir, 'json', f'prediction_data.json')
+        extension = 'csv'
+
+        if output_format == "parquet":
+            prediction_csv_dir = os.path.join(api_dir, 'parquet', 'prediction')
+            extension = 'parquet'
         
         os.makedirs(prediction_csv_dir, exist_ok=True)
 
-        # Cargar los datos
-        with open(prediction_weather_dir, 'r', encoding='utf-8') as f:
-            prediction_weather_data = json.load(f)
+        # Cargar los datos (prediction_data.json + log de segmentos si existe)
+        if not prediction_data_exists():
+            raise ValueError("No esta creado prediction_data.json")
+        prediction_weather_data = load_prediction_data()
 
-        # Procesar los datos
-        processed_data = process_prediction_data(
-            prediction_weather_data,
-            name,
-            key,
-            value,
-            extra_fields
-        )
+        # Procesar los datos (una sola pasada para todas las métricas)
+        processed_data = process_prediction_data_batch(prediction_weather_data, metrics)
 
         # Convertir a DataFrame y guardar
-        df = pd.DataFrame(processed_data)
-        csv_path = os.path.join(prediction_csv_dir, f'prediccion_{name}.csv')
-        df.to_csv(csv_path, index=False, encoding='utf-8')
-        logger.info(f"📝 Archivo prediccion_{name}.csv creado en {csv_path}")
+        for metric, rows in processed_data.items():
+            df = pd.DataFrame(rows)
+            output_path = os.path.join(prediction_csv_dir, f'prediccion_{metric}.{extension}')
+
+            if output_format == "parquet":
+                write_parquet(type_prediction_frame(df), output_path)
+            else:
+                df.to_csv(output_path, index=False, encoding='utf-8')
+            logger.info(f"📝 Archivo prediccion_{metric}.{extension} creado en {output_path}")
         
     except Exception as e:
         logger.error(f"❌ Error al procesar los datos: {str(e)}")
         return None
     
-def process_historical_data(all_data: dict, ema_codes: dict, keys: list) -> list:
+def historical_columns(keys: list, typed: bool = False) -> list:
+    '''Columnas del archivo histórico de una métrica (con sus flags si es la salida tipada)'''
+    columns = HISTORICAL_COMMON_COLUMNS + keys
+    if typed:
+        columns += [f'{key}_flag' for key in keys]
+    return columns
+
+def normalize_historical_values(raw_values: list, typed: bool = False):
+    """
+    Convierte en bloque una columna de valores AEMET ('12,5', 'Ip', 'Acum', 'no_data'...).
+    
+    Args:
+        raw_values: Lista con los valores tal como vienen en el JSON
+        typed: False devuelve la columna de los csv (números y los textos originales);
+               True devuelve (columna Float64 con nulos, columna de flags con el texto original)
+        
+    Returns:
+        Serie normalizada, o tupla (valores, flags) si typed=True
     """
-    Prepara los datos históricos para ser convertidos a CSV.
+    # Las mediciones se repiten mucho (p.ej. '12,5'): se convierten solo los valores distintos
+    codes, uniques = pd.factorize(np.array(raw_values, dtype=object), use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    numeric = pd.to_numeric(uniques.astype(str).str.replace(',', '.', regex=False), errors='coerce')
+    is_number = numeric.notna()
+
+    if typed:
+        values = numeric.astype('Float64').take(codes).reset_index(drop=True)
+        flags = uniques.where(~is_number).astype('string').take(codes).reset_index(drop=True)
+        return values, flags
+
+    # Formato de los csv: float como el float() anterior (la humedad '85' se escribe 85.0 aunque toda la columna sea entera)
+    # y los valores no numéricos se mantienen como texto
+    return numeric.astype('float64').astype(object).where(is_number, uniques).take(codes).reset_index(drop=True)
+
+def process_historical_data(all_data: dict, ema_codes: dict, keys: list, typed: bool = False) -> list:
+    """
+    Prepara los datos históricos para ser convertidos a CSV, construyendo columnas completas.
     
     Args:
-        all_data: Diccionario con todos los datos meteorológicos
+        all_data: Diccionario (o almacenamiento histórico) con todos los datos meteorológicos
         ema_codes: Diccionario con los códigos EMA y sus localidades
         keys: Lista de claves a procesar para cada entrada
+        typed: Si es True las claves son columnas Float64 con nulos y se añade '<clave>_flag'
+               con los valores especiales de la AEMET ('Ip', 'Acum', 'no_data')
         
     Returns:
-        Lista de DataFrames con los datos procesados
+        Lista con un DataFrame con los datos procesados (vacía si no hay datos)
     """
-    all_dfs = []
+    columns = {column: [] for column in HISTORICAL_COMMON_COLUMNS}
+    raw_values = {key: [] for key in keys}
 
     # Solo se usan los 'ema_codes' existentes
     for town, code in ema_codes.items():
         if code in all_data:  # Verificar si el código existe
-            data = []
             logger.info(f"Procesando {town} ({code})...")
+            station = all_data[code]
+            dates = station['date']
+
+            columns['date'].extend(dates.keys())
+            columns['province'].extend([station['province']] * len(dates))
+            columns['town'].extend([station['town']] * len(dates))
             
-            for date, values in all_data[code]['date'].items():
-                common_fields = {
-                    'date': date,
-                    'province': all_data[code]['province'],
-                    'town': all_data[code]['town'],
-                    'ts_insert': values['ts_insert'],
-                    'ts_update': values['ts_update']
-                }
-
-                meteo_values = values['values'].get(date, {})
-
-                for key in keys:
-                    if key in meteo_values:
-                        name_str = meteo_values[key]
-                        # Verificar si el valor del campo es un número
-                        if name_str == 'no_data' or name_str == 'Ip' or name_str == 'Acum':
-                            common_fields[key] = name_str
-                        else:
-                            common_fields[key] = float(str(name_str).replace(',', '.'))
-                    else:
-                        common_fields[key] = 'no_data'
-                
-                data.append(common_fields)
-            
-            # Crear DataFrame y agregarlo a la lista
-            if data:
-                df = pd.DataFrame(data)
-                all_dfs.append(df)
+            columns['ts_insert'].extend([values['ts_insert'] for values in dates.values()])
+            columns['ts_update'].extend([values['ts_update'] for values in dates.values()])
+
+            meteo_values = [values['values'].get(date, {}) for date, values in dates.items()]
+            for key in keys:
+                raw_values[key].extend([meteo.get(key, 'no_data') for meteo in meteo_values])
+
+    if not columns['date']:
+        return []
+
+    # Conversión vectorizada de cada columna (decimales con coma y valores especiales)
+    df = pd.DataFrame(columns, dtype=object)
+    for key in keys:
+        if typed:
+            df[key], df[f'{key}_flag'] = normalize_historical_values(raw_values[key], typed=True)
+        else:
+            df[key] = normalize_historical_values(raw_values[key])
     
-    return all_dfs
-
-def historical_data_to_csv(name: str):
-    '''Función para crear los csv de los datos históricos'''
-    match name:
-        case "precipitaciones":
-            keys = ["precip"]
-        case "viento":
-            keys = ["avg_vel", "max_vel"]
-        case "temperatura":
-            keys = ["avg_t", "max_t", "min_t"]
-        case "humedad_relativa":
-            keys = ["avg_rel_hum", "max_rel_hum", "min_rel_hum"]
+    return [df]
+
+def iter_historical_stations(storage: str, ema_codes: dict, json_path: str):
+    """
+    Recorre las estaciones una a una sin cargar todos los datos en memoria.
+
+    Args:
+        storage: "json" (lectura incremental de weather_data.json) o "sqlite" (consulta por índice)
+        ema_codes: Diccionario con los códigos EMA y sus localidades
+        json_path: Ruta de weather_data.json
 
+    Returns:
+        Generador de tuplas (localidad, código, datos de la estación)
+    """
+    if storage == "json":
+        towns_by_code = {code: town for town, code in ema_codes.items()}
+        # Orden del archivo: se leen solo los datos de una estación cada vez
+        for code, station in iter_json_object_items(json_path, message="No esta creado weather_data.json"):
+            if code in towns_by_code:
+                yield towns_by_code[code], code, station
+    else:
+        store = open_historical_store(storage, must_exist=True)
+        try:
+            for town, code in ema_codes.items():
+                if code in store:
+                    yield town, code, store[code]
+        finally:
+            store.close()
+
+def write_historical_streaming(stations, metrics: dict, output_paths: dict, output_format: str = "csv") -> int:
+    """
+    Escribe los csv (o parquet) históricos estación a estación, todas las métricas en la misma pasada.
+
+    Args:
+        stations: Iterable de tuplas (localidad, código, datos de la estación)
+        metrics: Diccionario {métrica: lista de claves}
+        output_paths: Diccionario {métrica: ruta del archivo de salida}
+        output_format: "csv" o "parquet"
+
+    Returns:
+        Número de filas escritas por archivo
+    """
+    all_keys = [key for keys in metrics.values() for key in keys]
+    tmp_paths = {metric: path + '.tmp' for metric, path in output_paths.items()}
+    rows_written = 0
+
+    if output_format == "parquet":
+        writers = {metric: ParquetStreamWriter(tmp_paths[metric]) for metric in metrics}
+        try:
+            for town, code, station in stations:
+                for df in process_historical_data({code: station}, {town: code}, all_keys, typed=True):
+                    for metric, keys in metrics.items():
+                        writers[metric].write(type_historical_frame(df[historical_columns(keys, typed=True)], keys))
+                    rows_written += len(df)
+        finally:
+            for writer in writers.values():
+                writer.close()
+    else:
+        files = {metric: open(tmp_paths[metric], 'w', encoding='utf-8', newline='') for metric in metrics}
+        try:
+            for town, code, station in stations:
+                for df in process_historical_data({code: station}, {town: code}, all_keys):
+                    for metric, keys in metrics.items():
+                        df[historical_columns(keys)].to_csv(
+                            files[metric], sep=',', header=rows_written == 0, decimal='.', index=False
+                        )
+                    rows_written += len(df)
+        finally:
+            for f in files.values():
+                f.close()
+
+    # Solo se reemplazan los archivos anteriores si el recorrido terminó bien
+    for metric, tmp_path in tmp_paths.items():
+        if rows_written:
+            os.replace(tmp_path, output_paths[metric])
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows_written
+
+def historical_data_to_csv(
+        name: str,
+        storage: str = HISTORICAL_STORAGE,
+        streaming: bool = HISTORICAL_CSV_STREAMING,
+        output_format: str = EXPORT_FORMAT):
+    '''
+    Función para crear los csv de los datos históricos (desde weather_data.json o weather_data.db).
+    Con name="all" se generan los cuatro csv leyendo y recorriendo los datos una sola vez.
+    Con streaming=True recorre los datos estación a estación y escribe el csv sobre la marcha.
+    Con output_format="parquet" escribe el mismo conjunto de columnas tipado en parquet/historical.
+    '''
     try:
+        if name == "all":
+            metrics = HISTORICAL_METRICS
+        elif name in HISTORICAL_METRICS:
+            metrics = {name: HISTORICAL_METRICS[name]}
+        else:
+            raise ValueError(f"Métrica histórica desconocida: {name}")
+        all_keys = [key for keys in metrics.values() for key in keys]
+
         # Configuración de directorios
         script_dir = os.path.dirname(os.path.abspath(__file__))
         api_dir = os.path.dirname(script_dir)
         temp_csv_dir = os.path.join(api_dir, 'csv', 'historical')
         all_data_dir = os.path.join(api_dir, 'json', 'weather_data.json')
         ema_codes_dir = os.path.join(api_dir, 'json', 'ema_codes.json')
+        extension = 'csv'
+
+        if output_format == "parquet":
+            temp_csv_dir = os.path.join(api_dir, 'parquet', 'historical')
+            extension = 'parquet'
 
+        output_paths = {metric: os.path.join(temp_csv_dir, f'{metric}_historico.{extension}') for metric in metrics}
         os.makedirs(temp_csv_dir, exist_ok=True)
 
-        # Cargar los datos
-        all_data = verify_json_docs(all_data_dir, message="No esta creado weather_codes.json")
         ema_codes = verify_json_docs(ema_codes_dir, message="No esta creado ema_codes.json")
 
-        # Preparar los datos para CSV
-        all_dfs = process_historical_data(all_data, ema_codes, keys)
+        # Modo streaming: la memoria queda acotada por los datos de una estación
+        if streaming:
+            stations = iter_historical_stations(storage, ema_codes, all_data_dir)
+            if write_historical_streaming(stations, metrics, output_paths, output_format):
+                for metric in metrics:
+                    logger.info(f"📝 Archivo de {metric} creado correctamente en {temp_csv_dir}")
+            else:
+                logger.info("No hay datos válidos para procesar")
+            return
 
-        # Combinar todos los DataFrames en uno solo y guardar
+        # Cargar los datos (en SQLite cada estación se consulta por su índice al procesarla)
+        all_data = open_historical_store(storage, must_exist=True)
+
+        # Preparar los datos para CSV (una sola pasada con las claves de todas las métricas)
+        typed = output_format == "parquet"
+        try:
+            all_dfs = process_historical_data(all_data, ema_codes, all_keys, typed=typed)
+        finally:
+            all_data.close()
+
+        # Combinar todos los DataFrames en uno solo y guardar cada métrica
         if all_dfs:
             df_final = pd.concat(all_dfs, ignore_index=True)
-            temp_csv = os.path.join(temp_csv_dir, f'{name}_historico.csv')
-
-            df_final.to_csv(
-                temp_csv, 
-                sep=',',
-                encoding='utf-8',
-                header=True,
-                decimal='.',
-                index=False
-            )
-
-            logger.info(f"📝 Archivo de {name} creado correctamente en {temp_csv_dir}")
+
+            for metric, keys in metrics.items():
+                df_metric = df_final[historical_columns(keys, typed)]
+
+                if output_format == "parquet":
+                    write_parquet(type_historical_frame(df_metric, keys), output_paths[metric])
+                else:
+                    df_metric.to_csv(
+                        output_paths[metric], 
+                        sep=',',
+                        encoding='utf-8',
+                        header=True,
+                        decimal='.',
+                        index=False
+                    )
+
+                logger.info(f"📝 Archivo de {metric} creado correctamente en {temp_csv_dir}")
         else:
             logger.info("No hay datos válidos para procesar")
             
     except ValueError as e:
         logger.error(f"Error al acceder al JSON: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error inesperado: {str(e)}")
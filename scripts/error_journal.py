@@ -0,0 +1,161 @@
+import os
+import json
+import logging
+import threading
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+ERROR_JOURNAL_DIR = os.path.join(_api_dir, 'error_journal')
+
+# Evita que varios hilos (modo asíncrono) escriban a la vez en el mismo journal
+_journal_lock = threading.RLock()
+# Claves (código, petición) ya registradas en cada journal, para no duplicar entradas
+_journal_keys = {}
+
+
+def journal_path(name):
+    '''Ruta del journal JSON Lines (una entrada por línea): error_journal/<name>.jsonl'''
+    return os.path.join(ERROR_JOURNAL_DIR, f'{name}.jsonl')
+
+
+def entry_key(entry):
+    '''
+    Clave de deduplicación de una entrada: (código de estación o municipio, petición).
+    La petición es request_url si se registró: los fallos en los metadatos tienen todos url "URL no disponible",
+    y sin ella las ventanas de fechas distintas de un mismo grupo serían la misma entrada.
+    '''
+    return (str(entry.get('station_code')), str(entry.get('request_url') or entry.get('url')))
+
+
+def _migrate_legacy_journal(name):
+    '''Convierte el journal antiguo error_journal/<name>.json (lista JSON) al formato JSON Lines'''
+    legacy_path = os.path.join(ERROR_JOURNAL_DIR, f'{name}.json')
+    if not os.path.exists(legacy_path):
+        return
+
+    try:
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except json.JSONDecodeError:
+        logger.warning(f"❗ {legacy_path} dañado. No se puede migrar")
+        return
+
+    keys = set(_iter_keys(name))
+    with open(journal_path(name), 'a', encoding='utf-8') as f:
+        for entry in entries if isinstance(entries, list) else []:
+            if entry_key(entry) not in keys:
+                keys.add(entry_key(entry))
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.remove(legacy_path)
+    logger.info(f"📦 {legacy_path} migrado a {journal_path(name)}")
+
+
+def _iter_keys(name):
+    return (entry_key(entry) for entry in _read_entries(name))
+
+
+def _read_entries(name, end_offset=None):
+    '''Lee las entradas del journal hasta end_offset bytes, ignorando una última línea incompleta'''
+    path = journal_path(name)
+    if not os.path.exists(path):
+        return
+    position = 0
+    with open(path, 'rb') as f:
+        for line_number, line in enumerate(f, 1):
+            position += len(line)
+            if end_offset is not None and position > end_offset:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Una escritura interrumpida solo puede dejar a medias la última línea
+                logger.warning(f"❗ Línea {line_number} incompleta en {path}. Se ignora")
+
+
+def _load_keys(name):
+    '''Carga (una vez) las claves del journal; llamar con _journal_lock adquirido'''
+    if name not in _journal_keys:
+        _migrate_legacy_journal(name)
+        _journal_keys[name] = set(_iter_keys(name))
+    return _journal_keys[name]
+
+
+def append_journal_entry(name, entry):
+    '''
+    Añade una entrada al journal con una única escritura O(1) (flush en cada línea).
+    Devuelve False si ya había una entrada con la misma clave (ver entry_key).
+    '''
+    line = json.dumps(entry, ensure_ascii=False)
+    with _journal_lock:
+        os.makedirs(ERROR_JOURNAL_DIR, exist_ok=True)
+        keys = _load_keys(name)
+        key = entry_key(entry)
+        if key in keys:
+            return False
+
+        with open(journal_path(name), 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+        keys.add(key)
+        return True
+
+
+def journal_size(name):
+    '''Tamaño en bytes del journal (0 si no existe), para leer solo lo escrito hasta ese momento'''
+    with _journal_lock:
+        _load_keys(name)
+        path = journal_path(name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def iter_journal(name, end_offset=None):
+    '''
+    Recorre las entradas del journal como un stream.
+    Con end_offset solo se leen las entradas escritas antes de ese tamaño (ver journal_size),
+    de modo que las que se añadan durante una recuperación no se vuelven a procesar en la misma pasada.
+    '''
+    with _journal_lock:
+        _load_keys(name)
+    yield from _read_entries(name, end_offset)
+
+
+def remove_journal_entries(name, keys):
+    '''Reescribe el journal sin las entradas cuyas claves (ver entry_key) están en keys'''
+    keys = set(keys)
+    if not keys:
+        return 0
+
+    with _journal_lock:
+        path = journal_path(name)
+        if not os.path.exists(path):
+            return 0
+
+        removed = 0
+        remaining = set()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in _read_entries(name):
+                key = entry_key(entry)
+                if key in keys:
+                    removed += 1
+                    continue
+                remaining.add(key)
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+        if remaining:
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path)
+            os.remove(path)
+        _journal_keys[name] = remaining
+        return removed
@@ -1,13 +1,14 @@
-import os
-import time
 import logging
 import requests
 from dotenv import load_dotenv
-from tenacity import RetryError
 from requests.exceptions import HTTPError
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from .utils import *
 from .tenacity_config import RateLimitException, api_retry, is_rate_limit_error
+from .http_session import session_get, api_key_configured
+from .key_pool import get_key_pool
+from .station_grouping import GROUPING_MODE, record_group_response, record_group_failure
+from .http_cache import cache_get, cache_get_entry, cache_put
 
 # Configurar logging
 logging.basicConfig(
@@ -18,16 +19,28 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+class GroupFetchError(Exception):
+    """Fallo de un grupo de estaciones que se devuelve al llamador en lugar de ir al journal."""
+
 @api_retry
-def api_request(url, headers=None, timeout=(10, 30)):
-    """Función principal que realiza los fetchs teniendo en cuenta el RateLimit para reintentos."""
+def api_request(url, headers=None, timeout=(10, 30), stats=None, keyed=True):
+    """
+    Función principal que realiza los fetchs teniendo en cuenta el RateLimit para reintentos.
+    Si se pasa un diccionario en stats se rellena con el tamaño ('bytes') y la latencia ('elapsed').
+    Con keyed=False la petición sale sin clave (descargas de 'datos'; su ritmo lo marca AEMET_DATOS_RATE_LIMITED).
+    """
     try:
-        # Hace el fethc a la url con los headers y timeout (con ConnectTimeout y ReadTimeout)
-        response = requests.get(url, headers=headers, timeout=timeout)
+        # Hace el fetch a la url reutilizando el pool keep-alive (con ConnectTimeout y ReadTimeout)
+        response = session_get(url, headers=headers, timeout=timeout, keyed=keyed)
+        if stats is not None:
+            stats['bytes'] = len(response.content)
+            stats['elapsed'] = response.elapsed.total_seconds()
         
-        # Evalúa si la fetch lanza un RateLimitException, pasándole el tiempo de retry_after
+        # Evalúa si la fetch lanza un RateLimitException: la clave usada ya está en pausa,
+        # así que solo hay que esperar si no queda ninguna otra disponible
+        # (el cuerpo solo se decodifica aquí si es pequeño: las cargas de 'datos' se decodifican una vez, al devolverlas)
         if is_rate_limit_error(response):
-            raise RateLimitException(retry_after=61)
+            raise RateLimitException(retry_after=get_key_pool().retry_delay())
             
         response.raise_for_status()
         
@@ -51,63 +64,49 @@ def api_request(url, headers=None, timeout=(10, 30)):
         logger.error(f"🛑 Error inesperado: {str(e)}")
         raise
 
-def global_rate(last_request_time):
-    '''Función para establecer el control de tasa global (1 petición por segundo como mínimo)'''
+def _requested_days(encoded_init_date, encoded_end_date):
+    '''Número de días del rango fechaini/fechafin de una petición histórica'''
     try:
-        last_request_time = datetime.fromisoformat(last_request_time.replace('Z', '+00:00'))
-        elapsed_time = datetime.now(timezone.utc) - last_request_time
-
-        # Si el tiempo transcurrido es menor a 1.5s, espera lo que falta
-        if elapsed_time < timedelta(seconds=1.5):
-            time.sleep(1.5 - elapsed_time.total_seconds())
-        
-        # Retorna la nueva marca de tiempo actualizada (en formato ISO)
-        return datetime.now(timezone.utc).isoformat()
-    
-    except ValueError as e:
-        logger.warning(f"Formato de fecha inválido: {last_request_time} - {str(e)}")
-        # Retorna la hora actual como fallback
-        return datetime.now(timezone.utc).isoformat()
+        init = datetime.strptime(encoded_init_date[:10], "%Y-%m-%d")
+        end = datetime.strptime(encoded_end_date[:10], "%Y-%m-%d")
+        return (end - init).days + 1
+    except ValueError:
+        return 0
 
-@api_retry
 def fetch_historical_station_data(
     encoded_init_date,
     encoded_end_date,
     station_code,
-    last_request_time=None
+    journal=True
 ):
-    '''Función que obtiene los datos de cada estación y los alamacena en un JSON'''
+    '''
+    Función que obtiene los datos de cada estación y los alamacena en un JSON.
+    Con journal=False los fallos no se registran en errors.jsonl ni en las mediciones de la agrupación:
+    se lanza GroupFetchError (el llamador reparte el grupo y solo cuenta el fallo de la petición final).
+    '''
     response = {}
     data = None
     data_url = None
-    new_last_request_time = last_request_time
+    station_codes_list = station_code.split('%2C')
 
     try:
-        # Control de tasa global (1 petición por segundo como mínimo)
-        if last_request_time is None:
-            last_request_time = datetime.now(timezone.utc).isoformat()
-        else:
-            last_request_time = global_rate(last_request_time)
-        
-        # Construir URL y headers
+        # Construir URL
         weather_values_url = build_url(encoded_init_date,encoded_end_date,station_code)
         
-        # Verifico que existe AEMET_API_KEY
-        api_key = os.getenv("AEMET_API_KEY")
-        if not api_key:
+        # Verifico que existe AEMET_API_KEY (los headers ya están en la sesión compartida)
+        if not api_key_configured():
             logger.error("API key no configurada")
-            return None, new_last_request_time
-        
-        # Headers requeridos por la API
-        headers = {
-            'accept': 'application/json',
-            'api_key': api_key,
-            'cache-control': 'no-cache'
-        }
+            return None
+
+        # Los días ya cerrados no cambian: si están en la caché no se pide nada a la API
+        cached = cache_get(weather_values_url)
+        if cached is not None:
+            logger.info("🗄️ Datos del grupo obtenidos de la caché")
+            return group_historical_records(cached)
         
         # Primera petición para obtener URL de los datos
         logger.info(f"Obteniendo datos del grupo...")
-        response = api_request(weather_values_url, headers=headers)
+        response = api_request(weather_values_url)
 
         # Si response es una excepción (RateLimitException, RequestException, etc.)
         if isinstance(response, Exception):
@@ -116,257 +115,226 @@ def fetch_historical_station_data(
         # Si no hay respuesta válida
         if not response:
             logger.error("No se pudo obtener la URL de datos")
-            return None, new_last_request_time
+            return None
         
         # Si hay respuesta correcta, obtengo la url para el siguiente fetch
         if response.get('estado') == 200:
             data_url = response.get('datos')
             
-            # Segunda petición para los datos reales
-            data = api_request(data_url)
+            # Segunda petición para los datos reales (midiendo tamaño y latencia para la agrupación)
+            data_stats = {}
+            data = api_request(data_url, stats=data_stats, keyed=False)
 
             if not data or not isinstance(data, list) or len(data) == 0:
+                if not journal:
+                    raise GroupFetchError(f"Datos no válidos: {str(data)[:100]}")
+                record_group_failure(station_codes_list)
                 fetched_date = datetime.now(timezone.utc).isoformat()
                 build_journal(
                     name="errors",
                     codes_group=station_code,
                     server_response=data, 
                     fetched_url=data_url,
-                    fetched_date=fetched_date
+                    fetched_date=fetched_date,
+                    request_url=weather_values_url
                 )
-                return None, new_last_request_time
+                return None
             
-            grouped_station = []
-            for i in range(len(data)):
-                # Procesar datos en el formato específico
-                station_info = {
-                    "town_code": data[i].get('indicativo', 'no_data'),
-                    "province": data[i].get('provincia', 'no_data'),
-                    "town": data[i].get('nombre', 'no_data'),
-                    "date": {}
-                }
-
-                # Recorre la fecha para insertar los datos
-                for day_data in data:
-                    date = day_data.get('fecha', 'no_data')
-
-                    station_info["date"][date] = {
-                        date: format_historical_weather_data(day_data)
-                    }
-                
-                grouped_station.append(station_info)
+            cache_put(weather_values_url, data)
+
+            # Agrupar por estación en una sola pasada (un registro por indicativo)
+            grouped_station = group_historical_records(data)
+            record_group_response(
+                station_codes_list,
+                _requested_days(encoded_init_date, encoded_end_date),
+                {station['town_code']: len(station['date']) for station in grouped_station},
+                data_stats.get('bytes', 0),
+                data_stats.get('elapsed', 0.0)
+            )
             logger.info(f"Información del grupo extraída correctamente")
-            return grouped_station, datetime.now(timezone.utc).isoformat()
+            return grouped_station
         else:
             logger.error(f"Error en la API: {response.get('descripcion', 'Error desconocido')}")
-            return None, new_last_request_time
-    
-    except RetryError as e:
-        # Despues de 5 intentos, se crea la entrada en error_journal/errors.json
-        logger.error(f"Fallo después de múltiples intentos: {str(e)}")
-        fetched_date = datetime.now(timezone.utc).isoformat()
-        build_journal(
-            name="errors",
-            codes_group=station_code,
-            server_response=str(e), 
-            fetched_url=data_url if data_url else "URL no disponible",
-            fetched_date=fetched_date)
-        return None, last_request_time
+            return None
     
+    except GroupFetchError:
+        raise
+
     except Exception as e:
         logger.error(f"Error inesperado fetch_station_data: {str(e)}", exc_info=True)
+        if not journal:
+            raise GroupFetchError(str(e)) from e
+        record_group_failure(station_codes_list)
         fetched_date = datetime.now(timezone.utc).isoformat()
         build_journal(
             name="errors",
             codes_group=station_code,
             server_response=str(e),
             fetched_url=data_url if data_url else "URL no disponible",
-            fetched_date=fetched_date
+            fetched_date=fetched_date,
+            request_url=weather_values_url
         )
-        return None, last_request_time
-    
-@api_retry
-def fetch_error_data(last_request_time=None):
-    """Función para obtener los datos de las estaciones que fallaron (historicos) en error_journal/errors.json"""
-    response = {}
-    grouped_stations = []
-    data_url = None
-    current_url = None
-    new_last_request_time = last_request_time
+        return None
 
-    try:
-        # Control de tasa global (1 petición por segundo como mínimo)
-        if last_request_time is None:
-            last_request_time = datetime.now(timezone.utc).isoformat()
-        else:
-            last_request_time = global_rate(last_request_time)
+def fetch_historical_group(
+    encoded_init_date,
+    encoded_end_date,
+    station_codes,
+    split_on_failure=GROUPING_MODE == "adaptive",
+    failed=None
+):
+    '''
+    Obtiene los datos de un grupo de estaciones (lista de indicativos).
+    Con split_on_failure=True un grupo que falla se divide en dos mitades que se piden por separado,
+    hasta llegar a estaciones sueltas; solo los fallos de una estación suelta van a errors.jsonl
+    y a las mediciones de la agrupación (un corte no suma un fallo por cada nivel de la división).
+    Si se pasa una lista en failed se añaden los indicativos cuya petición falló (no están en el resultado por error).
+    '''
+    if not split_on_failure or len(station_codes) == 1:
+        result = fetch_historical_station_data(encoded_init_date, encoded_end_date, '%2C'.join(station_codes))
+        if result is None and failed is not None:
+            failed.extend(station_codes)
+        return result
 
-        # Obtener la lista de las url que fallaron
-        url_list = re_fetch_errors_journal()
-        if not url_list:
-            logger.info("No hay URL's para procesar")
-            return None, new_last_request_time
+    try:
+        return fetch_historical_station_data(
+            encoded_init_date, encoded_end_date, '%2C'.join(station_codes), journal=False
+        )
+    except GroupFetchError:
+        half = len(station_codes) // 2
+        logger.warning(f"✂️ Dividiendo el grupo de {len(station_codes)} estaciones en {half} + {len(station_codes) - half}")
 
-        # Verificar que la API_KEY este configurada
-        api_key = os.getenv("AEMET_API_KEY")
-        if not api_key:
-            logger.error("API key no configurada")
-            return None, new_last_request_time
-        
-        # Configuración de los headers
-        headers = {
-            'accept': 'application/json',
-            'api_key': api_key,
-            'cache-control': 'no-cache'
-        }
+    grouped_stations = []
+    for part in (station_codes[:half], station_codes[half:]):
+        result = fetch_historical_group(encoded_init_date, encoded_end_date, part, split_on_failure, failed)
+        if result:
+            grouped_stations.extend(result)
+    return grouped_stations or None
+    
+def fetch_error_url(url):
+    """
+    Vuelve a pedir una URL de error_journal/errors.jsonl: la petición de metadatos de la AEMET
+    (se sigue su 'datos') o directamente una URL de 'datos'. Cada petición tiene sus propios reintentos.
+    No escribe en el journal: las entradas que siguen fallando se quedan en él.
+    Devuelve la lista de estaciones agrupadas o None.
+    """
+    if not api_key_configured():
+        raise ValueError("API key no configurada")
+
+    cached = cache_get(url)
+    if cached is not None:
+        return group_historical_records(cached)
+
+    response = api_request(url)
+
+    # Respuesta de metadatos: la información está en la URL de 'datos'
+    if isinstance(response, dict):
+        if response.get('estado') != 200:
+            logger.error(f"Error en la API: {response.get('descripcion', 'Error desconocido')}")
+            return None
+        data_url = response.get('datos')
+        if not data_url:
+            logger.error("No se encontró URL de datos en la respuesta")
+            return None
+        response = api_request(data_url, keyed=False)
 
-        # Procesar cada url que falló
-        i=0
-        for url in url_list:
-            i += 1
-            current_url = url
-            logger.info(f"Procesando [{i}/{len(url_list)}]")
-            
-            # Primera petición para obtner la url con los datos
-            response = api_request(url, headers=headers)
-
-            if isinstance(response, Exception):
-                raise response
-            if not response:
-                logger.error("No se pudo obtener la URL de datos")
-                continue
-            
-            # Verifica la respuesta de la API
-            if response.get('estado') != 200:
-                error_msg = response.get('descripcion', 'Error desconocido')
-                logger.error(f"Error en la API: {error_msg}")
-                continue
+    if not response or not isinstance(response, list):
+        logger.error("Datos no válidos o vacíos recibidos")
+        return None
+    cache_put(url, response)
 
-            data_url = response.get('datos')
-            if not data_url:
-                logger.error("No se encontró URL de datos en la respuesta")
-                continue
+    # Procesar la información obtenida (un registro por estación)
+    return group_historical_records(response)
 
-            # Segunda petición para obtener los datos
-            data = api_request(data_url)
-            
-            # Validación de data
-            if not data or not isinstance(data, list):
-                logger.error("Datos no válidos o vacíos recibidos")
-                fetched_date = datetime.now(timezone.utc).isoformat()
-                build_journal(
-                    name="errors",
-                    codes_group=url,
-                    server_response=data,
-                    fetched_url=data_url,
-                    fetched_date=fetched_date
-                )
-                continue
+def _prediction_failure(town_code, server_response, fetched_url, journal):
+    '''Registra el fallo de un municipio en error_prediction.jsonl (si journal=True) y devuelve None'''
+    if journal:
+        build_journal(
+            name="error_prediction",
+            codes_group=town_code,
+            server_response=server_response,
+            fetched_url=fetched_url,
+            fetched_date=datetime.now(timezone.utc).isoformat()
+        )
+    return None
+
+def fetch_prediction_metadata(town_code, journal=True):
+    '''
+    Primer paso de la predicción de un municipio: pide los metadatos y devuelve {"url", "datos"}.
+    Si la predicción vigente está en la caché devuelve {"url", "data", "fetched"} sin llamar a la API,
+    con 'fetched' el momento en que se descargó. None si falla.
+    '''
+    try:
+        # Verificar la API_KEY (los headers ya están en la sesión compartida)
+        if not api_key_configured():
+            logger.error("API key no configurada")
+            return None
 
-            # Procesar la información obtenida en data
-            for station_data in data:
-                if not isinstance(station_data, dict):
-                    continue
+        weather_values_url = build_url(town_code=town_code)
 
-                station_info = {
-                    "town_code": station_data.get('indicativo', 'no_data'),
-                    "province": station_data.get('provincia', 'no_data'),
-                    "town": station_data.get('nombre', 'no_data'),
-                    "date": {}
-                }
+        # Hasta el siguiente 'elaborado' la predicción guardada en la caché es la vigente
+        # (las entradas sin momento de descarga se vuelven a pedir: no se sabría cuándo se obtuvieron)
+        cached = cache_get_entry(weather_values_url)
+        if cached is not None and cached[1] is not None:
+            data, fetched = cached
+            return {
+                "url": weather_values_url,
+                "data": data,
+                "fetched": datetime.fromtimestamp(fetched, timezone.utc).isoformat()
+            }
 
-                date = station_data.get('fecha', 'no_data')
+        # Primera petición para obtener URL de los datos
+        response = api_request(weather_values_url)
 
-                station_info["date"][date] = {
-                    date: format_historical_weather_data(station_data)
-                }
+        if not response or response.get('estado') != 200:
+            error_msg = response.get('descripcion', 'Error desconocido') if response else 'Respuesta vacía'
+            logger.error(f"Error en la API: {error_msg}")
+            return None
 
-                grouped_stations.append(station_info)
+        data_url = response.get('datos')
 
-            logger.info(f"✅ Información del url {i} extraída correctamente")
-            new_last_request_time = datetime.now(timezone.utc).isoformat()
+        if not data_url:
+            logger.error("No se encontró URL de datos en la respuesta")
+            return None
 
-        return (grouped_stations if grouped_stations else None), new_last_request_time
+        return {"url": weather_values_url, "datos": data_url}
 
-    except RetryError as e:
-        logger.error(f"Fallo después de múltiples intentos: {str(e)}")
-        fetched_date = datetime.now(timezone.utc).isoformat()
-        build_journal(
-            name="errors",
-            codes_group=current_url if current_url else "URL no disponible",
-            server_response=str(e),
-            fetched_url=data_url if data_url else "URL no disponible",
-            fetched_date=fetched_date
-        )
-        return None, new_last_request_time
-    
     except Exception as e:
-        logger.error(f"Error inesperado en fetch_error_data: {str(e)}", exc_info=True)
-        fetched_date = datetime.now(timezone.utc).isoformat()
-        build_journal(
-            name="errors",
-            codes_group=current_url if current_url else "URL no disponible",
-            server_response=str(e),
-            fetched_url=data_url if data_url else "URL no disponible",
-            fetched_date=fetched_date
-        )
-        return None, new_last_request_time
+        logger.error(f"Error inesperado en fetch_prediction_metadata: {str(e)}", exc_info=True)
+        return _prediction_failure(town_code, str(e), "URL no disponible", journal)
 
-@api_retry
-def fetch_prediction_station_data(town_code, last_request_time=None):
-    '''Obtiene los datos de predicción meteorológica para un municipio específico.'''
-    new_last_request_time = last_request_time
-    response = {}
+def download_prediction_data(town_code, metadata, journal=True):
+    '''Segundo paso: descarga la carga de 'datos' y la guarda en la caché. None si falla'''
+    if metadata.get('data') is not None:
+        return metadata['data']
 
+    data_url = metadata['datos']
     try:
-        # Control de tasa global (1 petición por segundo como mínimo)
-        if last_request_time is None:
-            last_request_time = datetime.now(timezone.utc).isoformat()
-        else:
-            last_request_time = global_rate(last_request_time)
+        # Segunda petición para los datos reales
+        data = api_request(data_url, keyed=False)
+    except Exception as e:
+        logger.error(f"Error inesperado en download_prediction_data: {str(e)}", exc_info=True)
+        return _prediction_failure(town_code, str(e), data_url, journal)
 
-        # Verificar la API_KEY
-        api_key = os.getenv("AEMET_API_KEY")
-        if not api_key:
-            logger.error("API key no configurada")
-            return None, new_last_request_time
-        
-        headers = {
-            'accept': 'application/json',
-            'api_key': api_key,
-            'cache-control': 'no-cache'
-        }
+    if not data or not isinstance(data, list) or len(data) == 0:
+        logger.error("Datos de predicción no disponibles o formato incorrecto")
+        return _prediction_failure(town_code, data, data_url, journal)
 
-        # Primera petición para obtener URL de los datos
-        weather_values_url = build_url(town_code=town_code)
-        response = api_request(weather_values_url, headers=headers)
-        
-        if not response or response.get('estado') != 200:
-            error_msg = response.get('descripcion', 'Error desconocido') if response else 'Respuesta vacía'
-            logger.error(f"Error en la API: {error_msg}")
-            return None, new_last_request_time
-        
-        data_url = response.get('datos')
+    cache_put(metadata['url'], data)
+    return data
 
-        if not data_url:
-            logger.error("No se encontró URL de datos en la respuesta")
-            return None, new_last_request_time
-            
-        # Segunda petición para los datos reales
-        data = api_request(data_url)
-        
-        if not data or not isinstance(data, list) or len(data) == 0:
-            logger.error("Datos de predicción no disponibles o formato incorrecto")
-            build_journal(name="prediction_error",codes_group=town_code,server_response=data,fetched_date=last_request_time)
-            return None, new_last_request_time
-        
-        # Procesar datos de predicción
+def parse_prediction_data(town_code, data, fetched_url="URL no disponible", journal=True, fetched=None):
+    '''
+    Convierte la carga de 'datos' en el registro del municipio que se guarda en prediction_data.json.
+    fetched es el momento (ISO) en que se descargó la carga si viene de la caché; por defecto, ahora.
+    '''
+    try:
         station_info = {
             "id": data[0].get("id", "no_data"),
             "town": data[0].get('nombre', 'no_data'),
             "province": data[0].get('provincia', 'no_data'),
             "elaborated": data[0].get('elaborado', 'no_data'),
-            "fetched": datetime.now(timezone.utc).isoformat(),
+            "fetched": fetched or datetime.now(timezone.utc).isoformat(),
             "prediction": {}
         }
 
@@ -375,27 +343,26 @@ def fetch_prediction_station_data(town_code, last_request_time=None):
             station_info["prediction"][f"day_{i}"] = {
                 fecha: format_prediction_weather_data(day)
             }
-        
-        return station_info, datetime.now(timezone.utc).isoformat()
-    
-    except RetryError as e:
-        logger.error(f"Fallo después de múltiples intentos: {str(e)}")
-        build_journal(
-            name="error_prediction",
-            codes_group=town_code,
-            server_response=str(e),
-            fetched_url=data_url if 'data_url' in locals() else "URL no disponible",
-            fetched_date=datetime.now(timezone.utc).isoformat()
-        )
-        return None, new_last_request_time
-    
+
+        return station_info
+
     except Exception as e:
-        logger.error(f"Error inesperado en fetch_prediction_station_data: {str(e)}", exc_info=True)
-        build_journal(
-            name="error_prediction",
-            codes_group=town_code,
-            server_response=str(e),
-            fetched_url=data_url if 'data_url' in locals() else "URL no disponible",
-            fetched_date=datetime.now(timezone.utc).isoformat()
-        )
-        return None, new_last_request_time
\ No newline at end of file
+        logger.error(f"Error inesperado en parse_prediction_data: {str(e)}", exc_info=True)
+        return _prediction_failure(town_code, str(e), fetched_url, journal)
+
+def fetch_prediction_station_data(town_code, journal=True):
+    '''
+    Obtiene los datos de predicción meteorológica para un municipio específico (los dos pasos seguidos).
+    Con journal=False los fallos no se registran en error_prediction.jsonl (recuperación desde el journal).
+    '''
+    metadata = fetch_prediction_metadata(town_code, journal=journal)
+    if metadata is None:
+        return None
+
+    data = download_prediction_data(town_code, metadata, journal=journal)
+    if data is None:
+        return None
+
+    return parse_prediction_data(
+        town_code, data, metadata.get('datos', metadata['url']), journal=journal, fetched=metadata.get('fetched')
+    )
@@ -0,0 +1,61 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from .http_cache import next_forecast_time
+from .prediction_store import town_key
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Si ya se pidió después de la hora prevista y la AEMET aún no había publicado, esperar esto antes de repetir
+FORECAST_RECHECK_MINUTES = float(os.getenv("AEMET_FORECAST_RECHECK_MINUTES", 60))
+
+
+def _parse_fetched(fetched):
+    try:
+        moment = datetime.fromisoformat(str(fetched))
+    except ValueError:
+        return None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def town_refresh_due(town_data):
+    '''
+    Momento (UTC) a partir del cual puede haber una predicción más nueva que la guardada:
+    'elaborated' + FORECAST_CADENCE_HOURS. Si ya se pidió ('fetched') después de ese momento y la AEMET
+    seguía sin publicar, se vuelve a comprobar FORECAST_RECHECK_MINUTES después de esa petición.
+    Devuelve None si no hay datos válidos (hay que pedir el municipio).
+    '''
+    expected = next_forecast_time(town_data.get('elaborated')) if town_data else None
+    if expected is None:
+        return None
+    fetched = _parse_fetched(town_data.get('fetched'))
+    if fetched is not None and fetched >= expected:
+        return fetched + timedelta(minutes=FORECAST_RECHECK_MINUTES)
+    return expected
+
+
+def stale_towns(towns_codes, existing_data_dict, now=None):
+    '''
+    Selecciona los municipios cuya predicción puede haber cambiado desde la última descarga.
+    Devuelve {código: nombre} ordenado del más atrasado al menos: primero los que no tienen datos
+    y después por el tiempo transcurrido desde que debía haber una predicción nueva.
+    '''
+    now = now or datetime.now(timezone.utc)
+    overdue = []
+    for code, name in towns_codes.items():
+        due = town_refresh_due(existing_data_dict.get(town_key(code)))
+        seconds = float('inf') if due is None else (now - due).total_seconds()
+        if seconds >= 0:
+            overdue.append((seconds, code, name))
+
+    overdue.sort(key=lambda item: item[0], reverse=True)
+    logger.info(f"🔄 {len(overdue)}/{len(towns_codes)} municipios con una predicción posiblemente nueva")
+    return {code: name for _, code, name in overdue}
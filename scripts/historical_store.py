@@ -0,0 +1,265 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from dotenv import load_dotenv
+from .progress_index import mark_done, sync_index, clear_index, stamp_index
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Almacenamiento por defecto de los datos históricos: "json" (weather_data.json) o "sqlite" (weather_data.db)
+HISTORICAL_STORAGE = os.getenv("AEMET_HISTORICAL_STORAGE", "json")
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+WEATHER_DATA_PATH = os.path.join(_api_dir, 'json', 'weather_data.json')
+WEATHER_DB_PATH = os.path.join(_api_dir, 'json', 'weather_data.db')
+
+
+class JSONHistoricalStore:
+    '''
+    Almacenamiento en weather_data.json: todo el diccionario en memoria y volcado completo en cada commit.
+    Se comporta como el diccionario {indicativo: estación} para la generación de los csv.
+    '''
+    def __init__(self, path=WEATHER_DATA_PATH, fresh=False, must_exist=False):
+        self.path = path
+        self.data = {}
+        self._lock = threading.RLock()
+
+        if os.path.exists(path) and not fresh:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        elif must_exist:
+            raise ValueError("No esta creado weather_data.json")
+
+    def __contains__(self, station_code):
+        return station_code in self.data
+
+    def __getitem__(self, station_code):
+        return self.data[station_code]
+
+    def station_codes(self):
+        '''Devuelve el conjunto de indicativos almacenados'''
+        return set(self.data.keys())
+
+    def station_dates(self, station_code):
+        '''Devuelve el conjunto de fechas almacenadas para una estación'''
+        return set(self.data.get(station_code, {}).get('date', {}).keys())
+
+    def station_last_date(self, station_code):
+        '''Devuelve la última fecha almacenada para una estación (None si no tiene datos)'''
+        dates = self.data.get(station_code, {}).get('date', {})
+        return max(dates) if dates else None
+
+    def merge_station(self, station_data, now, overwrite=False):
+        '''
+        Incorpora los datos de una estación. Con overwrite=False solo añade fechas nuevas;
+        con overwrite=True actualiza también las existentes conservando su ts_insert.
+        Devuelve el número de fechas escritas.
+        '''
+        station_code = station_data.get('town_code')
+        with self._lock:
+            station = self.data.get(station_code)
+            stored_dates = station['date'] if station else {}
+
+            new_data = {}
+            for date, values in station_data.get('date', {}).items():
+                if date in stored_dates and not overwrite:
+                    continue
+                new_data[date] = {
+                    'values': values,
+                    'ts_insert': stored_dates.get(date, {}).get('ts_insert', now),
+                    'ts_update': now
+                }
+
+            if not new_data:
+                return 0
+
+            if station is None:
+                station = self.data[station_code] = {
+                    "town_code": station_code,
+                    "province": station_data.get("province", ""),
+                    "town": station_data.get("town", ""),
+                    "date": {}
+                }
+            station['date'].update(new_data)
+            return len(new_data)
+
+    def commit(self):
+        '''Vuelca el diccionario completo en weather_data.json y actualiza su índice de progreso'''
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=4)
+            # Con el diccionario completo en memoria el índice weather_data.json.idx queda exacto
+            sync_index(self.path, self.data.keys())
+
+    def close(self):
+        pass
+
+
+class SQLiteHistoricalStore:
+    '''
+    Almacenamiento en SQLite con una fila por (indicativo, fecha).
+    Cada commit solo escribe las filas modificadas y las lecturas usan la clave primaria como índice.
+    Con fresh=True empieza vacío como weather_data.json: las filas anteriores se borran en el primer commit.
+    '''
+    def __init__(self, path=WEATHER_DB_PATH, fresh=False, must_exist=False):
+        if must_exist and not os.path.exists(path):
+            raise ValueError("No esta creado weather_data.db")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fresh or not os.path.exists(path):
+            # Base de datos nueva: un índice de progreso anterior ya no corresponde a ella
+            clear_index(path)
+        self.path = path
+        self._lock = threading.RLock()
+        # Estaciones escritas desde el último commit (para el índice de progreso weather_data.db.idx)
+        self._merged_codes = set()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS stations (
+                indicativo TEXT PRIMARY KEY,
+                province   TEXT,
+                town       TEXT
+            );
+            CREATE TABLE IF NOT EXISTS observations (
+                indicativo TEXT NOT NULL,
+                fecha      TEXT NOT NULL,
+                "values"   TEXT NOT NULL,
+                ts_insert  TEXT NOT NULL,
+                ts_update  TEXT NOT NULL,
+                PRIMARY KEY (indicativo, fecha)
+            ) WITHOUT ROWID;
+        """)
+        self.conn.commit()
+        if fresh:
+            # Sin commit: si la ejecución falla antes de guardar nada, la base de datos anterior se conserva
+            self.conn.execute("DELETE FROM observations")
+            self.conn.execute("DELETE FROM stations")
+
+    def __contains__(self, station_code):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM observations WHERE indicativo = ? LIMIT 1", (station_code,)
+            ).fetchone()
+        return row is not None
+
+    def __getitem__(self, station_code):
+        '''Devuelve la estación con el mismo formato que weather_data.json'''
+        with self._lock:
+            station = self.conn.execute(
+                "SELECT province, town FROM stations WHERE indicativo = ?", (station_code,)
+            ).fetchone()
+            if station is None:
+                raise KeyError(station_code)
+            rows = self.conn.execute(
+                'SELECT fecha, "values", ts_insert, ts_update FROM observations '
+                'WHERE indicativo = ? ORDER BY fecha', (station_code,)
+            ).fetchall()
+
+        return {
+            "town_code": station_code,
+            "province": station[0],
+            "town": station[1],
+            "date": {
+                fecha: {
+                    'values': {fecha: json.loads(values)},
+                    'ts_insert': ts_insert,
+                    'ts_update': ts_update
+                }
+                for fecha, values, ts_insert, ts_update in rows
+            }
+        }
+
+    def station_codes(self):
+        '''Devuelve el conjunto de indicativos con datos almacenados'''
+        with self._lock:
+            rows = self.conn.execute("SELECT DISTINCT indicativo FROM observations").fetchall()
+        return {row[0] for row in rows}
+
+    def station_dates(self, station_code):
+        '''Devuelve el conjunto de fechas almacenadas para una estación'''
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT fecha FROM observations WHERE indicativo = ?", (station_code,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def station_last_date(self, station_code):
+        '''Devuelve la última fecha almacenada para una estación (None si no tiene datos)'''
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT MAX(fecha) FROM observations WHERE indicativo = ?", (station_code,)
+            ).fetchone()
+        return row[0]
+
+    def merge_station(self, station_data, now, overwrite=False):
+        '''
+        Upsert de las fechas de una estación por (indicativo, fecha).
+        ts_insert se conserva en los conflictos; ts_update se actualiza solo si se sobrescribe.
+        Devuelve el número de filas escritas.
+        '''
+        station_code = station_data.get('town_code')
+        rows = [
+            (station_code, date, json.dumps(values.get(date, values), ensure_ascii=False), now, now)
+            for date, values in station_data.get('date', {}).items()
+        ]
+        if not rows:
+            return 0
+
+        if overwrite:
+            on_conflict = 'DO UPDATE SET "values" = excluded."values", ts_update = excluded.ts_update'
+        else:
+            on_conflict = 'DO NOTHING'
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO stations (indicativo, province, town) VALUES (?, ?, ?) "
+                "ON CONFLICT(indicativo) DO UPDATE SET province = excluded.province, town = excluded.town",
+                (station_code, station_data.get("province", ""), station_data.get("town", ""))
+            )
+            before = self.conn.total_changes
+            self.conn.executemany(
+                f'INSERT INTO observations (indicativo, fecha, "values", ts_insert, ts_update) '
+                f'VALUES (?, ?, ?, ?, ?) ON CONFLICT(indicativo, fecha) {on_conflict}',
+                rows
+            )
+            self._merged_codes.add(station_code)
+            return self.conn.total_changes - before
+
+    def commit(self):
+        '''Confirma la transacción: solo se escriben las filas tocadas desde el último commit'''
+        with self._lock:
+            self.conn.commit()
+            mark_done(self.path, self._merged_codes, all_keys=self.station_codes)
+            self._merged_codes = set()
+
+    def close(self):
+        with self._lock:
+            self.commit()
+            self.conn.close()
+            # Al cerrar, SQLite vuelca el WAL en weather_data.db: el índice se sella con el archivo definitivo
+            stamp_index(self.path)
+
+
+def open_historical_store(storage=HISTORICAL_STORAGE, fresh=False, must_exist=False):
+    '''
+    Abre el almacenamiento de datos históricos.
+    fresh=True empieza con el almacenamiento vacío (ts_insert vuelve a ser la fecha de esta ejecución).
+    '''
+    if storage == "sqlite":
+        return SQLiteHistoricalStore(fresh=fresh, must_exist=must_exist)
+    if storage == "json":
+        return JSONHistoricalStore(fresh=fresh, must_exist=must_exist)
+    raise ValueError(f"Almacenamiento desconocido: {storage}")
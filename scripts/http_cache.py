@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, date, timedelta, timezone
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Configuración de la caché de respuestas (se puede sobreescribir desde el .env)
+CACHE_ENABLED = os.getenv("AEMET_CACHE", "false").lower() == "true"
+CACHE_MAX_BYTES = int(float(os.getenv("AEMET_CACHE_MAX_MB", 512)) * 1024 * 1024)
+CACHE_TTL_INVENTORY_DAYS = float(os.getenv("AEMET_CACHE_TTL_INVENTORY_DAYS", 7))
+CACHE_TTL_OPEN_HOURS = float(os.getenv("AEMET_CACHE_TTL_OPEN_HOURS", 1))   # históricos con días aún sin cerrar
+HISTORICAL_CLOSED_AFTER_DAYS = int(os.getenv("AEMET_HISTORICAL_CLOSED_AFTER_DAYS", 4))
+FORECAST_CADENCE_HOURS = float(os.getenv("AEMET_FORECAST_CADENCE_HOURS", 6))  # cada cuánto publica la AEMET
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+CACHE_DIR = os.path.join(_api_dir, 'cache')
+# Cada cuántas escrituras se buscan entradas caducadas (el límite de tamaño se comprueba en todas)
+EVICT_EVERY = 100
+
+_FECHAFIN_PATTERN = re.compile(r'/fechafin/(\d{4}-\d{2}-\d{2})')
+
+
+def _madrid_offset(moment):
+    '''Desfase de la hora peninsular (la de 'elaborado') respecto a UTC'''
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo("Europe/Madrid").utcoffset(moment)
+    except Exception:
+        # Sin base de datos de zonas horarias (p.ej. Windows sin tzdata): se asume el horario de verano
+        return timedelta(hours=2)
+
+
+def parse_elaborado(elaborado):
+    '''Convierte 'elaborado' de la AEMET (hora peninsular sin zona, "2025-04-10T08:51:07") a UTC'''
+    try:
+        local = datetime.fromisoformat(str(elaborado))
+    except ValueError:
+        return None
+    if local.tzinfo is not None:
+        return local.astimezone(timezone.utc)
+    return (local - _madrid_offset(local)).replace(tzinfo=timezone.utc)
+
+
+def next_forecast_time(elaborado):
+    '''Momento (UTC) a partir del cual puede haber una predicción más nueva que la elaborada en `elaborado`'''
+    elaborated = parse_elaborado(elaborado)
+    if elaborated is None:
+        return None
+    return elaborated + timedelta(hours=FORECAST_CADENCE_HOURS)
+
+
+def cache_expiry(url, payload, now=None):
+    '''
+    Caducidad (epoch) de una respuesta según el endpoint, None si no caduca nunca y 0 si no se guarda:
+    - inventario de estaciones: CACHE_TTL_INVENTORY_DAYS días
+    - predicción por municipio: hasta el siguiente 'elaborado' (elaborado + FORECAST_CADENCE_HOURS)
+    - valores diarios: para siempre si todos los días están cerrados, CACHE_TTL_OPEN_HOURS si no
+    '''
+    now = now or time.time()
+
+    if 'inventarioestaciones' in url:
+        return now + CACHE_TTL_INVENTORY_DAYS * 86400
+
+    if 'prediccion/especifica/municipio' in url:
+        elaborado = payload[0].get('elaborado') if isinstance(payload, list) and payload else None
+        next_time = next_forecast_time(elaborado) if elaborado else None
+        return next_time.timestamp() if next_time else 0
+
+    if 'valores/climatologicos/diarios' in url:
+        match = _FECHAFIN_PATTERN.search(url.replace('%3A', ':'))
+        if match:
+            closed_until = date.today() - timedelta(days=HISTORICAL_CLOSED_AFTER_DAYS)
+            if date.fromisoformat(match.group(1)) <= closed_until:
+                return None
+        return now + CACHE_TTL_OPEN_HOURS * 3600
+
+    return 0
+
+
+class ResponseCache:
+    '''
+    Caché en disco de las respuestas de la AEMET, indexada por la URL de la petición de metadatos.
+    El contenido se guarda por su hash (blobs/<sha256>.json, compartido si dos URL devuelven lo mismo)
+    y el índice SQLite guarda cuándo se descargó, la caducidad y el último acceso para el desalojo LRU.
+    '''
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.blobs_dir = os.path.join(cache_dir, 'blobs')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.RLock()
+
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url_hash    TEXT PRIMARY KEY,
+                url         TEXT NOT NULL,
+                blob        TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                expires     REAL,
+                last_access REAL NOT NULL,
+                fetched     REAL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+        """)
+        # Índices creados antes de guardar el momento de la descarga
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+        if 'fetched' not in columns:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN fetched REAL")
+        self.conn.commit()
+        # Tamaño total llevado en memoria: así no hay que sumar el índice en cada escritura
+        self._total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def _url_hash(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _blob_path(self, blob):
+        return os.path.join(self.blobs_dir, f'{blob}.json')
+
+    def get(self, url):
+        '''Devuelve la respuesta guardada para url si sigue vigente, o None'''
+        entry = self.get_entry(url)
+        return entry[0] if entry else None
+
+    def get_entry(self, url):
+        '''
+        Devuelve (respuesta, descargada) si la respuesta de url sigue vigente, o None.
+        'descargada' es el epoch en que se obtuvo de la API (None en entradas anteriores a guardarlo).
+        '''
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT blob, expires, fetched FROM entries WHERE url_hash = ?", (self._url_hash(url),)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+            try:
+                with open(self._blob_path(row[0]), 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.conn.execute("DELETE FROM entries WHERE url_hash = ?", (self._url_hash(url),))
+                self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute(
+                "UPDATE entries SET last_access = ? WHERE url_hash = ?", (now, self._url_hash(url))
+            )
+            self.conn.commit()
+            self.hits += 1
+            return payload, row[2]
+
+    def put(self, url, payload, fetched=None):
+        '''
+        Guarda la respuesta de url con la caducidad de su endpoint (no guarda las que no se cachean).
+        fetched es el epoch en que se descargó (por defecto, ahora).
+        '''
+        now = time.time()
+        fetched = fetched or now
+        expires = cache_expiry(url, payload, now)
+        if expires == 0:
+            return False
+
+        content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        blob = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            blob_path = self._blob_path(blob)
+            if not os.path.exists(blob_path):
+                tmp_path = blob_path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, blob_path)
+
+            previous = self.conn.execute(
+                "SELECT blob, size FROM entries WHERE url_hash = ?", (self._url_hash(url),)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT INTO entries (url_hash, url, blob, size, expires, last_access, fetched) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url_hash) DO UPDATE SET blob = excluded.blob, size = excluded.size, "
+                "expires = excluded.expires, last_access = excluded.last_access, fetched = excluded.fetched",
+                (self._url_hash(url), url, blob, len(content), expires, now, fetched)
+            )
+            if previous and previous[0] != blob:
+                self._drop_blob_if_unused(previous[0])
+            self.conn.commit()
+            self.stores += 1
+            self._puts += 1
+            self._total += len(content) - (previous[1] if previous else 0)
+            # El índice solo se recorre al pasar del límite o, para las caducadas, cada EVICT_EVERY escrituras
+            if self._total > self.max_bytes or self._puts % EVICT_EVERY == 0:
+                self._evict()
+            return True
+
+    def _drop_blob_if_unused(self, blob):
+        in_use = self.conn.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (blob,)).fetchone()
+        if not in_use and os.path.exists(self._blob_path(blob)):
+            os.remove(self._blob_path(blob))
+
+    def _evict(self):
+        '''Elimina las entradas caducadas y, si se supera max_bytes, las de acceso más antiguo (LRU)'''
+        now = time.time()
+        victims = {
+            url_hash: (blob, size) for url_hash, blob, size in self.conn.execute(
+                "SELECT url_hash, blob, size FROM entries WHERE expires IS NOT NULL AND expires <= ?", (now,)
+            )
+        }
+        total = self._total - sum(size for _, size in victims.values())
+        if total > self.max_bytes:
+            # Se recorre el índice por antigüedad solo hasta liberar lo necesario
+            for url_hash, blob, size in self.conn.execute(
+                "SELECT url_hash, blob, size FROM entries ORDER BY last_access"
+            ):
+                if total <= self.max_bytes:
+                    break
+                if url_hash not in victims:
+                    victims[url_hash] = (blob, size)
+                    total -= size
+
+        if not victims:
+            return
+        self.conn.executemany("DELETE FROM entries WHERE url_hash = ?", [(url_hash,) for url_hash in victims])
+        for blob in {blob for blob, _ in victims.values()}:
+            self._drop_blob_if_unused(blob)
+        self.conn.commit()
+        self.evictions += len(victims)
+        self._total = total
+
+    def stats(self):
+        '''Aciertos, fallos, entradas guardadas y desalojadas, y tamaño actual de la caché'''
+        with self._lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size
+        }
+
+    def clear(self):
+        '''Vacía la caché'''
+        with self._lock:
+            blobs = [row[0] for row in self.conn.execute("SELECT DISTINCT blob FROM entries").fetchall()]
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+            self._total = 0
+            for blob in blobs:
+                if os.path.exists(self._blob_path(blob)):
+                    os.remove(self._blob_path(blob))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    '''Devuelve la caché compartida (None si está desactivada con AEMET_CACHE=false)'''
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def cache_get(url):
+    '''Respuesta vigente guardada para la petición url, o None (también con la caché desactivada)'''
+    cache = get_response_cache()
+    return cache.get(url) if cache else None
+
+
+def cache_get_entry(url):
+    '''(respuesta, epoch de la descarga) vigente guardada para la petición url, o None'''
+    cache = get_response_cache()
+    return cache.get_entry(url) if cache else None
+
+
+def cache_put(url, payload, fetched=None):
+    '''Guarda en la caché la respuesta final (los 'datos') de la petición url, descargada en fetched (epoch)'''
+    cache = get_response_cache()
+    if cache:
+        cache.put(url, payload, fetched)
+
+
+def log_cache_stats():
+    '''Muestra en el log las estadísticas de la caché de respuestas'''
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    stats = cache.stats()
+    if stats['hits'] or stats['misses']:
+        logger.info(
+            f"🗄️ Caché: {stats['hits']} aciertos / {stats['misses']} fallos ({stats['hit_ratio']:.0%}) | "
+            f"{stats['entries']} entradas, {stats['bytes'] / 1024 / 1024:.1f} MB | Desalojadas: {stats['evictions']}"
+        )
+    return stats
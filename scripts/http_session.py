@@ -0,0 +1,188 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from .key_pool import get_key_pool, configure_key_pool, log_key_pool_stats, RATE_LIMIT_WAIT
+from .rate_limiter import DATOS_RATE_LIMITED
+from .rate_control import parse_retry_after
+from .tenacity_config import is_rate_limit_error, get_circuit_breaker, get_retry_budget, log_retry_stats
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Configuración del pool de conexiones (se puede sobreescribir desde el .env)
+POOL_CONNECTIONS = int(os.getenv("AEMET_POOL_CONNECTIONS", 4))  # nº de hosts distintos en caché
+POOL_MAXSIZE = int(os.getenv("AEMET_POOL_MAXSIZE", 16))         # conexiones keep-alive por host
+POOL_BLOCK = os.getenv("AEMET_POOL_BLOCK", "false").lower() == "true"
+# Raíz de la API (se puede apuntar a un servidor local, p.ej. benchmarks/mock_aemet.py)
+AEMET_BASE_URL = os.getenv("AEMET_BASE_URL", "https://opendata.aemet.es/opendata/api").rstrip('/')
+
+_session = None
+_session_lock = threading.Lock()
+_request_count = 0
+
+
+def build_headers():
+    '''
+    Construye los headers comunes de la API de la AEMET.
+    No incluyen la clave: session_get pone en cada petición la que entrega el pool (y las descargas de 'datos' no la llevan).
+    '''
+    return {
+        'accept': 'application/json',
+        'cache-control': 'no-cache'
+    }
+
+
+def api_key_configured():
+    '''Indica si hay al menos una clave de la AEMET configurada (AEMET_API_KEYS o AEMET_API_KEY)'''
+    return len(get_key_pool()) > 0
+
+
+def configure_session(pool_connections=None, pool_maxsize=None, pool_block=None, api_key=None):
+    '''
+    Crea (o recrea) la sesión compartida con el tamaño de pool indicado.
+    Los headers comunes se construyen una sola vez aquí; con api_key el pool de claves queda solo con esa clave.
+    '''
+    global _session, _request_count
+    if api_key is not None:
+        configure_key_pool([api_key] if api_key else [])
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or POOL_MAXSIZE,
+            pool_block=POOL_BLOCK if pool_block is None else pool_block,
+            max_retries=0  # Los reintentos los gestiona tenacity (api_retry)
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(build_headers())
+
+        _session = session
+        _request_count = 0
+        return _session
+
+
+def get_session():
+    '''Devuelve la sesión HTTP compartida (keep-alive), creándola si no existe'''
+    if _session is None:
+        configure_session()
+    return _session
+
+
+def session_get(url, headers=None, timeout=(10, 30), keyed=True):
+    '''
+    Realiza un GET reutilizando las conexiones del pool compartido.
+    La petición sale con la clave menos cargada del pool (respetando su limitador);
+    si la AEMET responde 429 esa clave queda en pausa (Retry-After o AEMET_RATE_LIMIT_WAIT)
+    y las siguientes peticiones usan las demás.
+    Con AEMET_RATE_AUTOTUNE cada resultado alimenta el control AIMD de la clave usada.
+    Los 5xx y los fallos de red cuentan para el circuito: si está abierto la petición espera a que se cierre.
+    Con keyed=False (descargas de 'datos') la petición sale sin clave y no cuenta para ninguna;
+    con AEMET_DATOS_RATE_LIMITED espera en el limitador propio de las descargas del pool.
+    '''
+    global _request_count
+    session = get_session()
+    breaker = get_circuit_breaker()
+    breaker.wait()
+    if not keyed:
+        if DATOS_RATE_LIMITED:
+            get_key_pool().acquire_keyless()
+        with _session_lock:
+            _request_count += 1
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except Exception:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    pool = get_key_pool()
+    api_key = pool.acquire()
+    with _session_lock:
+        _request_count += 1
+
+    # La clave va solo en esta petición: así cuenta en el limitador y la pausa por 429 de la clave que la envía
+    request_headers = dict(headers or {})
+    if api_key is not None:
+        request_headers['api_key'] = api_key.key
+    try:
+        response = session.get(url, headers=request_headers, timeout=timeout)
+    except Exception as e:
+        pool.release(api_key, outcome="timeout" if isinstance(e, requests.Timeout) else None)
+        breaker.record_failure()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    if is_rate_limit_error(response):
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        pool.release(api_key, outcome="rate_limited", cooldown=RATE_LIMIT_WAIT if retry_after is None else retry_after)
+    else:
+        pool.release(api_key, outcome="success" if response.status_code < 400 else None)
+    return response
+
+
+def session_stats():
+    '''
+    Devuelve estadísticas de reutilización de conexiones del pool:
+    peticiones realizadas, conexiones abiertas (handshakes TCP/TLS) y conexiones reutilizadas.
+    '''
+    new_connections = 0
+    pool_requests = 0
+
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            with pools.lock:
+                connection_pools = list(pools._container.values())
+            for pool in connection_pools:
+                new_connections += pool.num_connections
+                pool_requests += pool.num_requests
+
+    reused = max(pool_requests - new_connections, 0)
+    return {
+        "requests": _request_count,
+        "new_connections": new_connections,
+        "reused_connections": reused,
+        "reuse_ratio": round(reused / pool_requests, 3) if pool_requests else 0.0
+    }
+
+
+def log_session_stats():
+    '''Muestra en el log las estadísticas de reutilización de conexiones, de las claves y de los reintentos'''
+    stats = session_stats()
+    logger.info(
+        f"🔌 Peticiones: {stats['requests']} | Handshakes: {stats['new_connections']} | "
+        f"Conexiones reutilizadas: {stats['reused_connections']} ({stats['reuse_ratio']:.0%})"
+    )
+    log_key_pool_stats()
+    log_retry_stats()
+    return stats
+
+
+def finish_run():
+    '''
+    Cierre de una ejecución: guarda en json/rate_state.json la tasa aprendida por cada clave
+    y reinicia el presupuesto de reintentos para la siguiente (las estadísticas se registran antes con log_session_stats).
+    '''
+    get_key_pool().save_rates()
+    get_retry_budget().reset()
@@ -0,0 +1,83 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from .error_journal import iter_journal, journal_size, entry_key, remove_journal_entries
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Entradas del journal en vuelo a la vez (la cuota de la AEMET la respeta el limitador global)
+REPLAY_CONCURRENCY = int(os.getenv("AEMET_REPLAY_CONCURRENCY", 4))
+
+
+def replay_journal(name, entry_target, worker, on_result, concurrency=REPLAY_CONCURRENCY):
+    """
+    Repite en paralelo las peticiones registradas en error_journal/<name>.jsonl.
+
+    Las entradas que apuntan al mismo objetivo (URL o municipio) se piden una sola vez.
+    Cada objetivo es independiente: un fallo no reinicia los demás y su entrada se queda en el journal.
+    Al terminar solo se eliminan del journal las entradas recuperadas.
+
+    Args:
+        name: Nombre del journal ("errors" o "error_prediction")
+        entry_target: Función que recibe una entrada y devuelve lo que hay que pedir (o None si no se puede)
+        worker: Función bloqueante que recibe un objetivo y devuelve su resultado (None si falla)
+        on_result: Función que recibe (objetivo, resultado); se ejecuta en el hilo llamador
+        concurrency: Número máximo de objetivos en vuelo
+
+    Returns:
+        Resumen {entries, targets, recovered, failed, skipped}
+    """
+    # Solo lo escrito hasta ahora: los errores que se registren durante la recuperación quedan para otra pasada
+    journal_end = journal_size(name)
+    targets = {}
+    entries = skipped = 0
+
+    for entry in iter_journal(name, end_offset=journal_end):
+        entries += 1
+        target = entry_target(entry)
+        if target is None:
+            skipped += 1
+            continue
+        targets.setdefault(target, []).append(entry_key(entry))
+
+    logger.info(f"📋 {entries} entradas en {name}.jsonl → {len(targets)} peticiones distintas ({skipped} sin URL)")
+
+    recovered_keys = []
+    failed = 0
+
+    if targets:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(worker, target): target for target in targets}
+
+            for done, future in enumerate(as_completed(futures), 1):
+                target = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"❌ [{done}/{len(targets)}] Error al recuperar {target}: {str(e)}")
+                    result = None
+
+                if result:
+                    on_result(target, result)
+                    recovered_keys.extend(targets[target])
+                    logger.info(f"✅ [{done}/{len(targets)}] Recuperado {target}")
+                else:
+                    failed += 1
+
+    removed = remove_journal_entries(name, recovered_keys)
+    logger.info(f"🧹 {removed} entradas recuperadas eliminadas de {name}.jsonl. Siguen pendientes: {failed}")
+    return {
+        "entries": entries,
+        "targets": len(targets),
+        "recovered": len(targets) - failed,
+        "failed": failed,
+        "skipped": skipped
+    }
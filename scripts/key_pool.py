@@ -0,0 +1,244 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from .rate_limiter import TokenBucket, get_rate_limiter
+from .rate_control import (
+    RATE_AUTOTUNE, CONCURRENCY_MAX, AIMDController, key_id, load_rate_state, save_rate_state
+)
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Segundos que una clave queda en pausa tras un 429 de la AEMET (la cuota se repone cada minuto)
+RATE_LIMIT_WAIT = float(os.getenv("AEMET_RATE_LIMIT_WAIT", 61))
+
+
+def load_api_keys():
+    '''
+    Claves configuradas: AEMET_API_KEYS (separadas por comas) o, si no existe, AEMET_API_KEY.
+    Se descartan las vacías y las repetidas conservando el orden.
+    '''
+    raw = os.getenv("AEMET_API_KEYS") or os.getenv("AEMET_API_KEY", "")
+    return list(dict.fromkeys(key.strip() for key in raw.split(',') if key.strip()))
+
+
+def mask_key(key):
+    '''Versión abreviada de una clave para el log'''
+    return f"…{key[-6:]}" if len(key) > 6 else "…"
+
+
+class ApiKey:
+    '''
+    Una clave de la AEMET con su propio limitador, su pausa tras un 429 y sus estadísticas.
+    Con AEMET_RATE_AUTOTUNE tiene además su control AIMD (controller), que ajusta su limitador y sus peticiones en vuelo.
+    '''
+    def __init__(self, key, bucket, controller=None):
+        self.key = key
+        self.bucket = bucket
+        self.controller = controller
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def cooldown_remaining(self, current=None):
+        return max(0.0, self.cooldown_until - (current or time.monotonic()))
+
+    def has_capacity(self):
+        '''False si la clave ya tiene en vuelo todas las peticiones que le permite su control AIMD'''
+        return self.controller is None or self.in_flight < self.controller.concurrency_limit()
+
+
+class ApiKeyPool:
+    '''
+    Reparte las peticiones entre varias claves de la AEMET.
+    Cada petición va a la clave que antes puede atenderla (saldo de su limitador y pausa por 429),
+    y a igualdad a la que tiene menos peticiones en vuelo. Con N claves la cuota total es N veces la de una.
+    '''
+    def __init__(self, keys, autotune=RATE_AUTOTUNE):
+        # La primera clave usa el limitador global para que configure_rate_limiter y sus métricas sigan valiendo;
+        # las demás tienen uno propio con la misma tasa (AEMET_RATE_LIMIT es la cuota de cada clave)
+        limiter = get_rate_limiter()
+        saved = load_rate_state() if autotune else {}
+        self.keys = []
+        for i, key in enumerate(keys):
+            bucket = limiter if i == 0 else TokenBucket(limiter.rate, limiter.burst)
+            controller = None
+            if autotune:
+                # Cada clave arranca con lo aprendido en la ejecución anterior (o con AEMET_RATE_LIMIT)
+                state = saved.get(key_id(key), {})
+                controller = AIMDController(
+                    rate=state.get('rate', limiter.rate),
+                    concurrency=state.get('concurrency', CONCURRENCY_MAX)
+                )
+                bucket.set_rate(controller.rate)
+            self.keys.append(ApiKey(key, bucket, controller))
+        # Las descargas de 'datos' no llevan clave: con AEMET_DATOS_RATE_LIMITED esperan en este limitador,
+        # con la cuota conjunta de las claves, sin gastar los tokens de ninguna
+        slots = max(1, len(keys))
+        self.keyless = TokenBucket(limiter.rate * slots, limiter.burst * slots)
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _pick(self):
+        '''
+        Clave con menor espera (pausa por 429 + limitador) entre las que tienen hueco para otra petición;
+        None si todas están al máximo de peticiones en vuelo. Llamar con _condition adquirido
+        '''
+        current = time.monotonic()
+        candidates = [api_key for api_key in self.keys if api_key.has_capacity()]
+        if not candidates:
+            return None
+
+        def cost(api_key):
+            wait_time = api_key.cooldown_remaining(current) + api_key.bucket.available_in()
+            return (wait_time, api_key.in_flight, api_key.requests)
+        return min(candidates, key=cost)
+
+    def acquire(self):
+        '''
+        Elige clave, reserva su token y espera lo necesario (pausa y limitador).
+        Devuelve la ApiKey, que hay que devolver con release(); None si no hay claves configuradas.
+        '''
+        if not self.keys:
+            get_rate_limiter().acquire()
+            return None
+
+        with self._condition:
+            api_key = self._pick()
+            while api_key is None:
+                self._condition.wait()
+                api_key = self._pick()
+            cooldown = api_key.cooldown_remaining()
+            # Si la clave está en pausa, el token se reserva para cuando termine
+            wait_time = api_key.bucket.reserve() if not cooldown else 0.0
+            api_key.in_flight += 1
+            api_key.requests += 1
+
+        if cooldown:
+            time.sleep(cooldown)
+            wait_time = api_key.bucket.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return api_key
+
+    def acquire_keyless(self):
+        '''Espera el turno de una petición sin clave (descargas de 'datos'). Devuelve los segundos esperados'''
+        return self.keyless.acquire()
+
+    def release(self, api_key, outcome=None, cooldown=RATE_LIMIT_WAIT):
+        '''
+        Devuelve la clave tras la petición. outcome: "success", "rate_limited" (pausa de `cooldown` segundos),
+        "timeout" o None (otro resultado, no cuenta para el control AIMD).
+        '''
+        if api_key is None:
+            return
+        with self._condition:
+            api_key.in_flight -= 1
+            if outcome == "rate_limited":
+                api_key.rate_limited += 1
+                api_key.cooldown_until = max(api_key.cooldown_until, time.monotonic() + cooldown)
+                logger.warning(f"🔑 Clave {mask_key(api_key.key)} en pausa {cooldown:.0f}s por 429")
+            self._condition.notify_all()
+
+        # El control AIMD de la clave solo afecta a su propio limitador
+        controller = api_key.controller
+        if controller is None:
+            return
+        if outcome == "success":
+            api_key.bucket.set_rate(controller.on_success())
+        elif outcome in ("rate_limited", "timeout"):
+            rate = controller.on_congestion()
+            if rate is not None:
+                api_key.bucket.set_rate(rate)
+                logger.warning(
+                    f"📉 Clave {mask_key(api_key.key)} ({'429' if outcome == 'rate_limited' else 'timeout'}): "
+                    f"tasa {rate:.2f} pet/s, concurrencia {controller.concurrency_limit()}"
+                )
+
+    def rate_states(self):
+        '''Estado AIMD de cada clave ({key_id: estado}); vacío sin AEMET_RATE_AUTOTUNE'''
+        return {
+            key_id(api_key.key): api_key.controller.state()
+            for api_key in self.keys if api_key.controller is not None
+        }
+
+    def save_rates(self):
+        '''Guarda en json/rate_state.json la tasa aprendida por cada clave (solo con AEMET_RATE_AUTOTUNE)'''
+        states = self.rate_states()
+        if states:
+            save_rate_state(states)
+        return states
+
+    def retry_delay(self):
+        '''Segundos hasta que alguna clave salga de su pausa (0 si hay alguna disponible)'''
+        with self._condition:
+            if not self.keys:
+                return RATE_LIMIT_WAIT
+            current = time.monotonic()
+            return min(api_key.cooldown_remaining(current) for api_key in self.keys)
+
+    def stats(self):
+        '''Uso por clave: peticiones, 429 recibidos, en vuelo y espera en su limitador'''
+        with self._condition:
+            return [
+                {
+                    "key": mask_key(api_key.key),
+                    "requests": api_key.requests,
+                    "rate_limited": api_key.rate_limited,
+                    "in_flight": api_key.in_flight,
+                    "total_wait": api_key.bucket.stats()['total_wait'],
+                    "rate": api_key.bucket.rate
+                }
+                for api_key in self.keys
+            ]
+
+
+_pool = None
+_pool_lock = threading.RLock()
+
+
+def configure_key_pool(keys=None):
+    '''Crea (o reemplaza) el pool de claves; sin keys se leen de AEMET_API_KEYS / AEMET_API_KEY'''
+    global _pool
+    with _pool_lock:
+        _pool = ApiKeyPool(load_api_keys() if keys is None else keys)
+        return _pool
+
+
+def get_key_pool():
+    '''Devuelve el pool de claves compartido, creándolo si no existe'''
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                return configure_key_pool()
+    return _pool
+
+
+def log_key_pool_stats():
+    '''Muestra en el log el uso de cada clave (solo si hay más de una o si su tasa se ajusta con AIMD)'''
+    pool = get_key_pool()
+    keyless = pool.keyless.stats()
+    if keyless['requests']:
+        logger.info(
+            f"📦 Descargas de 'datos' limitadas: {keyless['requests']} | Espera: {keyless['total_wait']:.1f}s"
+        )
+    if len(pool) < 2 and not any(api_key.controller for api_key in pool.keys):
+        return None
+    stats = pool.stats()
+    for key_stats in stats:
+        logger.info(
+            f"🔑 Clave {key_stats['key']}: {key_stats['requests']} peticiones | "
+            f"429: {key_stats['rate_limited']} | Espera: {key_stats['total_wait']:.1f}s | Tasa: {key_stats['rate']:.2f} pet/s"
+        )
+    return stats
@@ -0,0 +1,132 @@
+import os
+import logging
+import pandas as pd
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuración de los archivos Parquet (se puede sobreescribir desde el .env)
+PARQUET_COMPRESSION = os.getenv("AEMET_PARQUET_COMPRESSION", "zstd")
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("AEMET_PARQUET_ROW_GROUP_SIZE", 100_000))
+
+HISTORICAL_TEXT_COLUMNS = ['province', 'town']
+HISTORICAL_TIMESTAMP_COLUMNS = ['ts_insert', 'ts_update']
+PREDICTION_TEXT_COLUMNS = ['town', 'province']
+
+
+def require_pyarrow():
+    '''Importa pyarrow (dependencia necesaria solo para la exportación a Parquet)'''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Para exportar a Parquet hay que instalar pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _to_date(series):
+    '''Convierte 'YYYY-MM-DD...' en fechas (date32 en Parquet)'''
+    return pd.to_datetime(series.astype('string').str[:10], format='%Y-%m-%d', errors='coerce').dt.date
+
+
+def _to_numeric_or_text(series):
+    '''Columna numérica si todos sus valores no vacíos son números; si no, texto'''
+    present = series.notna() & (series.astype('string') != '')
+    numbers = pd.to_numeric(series.where(present), errors='coerce')
+
+    if not numbers[present].notna().all():
+        return series.astype('string')
+
+    if (numbers.dropna() % 1 == 0).all():
+        return numbers.astype('Int64')
+    return numbers.astype('Float64')
+
+
+def type_historical_frame(df, keys):
+    '''
+    Aplica los tipos de columna de los datos históricos.
+    Los valores 'Ip', 'Acum' o 'no_data' quedan nulos (y en las columnas '<clave>_flag' si existen).
+    '''
+    typed = pd.DataFrame(index=df.index)
+    for column in df.columns:
+        if column == 'date':
+            typed[column] = _to_date(df[column])
+        elif column in HISTORICAL_TIMESTAMP_COLUMNS:
+            typed[column] = pd.to_datetime(df[column], utc=True, errors='coerce', format='ISO8601')
+        elif column in keys:
+            typed[column] = pd.to_numeric(df[column], errors='coerce').astype('Float64')
+        else:
+            typed[column] = df[column].astype('string')
+    return typed
+
+
+def type_prediction_frame(df):
+    '''Aplica los tipos de columna de las predicciones (fechas, números y texto)'''
+    typed = pd.DataFrame(index=df.index)
+    for column in df.columns:
+        if column == 'fetched_date' or column.endswith('_date'):
+            typed[column] = _to_date(df[column])
+        elif column in PREDICTION_TEXT_COLUMNS:
+            typed[column] = df[column].astype('string')
+        else:
+            typed[column] = _to_numeric_or_text(df[column])
+    return typed
+
+
+def write_parquet(df, path):
+    '''Escribe un DataFrame tipado en Parquet con compresión y grupos de filas'''
+    require_pyarrow()
+    df.to_parquet(
+        path,
+        engine='pyarrow',
+        compression=PARQUET_COMPRESSION,
+        index=False,
+        row_group_size=PARQUET_ROW_GROUP_SIZE
+    )
+
+
+class ParquetStreamWriter:
+    '''
+    Escritor Parquet incremental: acumula DataFrames tipados y escribe un grupo de filas
+    cada PARQUET_ROW_GROUP_SIZE filas, con el esquema del primer bloque.
+    '''
+    def __init__(self, path):
+        self.pa, self.pq = require_pyarrow()
+        self.path = path
+        self.writer = None
+        self.schema = None
+        self.pending = []
+        self.pending_rows = 0
+
+    def write(self, df):
+        self.pending.append(df)
+        self.pending_rows += len(df)
+        if self.pending_rows >= PARQUET_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        table = self.pa.Table.from_pandas(pd.concat(self.pending, ignore_index=True), preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.pq.ParquetWriter(self.path, self.schema, compression=PARQUET_COMPRESSION)
+        self.writer.write_table(table.cast(self.schema), row_group_size=PARQUET_ROW_GROUP_SIZE)
+        self.pending = []
+        self.pending_rows = 0
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,174 @@
+import os
+import time
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Configuración del pipeline en dos pasos (se puede sobreescribir desde el .env)
+# Los metadatos son pequeños y los limita la cuota; las descargas de 'datos' son grandes y las limita el ancho de banda
+PIPELINE_METADATA_CONCURRENCY = int(os.getenv("AEMET_PIPELINE_METADATA_CONCURRENCY", 4))
+PIPELINE_DOWNLOAD_CONCURRENCY = int(os.getenv("AEMET_PIPELINE_DOWNLOAD_CONCURRENCY", 8))
+PIPELINE_QUEUE_SIZE = int(os.getenv("AEMET_PIPELINE_QUEUE_SIZE", 32))   # URLs de 'datos' y cargas pendientes por etapa
+
+# Marca de fin de cola
+_DONE = object()
+
+
+class _Stage:
+    '''
+    Hilos de una etapa: leen de `source`, aplican `work` y dejan en `sink` los resultados no nulos.
+    Al terminar, el último hilo deja `consumers` marcas de fin (una por hilo de la etapa siguiente).
+    '''
+    def __init__(self, name, work, source, sink, workers, consumers, stop):
+        self.name = name
+        self.work = work
+        self.source = source
+        self.sink = sink
+        self.consumers = consumers
+        self.stop = stop
+        self.processed = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self._remaining = workers
+        self._lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"pipeline-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def _put(self, value):
+        '''Encola esperando si la cola está llena (contrapresión), salvo que el pipeline se haya detenido'''
+        while not self.stop.is_set():
+            try:
+                self.sink.put(value, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        try:
+            while not self.stop.is_set():
+                entry = self.source.get()
+                if entry is _DONE:
+                    break
+                item, value = entry
+                start = time.perf_counter()
+                try:
+                    result = self.work(item, value)
+                except Exception as e:
+                    # La etapa registra sus propios fallos (journal); aquí solo se evita que el hilo muera
+                    logger.error(f"🛑 Error inesperado en la etapa {self.name}: {str(e)}", exc_info=True)
+                    result = None
+                with self._lock:
+                    self.busy += time.perf_counter() - start
+                    if result is None:
+                        self.dropped += 1
+                    else:
+                        self.processed += 1
+                if result is not None:
+                    self._put((item, result))
+        finally:
+            # El último hilo de la etapa avisa del fin a la siguiente
+            with self._lock:
+                self._remaining -= 1
+                last = self._remaining == 0
+            if last:
+                for _ in range(self.consumers):
+                    self._put(_DONE)
+
+
+def run_pipeline(
+    items,
+    metadata_stage,
+    download_stage,
+    store_stage,
+    metadata_concurrency=PIPELINE_METADATA_CONCURRENCY,
+    download_concurrency=PIPELINE_DOWNLOAD_CONCURRENCY,
+    queue_size=PIPELINE_QUEUE_SIZE
+):
+    """
+    Procesa las peticiones en dos pasos de la AEMET como un pipeline de tres etapas:
+    metadatos (URL de 'datos') → descarga de 'datos' → procesado y guardado.
+    Mientras un elemento descarga su carga, los siguientes ya están pidiendo sus metadatos.
+
+    Args:
+        items: Lista de elementos a procesar
+        metadata_stage: Función bloqueante item -> metadatos (p.ej. la URL de 'datos'); None descarta el elemento
+        download_stage: Función bloqueante (item, metadatos) -> carga; None descarta el elemento
+        store_stage: Función (item, carga), llamada en el hilo que invoca run_pipeline según terminan las descargas
+        metadata_concurrency: Hilos pidiendo metadatos
+        download_concurrency: Hilos descargando 'datos'
+        queue_size: Elementos que pueden esperar entre etapas (contrapresión)
+
+    Returns:
+        Diccionario con los elementos procesados y descartados y el tiempo ocupado de cada etapa
+    """
+    items = list(items)
+    if not items:
+        return None
+
+    stop = threading.Event()
+    pending = queue.Queue()
+    metadata_queue = queue.Queue(maxsize=max(1, queue_size))
+    payload_queue = queue.Queue(maxsize=max(1, queue_size))
+
+    metadata_concurrency = max(1, metadata_concurrency)
+    download_concurrency = max(1, download_concurrency)
+    for item in items:
+        pending.put((item, None))
+    for _ in range(metadata_concurrency):
+        pending.put(_DONE)
+
+    metadata = _Stage(
+        "metadatos", lambda item, _: metadata_stage(item),
+        pending, metadata_queue, metadata_concurrency, download_concurrency, stop
+    )
+    download = _Stage("descarga", download_stage, metadata_queue, payload_queue, download_concurrency, 1, stop)
+
+    stored = 0
+    failed = 0
+    start = time.perf_counter()
+    metadata.start()
+    download.start()
+    try:
+        while True:
+            entry = payload_queue.get()
+            if entry is _DONE:
+                break
+            item, payload = entry
+            try:
+                store_stage(item, payload)
+                stored += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"🛑 Error inesperado al guardar: {str(e)}", exc_info=True)
+    finally:
+        stop.set()
+
+    stats = {
+        "items": len(items),
+        "stored": stored,
+        "dropped": metadata.dropped + download.dropped + failed,
+        "wall": round(time.perf_counter() - start, 3),
+        "metadata_busy": round(metadata.busy, 3),
+        "download_busy": round(download.busy, 3)
+    }
+    logger.info(
+        f"🚰 Pipeline: {stats['stored']}/{stats['items']} guardados, {stats['dropped']} descartados en {stats['wall']:.1f}s | "
+        f"Ocupación metadatos {stats['metadata_busy']:.1f}s, descargas {stats['download_busy']:.1f}s"
+    )
+    return stats
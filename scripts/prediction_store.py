@@ -0,0 +1,120 @@
+import os
+import json
+import logging
+import threading
+from dotenv import load_dotenv
+from .progress_index import mark_done, sync_index
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Modo de almacenamiento por defecto: "json" reescribe el archivo completo, "log" añade al log de segmentos
+PREDICTION_STORAGE = os.getenv("AEMET_PREDICTION_STORAGE", "json")
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+PREDICTION_DATA_PATH = os.path.join(_api_dir, 'json', 'prediction_data.json')
+PREDICTION_LOG_PATH = os.path.join(_api_dir, 'json', 'prediction_data.log.jsonl')
+
+_log_lock = threading.Lock()
+
+
+def town_key(town_id):
+    '''Normaliza el id de un municipio ("01001", 1001 -> "1001") para usarlo como clave'''
+    try:
+        return str(int(town_id))
+    except (TypeError, ValueError):
+        return str(town_id)
+
+
+def prediction_data_exists():
+    '''Indica si hay datos de predicción guardados (archivo canónico o log de segmentos)'''
+    return os.path.exists(PREDICTION_DATA_PATH) or os.path.exists(PREDICTION_LOG_PATH)
+
+
+def _iter_log_records():
+    '''Recorre los registros del log de segmentos, ignorando una última línea incompleta'''
+    if not os.path.exists(PREDICTION_LOG_PATH):
+        return
+    with open(PREDICTION_LOG_PATH, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Una escritura interrumpida solo puede dejar a medias la última línea
+                logger.warning(f"❗ Línea {line_number} incompleta en {PREDICTION_LOG_PATH}. Se ignora")
+
+
+def load_prediction_data_dict():
+    '''
+    Carga prediction_data.json y aplica encima los registros del log de segmentos.
+    Devuelve un diccionario {id normalizado: municipio} en el orden del archivo canónico.
+    '''
+    prediction_dict = {}
+
+    if os.path.exists(PREDICTION_DATA_PATH):
+        with open(PREDICTION_DATA_PATH, 'r', encoding='utf-8') as f:
+            for town in json.load(f):
+                if 'id' in town:
+                    prediction_dict[town_key(town['id'])] = town
+
+    # El último registro de cada municipio en el log es el vigente
+    for town in _iter_log_records():
+        if 'id' in town:
+            prediction_dict[town_key(town['id'])] = town
+
+    return prediction_dict
+
+
+def load_prediction_data():
+    '''Devuelve la lista de municipios combinando el archivo canónico y el log de segmentos'''
+    return list(load_prediction_data_dict().values())
+
+
+def append_prediction_record(town_data):
+    '''Añade un municipio al log de segmentos con una única escritura O(1)'''
+    line = json.dumps(town_data, ensure_ascii=False)
+    with _log_lock:
+        os.makedirs(os.path.dirname(PREDICTION_LOG_PATH), exist_ok=True)
+        with open(PREDICTION_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+    if 'id' in town_data:
+        mark_done(PREDICTION_DATA_PATH, [town_key(town_data['id'])], all_keys=load_prediction_data_dict)
+
+
+def save_prediction_data(towns):
+    '''Reescribe prediction_data.json completo y descarta el log, que ya queda incluido'''
+    towns = list(towns)
+    with _log_lock:
+        os.makedirs(os.path.dirname(PREDICTION_DATA_PATH), exist_ok=True)
+        tmp_path = PREDICTION_DATA_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(towns, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, PREDICTION_DATA_PATH)
+
+        if os.path.exists(PREDICTION_LOG_PATH):
+            os.remove(PREDICTION_LOG_PATH)
+
+    sync_index(PREDICTION_DATA_PATH, (town_key(town['id']) for town in towns if 'id' in town))
+
+
+def compact_prediction_data():
+    '''Genera el prediction_data.json canónico a partir del archivo y el log de segmentos'''
+    if not os.path.exists(PREDICTION_LOG_PATH):
+        logger.info("ℹ️ No hay segmentos pendientes de compactar")
+        return None
+
+    towns = load_prediction_data()
+    save_prediction_data(towns)
+    logger.info(f"🗜️ prediction_data.json compactado con {len(towns)} municipios")
+    return len(towns)
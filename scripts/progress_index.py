@@ -0,0 +1,153 @@
+import os
+import logging
+import threading
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Índices cargados por archivo de datos: {ruta del .idx: conjunto de claves}
+_indexes = {}
+_index_lock = threading.RLock()
+# Línea del índice con el tamaño y la fecha de modificación del archivo de datos al escribirlo (vale la última)
+_STAMP = '#stamp'
+# Último sello escrito en cada índice: {ruta del .idx: sello}
+_stamps = {}
+
+
+def index_path(data_path):
+    '''Ruta del índice de progreso de un archivo de datos: <archivo>.idx (una clave por línea)'''
+    return data_path + '.idx'
+
+
+def _data_stamp(data_path):
+    '''Tamaño y fecha de modificación (ns) del archivo de datos, o "" si no existe'''
+    try:
+        stat = os.stat(data_path)
+    except OSError:
+        return ''
+    return f'{stat.st_size} {stat.st_mtime_ns}'
+
+
+def _stamp_line(data_path):
+    '''Línea con el sello actual del archivo de datos (lo anota como el último escrito en su índice)'''
+    stamp = _data_stamp(data_path)
+    _stamps[index_path(data_path)] = stamp
+    return f'{_STAMP} {stamp}\n'
+
+
+def _load(data_path):
+    '''
+    Carga (una vez) las claves del índice; llamar con _index_lock adquirido.
+    None si no existe o si no corresponde al archivo de datos actual (reescrito o truncado fuera de este proceso,
+    o un índice sin sello): sus claves ya no son fiables y hay que reconstruirlo.
+    '''
+    path = index_path(data_path)
+    if path not in _indexes:
+        if not os.path.exists(path):
+            return None
+        keys, stamp = set(), None
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(_STAMP):
+                    stamp = line[len(_STAMP):].strip()
+                elif line:
+                    keys.add(line)
+        if stamp != _data_stamp(data_path):
+            logger.warning(f"❗ {os.path.basename(path)} no corresponde a {os.path.basename(data_path)}. Se reconstruirá")
+            return None
+        _indexes[path] = keys
+        _stamps[path] = stamp
+    return _indexes[path]
+
+
+def load_index(data_path):
+    '''
+    Devuelve el conjunto de claves (municipios o estaciones) guardadas en data_path según su índice,
+    sin leer el archivo de datos. None si el índice todavía no existe.
+    '''
+    with _index_lock:
+        keys = _load(data_path)
+        return set(keys) if keys is not None else None
+
+
+def mark_done(data_path, keys, all_keys=None):
+    '''
+    Añade al índice (append + flush) las claves que aún no estaban, tras una escritura correcta en data_path.
+    Si el índice no existe se crea con all_keys() (todas las claves del archivo de datos), una sola vez.
+    '''
+    keys = list(dict.fromkeys(str(key) for key in keys))
+    if not keys:
+        return 0
+
+    with _index_lock:
+        known = _load(data_path)
+        if known is None:
+            if all_keys is None:
+                return 0
+            rebuild_index(data_path, set(all_keys()) | set(keys))
+            return len(keys)
+
+        new_keys = [key for key in keys if key not in known]
+        if not new_keys:
+            stamp_index(data_path)
+            return 0
+        with open(index_path(data_path), 'a', encoding='utf-8') as f:
+            f.write(''.join(f'{key}\n' for key in new_keys) + _stamp_line(data_path))
+            f.flush()
+        known.update(new_keys)
+        return len(new_keys)
+
+
+def sync_index(data_path, keys):
+    '''
+    Actualiza el índice cuando se conoce el conjunto completo de claves del archivo (reescrituras completas):
+    añade las nuevas y solo lo reescribe si sobra alguna (p.ej. el archivo se empezó desde cero).
+    '''
+    keys = {str(key) for key in keys}
+    with _index_lock:
+        known = _load(data_path)
+        if known is None or not known <= keys:
+            return len(rebuild_index(data_path, keys))
+        return mark_done(data_path, keys - known)
+
+
+def rebuild_index(data_path, keys):
+    '''Reescribe el índice completo con keys (tras leer una vez el archivo de datos) y el sello del archivo'''
+    keys = {str(key) for key in keys}
+    with _index_lock:
+        path = index_path(data_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(f'{key}\n' for key in sorted(keys)) + _stamp_line(data_path))
+        os.replace(tmp_path, path)
+        _indexes[path] = keys
+    logger.info(f"🗂️ Índice de progreso {os.path.basename(path)} reconstruido con {len(keys)} claves")
+    return keys
+
+
+def stamp_index(data_path):
+    '''
+    Vuelve a sellar el índice tras una escritura en data_path que no añade claves (p.ej. al cerrar SQLite).
+    Solo escribe si el archivo de datos cambió desde el último sello.
+    '''
+    with _index_lock:
+        path = index_path(data_path)
+        if path not in _indexes or not os.path.exists(path) or _stamps.get(path) == _data_stamp(data_path):
+            return
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(_stamp_line(data_path))
+
+
+def clear_index(data_path):
+    '''Vacía el índice cuando el archivo de datos se empieza desde cero'''
+    with _index_lock:
+        path = index_path(data_path)
+        if os.path.exists(path):
+            os.remove(path)
+        _indexes[path] = set()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+from .rate_limiter import RATE_LIMIT
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Ajuste automático AIMD de la tasa y la concurrencia de cada clave (se puede sobreescribir desde el .env)
+RATE_AUTOTUNE = os.getenv("AEMET_RATE_AUTOTUNE", "false").lower() == "true"
+RATE_MIN = float(os.getenv("AEMET_RATE_MIN", 0.2))
+RATE_MAX = float(os.getenv("AEMET_RATE_MAX", 0.85))               # ≈ 50 pet/min, la cuota documentada por clave
+RATE_INCREASE = float(os.getenv("AEMET_RATE_INCREASE", 0.02))      # pet/s que se suman por segundo sin errores
+RATE_DECREASE = float(os.getenv("AEMET_RATE_DECREASE", 0.5))       # factor tras un 429 o un timeout
+CONCURRENCY_MAX = int(os.getenv("AEMET_CONCURRENCY_MAX", 4))       # peticiones en vuelo por clave como máximo
+# Tras un recorte se ignoran los demás avisos durante este tiempo (las peticiones en vuelo ya salieron con la tasa anterior)
+DECREASE_HOLD = 5.0
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+RATE_STATE_PATH = os.path.join(_api_dir, 'json', 'rate_state.json')
+
+_state_lock = threading.Lock()
+
+
+def parse_retry_after(value):
+    '''Segundos de la cabecera Retry-After (número de segundos o fecha HTTP); None si no hay o no es válida'''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def key_id(key):
+    '''Identificador de una clave en rate_state.json (hash: la clave no se guarda en claro)'''
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def load_rate_state():
+    '''Tasa y concurrencia aprendidas por clave ({key_id: {"rate", "concurrency"}}), o un diccionario vacío'''
+    if not os.path.exists(RATE_STATE_PATH):
+        return {}
+    try:
+        with open(RATE_STATE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f).get('keys', {})
+    except (json.JSONDecodeError, AttributeError):
+        logger.warning(f"❗ {RATE_STATE_PATH} dañado. Se empieza con AEMET_RATE_LIMIT")
+        return {}
+
+
+def save_rate_state(states):
+    '''Guarda el estado aprendido de cada clave para la próxima ejecución (escritura atómica)'''
+    with _state_lock:
+        os.makedirs(os.path.dirname(RATE_STATE_PATH), exist_ok=True)
+        tmp_path = RATE_STATE_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "updated": datetime.now(timezone.utc).isoformat(),
+                "keys": {
+                    identifier: {"rate": state['rate'], "concurrency": state['concurrency']}
+                    for identifier, state in states.items()
+                }
+            }, f, indent=4)
+        os.replace(tmp_path, RATE_STATE_PATH)
+
+
+class AIMDController:
+    '''
+    Control AIMD (aumento aditivo, disminución multiplicativa) de la tasa y las peticiones en vuelo de una clave.
+    Cada respuesta correcta sube la tasa RATE_INCREASE/tasa (≈ RATE_INCREASE pet/s por segundo de tráfico)
+    y la concurrencia 1/concurrencia; un 429 o un timeout las multiplica por RATE_DECREASE.
+    '''
+    def __init__(self, rate=RATE_LIMIT, concurrency=CONCURRENCY_MAX):
+        self.rate = min(max(float(rate), RATE_MIN), RATE_MAX)
+        self.concurrency = min(max(float(concurrency), 1.0), CONCURRENCY_MAX)
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+        self.successes = 0
+        self.decreases = 0
+        self.min_rate = self.max_rate = self.rate
+
+    def concurrency_limit(self):
+        '''Peticiones en vuelo permitidas ahora mismo para la clave'''
+        return int(self.concurrency)
+
+    def on_success(self):
+        '''Aumento aditivo tras una respuesta correcta. Devuelve la nueva tasa'''
+        with self._lock:
+            self.successes += 1
+            self.rate = min(RATE_MAX, self.rate + RATE_INCREASE / self.rate)
+            self.concurrency = min(CONCURRENCY_MAX, self.concurrency + 1 / self.concurrency)
+            self.max_rate = max(self.max_rate, self.rate)
+            return self.rate
+
+    def on_congestion(self):
+        '''
+        Disminución multiplicativa tras un 429 o un timeout (como mucho una vez cada DECREASE_HOLD segundos).
+        Devuelve la nueva tasa, o None si el aviso se ignora por llegar dentro de la ventana del último recorte.
+        '''
+        with self._lock:
+            current = time.monotonic()
+            if current - self._last_decrease < DECREASE_HOLD:
+                return None
+            self._last_decrease = current
+            self.decreases += 1
+            self.rate = max(RATE_MIN, self.rate * RATE_DECREASE)
+            self.concurrency = max(1.0, self.concurrency * RATE_DECREASE)
+            self.min_rate = min(self.min_rate, self.rate)
+            return self.rate
+
+    def state(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "concurrency": round(self.concurrency, 2),
+                "successes": self.successes,
+                "decreases": self.decreases,
+                "min_rate": round(self.min_rate, 3),
+                "max_rate": round(self.max_rate, 3)
+            }
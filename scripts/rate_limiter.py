@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Cuota por defecto: peticiones HTTP por segundo (metadatos y 'datos' cuentan igual) y ráfaga máxima
+RATE_LIMIT = float(os.getenv("AEMET_RATE_LIMIT", 0.8))
+RATE_BURST = int(os.getenv("AEMET_RATE_BURST", 4))
+# Las descargas de 'datos' (/opendata/sh/...) no llevan clave ni gastan tokens de las claves;
+# con "true" se espacian con un limitador propio (la cuota conjunta de las claves), con "false" salen sin esperar
+DATOS_RATE_LIMITED = os.getenv("AEMET_DATOS_RATE_LIMITED", "true").lower() == "true"
+
+
+class TokenBucket:
+    '''
+    Limitador token bucket sobre reloj monótono, compartido entre hilos (el modo async lo usa desde asyncio.to_thread).
+    Cada petición reserva un token; si no hay disponibles, espera lo necesario hasta que se repongan.
+    '''
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate debe ser > 0 y burst >= 1")
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Métricas de espera
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self):
+        '''Reserva un token y devuelve los segundos que hay que esperar para usarlo (sin esperar)'''
+        with self._lock:
+            current = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (current - self._last_refill) * self.rate)
+            self._last_refill = current
+
+            # El saldo puede quedar negativo: las esperas se encolan en orden de llegada
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            self.acquired += 1
+            if wait_time > 0:
+                self.waited += 1
+                self.total_wait += wait_time
+                self.max_wait = max(self.max_wait, wait_time)
+            return wait_time
+
+    def available_in(self):
+        '''Segundos hasta que una nueva reserva tendría su token (0 si hay saldo), sin reservar nada'''
+        with self._lock:
+            tokens = min(self.burst, self._tokens + (time.monotonic() - self._last_refill) * self.rate)
+            return (1 - tokens) / self.rate if tokens < 1 else 0.0
+
+    def acquire(self):
+        '''Bloquea el hilo hasta disponer de un token. Devuelve el tiempo esperado'''
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def set_rate(self, rate, burst=None):
+        '''Cambia la tasa (y opcionalmente la ráfaga) sin perder el saldo acumulado'''
+        with self._lock:
+            current = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (current - self._last_refill) * self.rate)
+            self._last_refill = current
+            self.rate = float(rate)
+            if burst is not None:
+                self.burst = int(burst)
+                self._tokens = min(self._tokens, self.burst)
+
+    def stats(self):
+        '''Devuelve las métricas de espera del limitador'''
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "requests": self.acquired,
+                "waited_requests": self.waited,
+                "total_wait": round(self.total_wait, 3),
+                "avg_wait": round(self.total_wait / self.acquired, 3) if self.acquired else 0.0,
+                "max_wait": round(self.max_wait, 3)
+            }
+
+
+_limiter = None
+_limiter_lock = threading.RLock()
+
+
+def configure_rate_limiter(rate=RATE_LIMIT, burst=RATE_BURST):
+    '''Crea (o reemplaza) el limitador global compartido por todas las peticiones'''
+    global _limiter
+    with _limiter_lock:
+        _limiter = TokenBucket(rate, burst)
+        return _limiter
+
+
+def get_rate_limiter():
+    '''Devuelve el limitador global, creándolo si no existe'''
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                return configure_rate_limiter()
+    return _limiter
+
+
+def log_rate_limiter_stats():
+    '''Muestra en el log las métricas de espera del limitador global'''
+    stats = get_rate_limiter().stats()
+    logger.info(
+        f"⏱️ Peticiones limitadas: {stats['requests']} | Con espera: {stats['waited_requests']} | "
+        f"Espera total: {stats['total_wait']:.1f}s (media {stats['avg_wait']:.2f}s, máx {stats['max_wait']:.2f}s)"
+    )
+    return stats
@@ -1,12 +1,27 @@
 import json
 import os
 from datetime import datetime, timezone
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .utils import *
 from .verify_files import *
 from .fetch_station_data import *
+from .http_session import log_session_stats, finish_run
+from .rate_limiter import log_rate_limiter_stats
+from .http_cache import log_cache_stats
+from .async_engine import run_ordered, ASYNC_CONCURRENCY
+from .pipeline import run_pipeline, PIPELINE_METADATA_CONCURRENCY, PIPELINE_DOWNLOAD_CONCURRENCY
+from .prediction_store import (
+    PREDICTION_STORAGE, town_key, load_prediction_data_dict,
+    append_prediction_record, save_prediction_data, compact_prediction_data
+)
+from .historical_store import HISTORICAL_STORAGE, open_historical_store
+from .journal_replay import replay_journal, REPLAY_CONCURRENCY
+from .forecast_refresh import stale_towns
+from .watermarks import (
+    load_watermarks, save_watermarks, clear_watermarks,
+    group_watermark, result_watermark, incremental_start_date
+)
 import logging
-import time
 
 # Configurar logging
 logging.basicConfig(
@@ -15,38 +30,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configuración global
+# Configuración global (el ritmo de peticiones lo controla el limitador de rate_limiter.py)
 DEFAULT_START_DATE = '2025-01-01T00:00:00UTC'
-REQUEST_DELAY = 3.0  # segundos entre solicitudes
-
-def historical_data(final_date, resume=False):
-    '''Obtiene la información histórica de las estaciones de meteorología de la AEMET - España'''
+HISTORICAL_MODE = os.getenv("AEMET_HISTORICAL_MODE", "sync")                   # "sync" o "parallel"
+HISTORICAL_CONCURRENCY = int(os.getenv("AEMET_HISTORICAL_CONCURRENCY", 4))     # grupos en vuelo en modo parallel
+
+def historical_data(
+    final_date,
+    resume=False,
+    storage=HISTORICAL_STORAGE,
+    incremental=False,
+    mode=HISTORICAL_MODE,
+    concurrency=HISTORICAL_CONCURRENCY
+):
+    '''
+    Obtiene la información histórica de las estaciones de meteorología de la AEMET - España.
+    storage="json" guarda en weather_data.json; storage="sqlite" guarda en weather_data.db.
+    incremental=True pide a cada grupo solo los días posteriores a su marca de agua
+    (última fecha almacenada, en historical_watermarks.json).
+    mode="sync" pide los grupos uno a uno; mode="parallel" mantiene `concurrency` grupos en vuelo
+    (la cuota la sigue marcando el limitador global) y guarda cada grupo según termina.
+    '''
+    store = None
     try:
         # 1. Configuración inicial
         script_dir = os.path.dirname(os.path.abspath(__file__))
         api_dir = os.path.dirname(script_dir)
-        output_file_path = os.path.join(api_dir, 'json', 'weather_data.json')
-        now = datetime.now(timezone.utc).isoformat()
 
-        # 2. Cargar datos existentes
-        if os.path.exists(output_file_path):
-            with open(output_file_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-            
-            if resume:
-                # En modo resume, usamos los datos existentes
-                stations_data = existing_data
-                # Reconstruir processed_dates desde los datos existentes
-                processed_dates = defaultdict(set)
-                for station_code, station_info in existing_data.items():
-                    processed_dates[station_code].update(station_info['date'].keys())
-            else:
-                # Si no es resume, empezamos de cero
-                stations_data = {}
-                processed_dates = defaultdict(set)
-        else:
-            stations_data = {}
-            processed_dates = defaultdict(set)
+        # 2. Abrir el almacenamiento (en modo resume o incremental se usan los datos existentes)
+        fresh = not (resume or incremental)
+        store = open_historical_store(storage, fresh=fresh)
+
+        # Al empezar desde cero las marcas de agua anteriores dejan de ser válidas
+        if fresh:
+            clear_watermarks()
+        watermarks = load_watermarks()
 
         # 3. Leer los códigos de las estaciones desde JSON
         logger.info("Obteniendo códigos de estaciones EMA")
@@ -59,86 +77,109 @@ def historical_data(final_date, resume=False):
             return None
 
         # 4. Configurar rango de fechas
-        encoded_init_date = DEFAULT_START_DATE.replace(':', '%3A')
+        default_init_date = DEFAULT_START_DATE.replace(':', '%3A')
         end_date_str = final_date + 'T00:00:00UTC'
         encoded_end_date = end_date_str.replace(':', '%3A')
 
-        # 5. Procesar estaciones
+        # 5. Planificar los grupos a pedir: (posición, grupo, indicativos, fecha inicial, marca de agua)
         total_stations = len(ema_codes)
         processed_count = 0
-        updated_stations = set()
+        tasks = []
 
         for i, (group, stations_codes) in enumerate(ema_codes.items(), 1):
-            encoded_stations_codes = stations_codes.replace(',', '%2C')
             station_codes_list = stations_codes.split(',')
             
             # En modo resume, saltar si todas las estaciones del grupo ya están completas
-            if resume and all(code in processed_dates and len(processed_dates[code]) > 0 
-                           for code in station_codes_list):
+            if resume and all(code in store for code in station_codes_list):
                 logger.info(f"↩️ [{i}/{total_stations}] Grupo {group} ya procesado. Saltando...")
                 continue
 
-            logger.info(f"[{i}/{total_stations}] Procesando estaciones del {group}")
+            # En modo incremental solo se pide la ventana posterior a la marca de agua del grupo
+            encoded_init_date = default_init_date
+            watermark = group_watermark(group, station_codes_list, store, watermarks) if incremental else None
+            if watermark:
+                if watermark >= final_date:
+                    logger.info(f"↩️ [{i}/{total_stations}] Grupo {group} al día ({watermark}). Saltando...")
+                    continue
+                start_date = incremental_start_date(watermark)
+                encoded_init_date = f"{start_date}T00:00:00UTC".replace(':', '%3A')
 
-            # Obtener datos de la estación y actualiza el timestamp para la próxima iteración
-            result, updated_now = fetch_historical_station_data(
-                encoded_init_date,
-                encoded_end_date,
-                encoded_stations_codes,
-                last_request_time=now
-            )
-            now = updated_now
+            tasks.append((i, group, station_codes_list, encoded_init_date, watermark))
+
+        def fetch_group(task):
+            '''Descarga un grupo (en modo parallel se ejecuta en el pool de hilos)'''
+            i, group, station_codes_list, encoded_init_date, watermark = task
+            if watermark:
+                logger.info(f"[{i}/{total_stations}] Procesando estaciones del {group} desde {incremental_start_date(watermark)}")
+            else:
+                logger.info(f"[{i}/{total_stations}] Procesando estaciones del {group}")
+            failed = []
+            result = fetch_historical_group(encoded_init_date, encoded_end_date, station_codes_list, failed=failed)
+            return result, failed
+
+        def store_group(task, fetched):
+            '''
+            Fusiona el resultado de un grupo y guarda el punto de control (commit + marca de agua).
+            Se ejecuta siempre en este hilo: el almacenamiento solo lo escribe un hilo.
+            '''
+            nonlocal processed_count
+            _, group, station_codes_list, _, watermark = task
+            result, failed = fetched
+            now = datetime.now(timezone.utc).isoformat()
 
             if not result:
                 logger.warning(f"No se obtuvieron datos para el {group}")
-                continue
+                return
 
-            # Procesar cada estación en el resultado
+            # Procesar cada estación en el resultado (en resume solo se añaden fechas nuevas)
             logger.info(f"Procesando grupo: [{group}]")
+            group_updated = False
             for station_data in result:
-                current_station_code = station_data.get('town_code')
-
-                # Filtrar solo las fechas que no hemos procesado
-                new_data = {}
-                for date, values in station_data['date'].items():
-                    if date not in processed_dates.get(current_station_code, set()):
-                        new_data[date] = {
-                            'values': values,
-                            'ts_insert': now if current_station_code not in stations_data else stations_data[current_station_code]['date'].get(date, {}).get('ts_insert', now),
-                            'ts_update': now
-                        }
-
-                if not new_data and resume:
-                    logger.info(f"No hay datos nuevos para {current_station_code}")
+                written = store.merge_station(station_data, now, overwrite=not resume)
+
+                if not written and resume:
+                    logger.info(f"No hay datos nuevos para {station_data.get('town_code')}")
                     continue
 
-                # Actualizar los datos de la estación
-                if current_station_code not in stations_data:
-                    stations_data[current_station_code] = {
-                        "town_code": current_station_code,
-                        "province": station_data["province"],
-                        "town": station_data["town"],
-                        "date": {}
-                    }
-                
-                # Agregar solo datos nuevos
-                stations_data[current_station_code]['date'].update(new_data)
-                processed_dates[current_station_code].update(new_data.keys())
-                processed_count += len(new_data)
-                updated_stations.add(current_station_code)
-
-            # Guardar progreso después de cada grupo (directamente en weather_data.json)
-            if updated_stations:
-                with open(output_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(stations_data, f, ensure_ascii=False, indent=4)
-    
+                processed_count += written
+                group_updated = group_updated or written > 0
+
+            # Guardar progreso después de cada grupo
+            if group_updated:
+                store.commit()
                 logger.info(f"Progreso guardado después del grupo {group}")
-                updated_stations.clear()
 
-            time.sleep(REQUEST_DELAY)
+            # La marca de agua solo avanza cuando los datos del grupo ya están guardados
+            new_watermark = result_watermark(result, station_codes_list, final_date, failed)
+            if new_watermark and new_watermark > (watermark or ''):
+                watermarks[group] = new_watermark
+                save_watermarks(watermarks)
+
+        # 6. Procesar los grupos
+        if mode == "parallel":
+            logger.info(f"⚡ Modo paralelo: {len(tasks)} grupos con {concurrency} en vuelo")
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = {executor.submit(fetch_group, task): task for task in tasks}
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        fetched = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Error en el {task[1]}: {str(e)}")
+                        fetched = (None, [])
+                    store_group(task, fetched)
+        elif mode == "sync":
+            for task in tasks:
+                store_group(task, fetch_group(task))
+        else:
+            raise ValueError(f"Modo desconocido: {mode}")
 
         logger.info(f"✅ Proceso completado. Datos nuevos procesados: {processed_count}")
-        return stations_data
+        log_session_stats()
+        log_rate_limiter_stats()
+        log_cache_stats()
+        finish_run()
+        return store.data if storage == "json" else None
         
     except KeyError as e:
         logger.error(f"❌Error de key {str(e)}")
@@ -148,65 +189,49 @@ def historical_data(final_date, resume=False):
         logger.error(f"❌Error al procesar archivos JSON: {str(e)}")
     except Exception as e:
         logger.error(f"❌Error inesperado: {str(e)}", exc_info=True)
-
-def data_from_error_journal():
-    '''Función para actualizar el weather_data.json con la información desde errors.json'''
+    finally:
+        if store is not None:
+            store.close()
+
+def data_from_error_journal(storage=HISTORICAL_STORAGE, concurrency=REPLAY_CONCURRENCY):
+    '''
+    Función para actualizar el weather_data.json (o weather_data.db) con la información desde errors.jsonl.
+    Las URL se piden sin repetir y en paralelo; solo se quitan del journal las entradas recuperadas.
+    '''
+    store = None
     try:
-        # 1. Configuración inicial
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        api_dir = os.path.dirname(script_dir)
-        weather_data_path = os.path.join(api_dir, 'json', 'weather_data.json')
-        
-        # Cargar el JSON principal
-        weather_data = verify_json_docs(weather_data_path, message="No esta creado weather_data.json")
-        now = datetime.now(timezone.utc).isoformat()
+        # Cargar el almacenamiento principal
+        store = open_historical_store(storage, must_exist=True)
+        new_dates_for_group = set()
 
-        # Obtener datos del journal de errores
-        result, updated_now = fetch_error_data(last_request_time=now)
-        now = updated_now
-        
-        if not result:
+        def store_result(url, result):
+            '''Fusiona las estaciones recuperadas y guarda antes de que la entrada salga del journal'''
+            now = datetime.now(timezone.utc).isoformat()
+            for entry in result:
+                if not entry.get("town_code") or not entry.get("date"):
+                    continue
+
+                # Si la fecha ya existe se actualizan los valores (conservando ts_insert); si no, se añade
+                store.merge_station(entry, now, overwrite=True)
+                new_dates_for_group.update(entry["date"].keys())
+            store.commit()
+
+        # Repetir las peticiones del journal de errores
+        summary = replay_journal("errors", journal_entry_url, fetch_error_url, store_result, concurrency)
+
+        if not summary["recovered"]:
             logger.error(f"❌No se obtuvieron datos válidos")
             raise ValueError("No se obtuvieron datos válidos")
 
-        new_dates_for_group = set()
-
-        # Procesar cada entrada del journal de errores
-        for entry in result:
-            town_code = entry.get("town_code")
-            if not town_code:
-                continue
-                
-            # Obtener las fechas/datos del entry actual
-            date_data = entry.get("date", {})
-            if not date_data:
-                continue
-                
-            # Si el town_code no existe en weather_data, crearlo
-            if town_code not in weather_data:
-                weather_data[town_code] = {
-                    "town_code": town_code,
-                    "province": entry.get("province", ""),
-                    "town": entry.get("town", ""),
-                    "date": {}
-                }
-                
-            # Para cada fecha en el entry actual
-            for date_str, values in date_data.items():
-                # Si la fecha ya existe, actualizamos los valores
-                # Si no existe, la añadimos
-                weather_data[town_code]["date"][date_str] = {
-                    "values": values,
-                    "ts_insert": now,
-                    "ts_update": now
-                }
-                new_dates_for_group.add(date_str)
-
-        # Guardar los cambios en el archivo weather_data.json
-        with open(weather_data_path, 'w', encoding='utf-8') as f:
-            json.dump(weather_data, f, ensure_ascii=False, indent=4)
-
-        logger.info(f"✅ Datos actualizados correctamente. Nuevas fechas añadidas: {new_dates_for_group}")
+        logger.info(
+            f"✅ Datos actualizados correctamente. URL recuperadas: {summary['recovered']}/{summary['targets']} | "
+            f"Fechas actualizadas: {len(new_dates_for_group)}"
+        )
+        log_session_stats()
+        log_rate_limiter_stats()
+        log_cache_stats()
+        finish_run()
+        return summary
         
     except KeyError as e:
         logger.error(f"❌Error de key {str(e)}")
@@ -216,26 +241,27 @@ def data_from_error_journal():
         logger.error(f"❌Error al procesar archivos JSON: {str(e)}")
     except Exception as e:
         logger.error(f"❌Error inesperado data_from_error_journal: {str(e)}", exc_info=True)
-
-def prediction_data_by_town(resume=False, recovery=False):
-    '''Obtiene las predicciones meteorologicas de la AEMET - España por cada municipio'''
+    finally:
+        if store is not None:
+            store.close()
+
+def prediction_data_by_town(resume=False, recovery=False, mode="sync", concurrency=ASYNC_CONCURRENCY, storage=PREDICTION_STORAGE, refresh=False):
+    '''
+    Obtiene las predicciones meteorologicas de la AEMET - España por cada municipio.
+    mode="sync" procesa los municipios uno a uno; mode="async" mantiene varios en vuelo (concurrency);
+    mode="pipeline" separa los dos pasos: los metadatos de los siguientes municipios se piden mientras se descargan
+    los 'datos' de los anteriores (AEMET_PIPELINE_METADATA_CONCURRENCY / AEMET_PIPELINE_DOWNLOAD_CONCURRENCY).
+    refresh=True solo pide los municipios cuya predicción puede haber cambiado ('elaborated' + cadencia de publicación),
+    empezando por los más atrasados.
+    storage="json" reescribe prediction_data.json por municipio; storage="log" añade al log de segmentos y compacta al final.
+    '''
     try:
         # 1. Configuración inicial
         script_dir = os.path.dirname(os.path.abspath(__file__))
         api_dir = os.path.dirname(script_dir)
-        now = datetime.now(timezone.utc).isoformat()
-        
-        prediction_data_file_path = os.path.join(api_dir, 'json', 'prediction_data.json')
-
-        # 2. Cargar datos existentes si el archivo existe
-        if os.path.exists(prediction_data_file_path):
-            with open(prediction_data_file_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
 
-            # Crea un diccionario a partir de prediction_daja.json
-            existing_data_dict = {str(town['id']): town for town in existing_data}
-        else:
-            existing_data_dict = {}
+        # 2. Cargar datos existentes (prediction_data.json + log de segmentos)
+        existing_data_dict = load_prediction_data_dict()
 
         # 3. Determinar el conjunto de municipios a procesar
         town_codes_path = os.path.join(api_dir, 'json', 'pending_towns_codes.json' if resume else 'towns_codes.json')
@@ -245,47 +271,117 @@ def prediction_data_by_town(resume=False, recovery=False):
             message="❗ No existen códigos pendientes" if resume else "Debes crear primero el archivo de códigos"
         )
 
+        if refresh and towns_codes:
+            towns_codes = stale_towns(towns_codes, existing_data_dict)
+
         if not towns_codes:
             logger.warning("❗ No hay municipios para procesar")
-            return
+            return list(existing_data_dict.values()) if refresh else None
 
         # 4. Procesar municipios
         total_towns = len(towns_codes)
         processed_count  = 0
 
-        for i, (code, name) in enumerate(towns_codes.items(), 1):
-            town_id = str(code)
-            
-            # En modo resume, saltar si ya existe
-            if resume and town_id in existing_data_dict:
-                logger.info(f"↩️ [{i}/{total_towns}] Municipio {name} ya existe. Saltando...")
-                continue
+        def store_town(town_id, town_data):
+            '''Añade el municipio al diccionario y guarda el progreso'''
+            # Mantener timestamp original o crear uno nuevo
+            now = datetime.now(timezone.utc).isoformat()
+            town_data['ts_insert'] = existing_data_dict.get(town_id, {}).get('ts_insert', now)
+            town_data['ts_update'] = now
+            existing_data_dict[town_id] = town_data
+
+            # Guardar progreso después de cada municipio
+            if storage == "log":
+                append_prediction_record(town_data)
+            else:
+                save_prediction_data(existing_data_dict.values())
 
-            logger.info(f"🌐 [{i}/{total_towns}] Procesando el municipio {name}")
+        if mode in ("async", "pipeline"):
+            pending = []
+            for i, (code, name) in enumerate(towns_codes.items(), 1):
+                if resume and town_key(code) in existing_data_dict:
+                    logger.info(f"↩️ [{i}/{total_towns}] Municipio {name} ya existe. Saltando...")
+                    continue
+                pending.append((i, code, name))
+
+        if mode == "pipeline":
+            def town_metadata(item):
+                i, code, name = item
+                logger.info(f"🌐 [{i}/{total_towns}] Procesando el municipio {name}")
+                return fetch_prediction_metadata(code)
+
+            def town_download(item, metadata):
+                _, code, _ = item
+                data = download_prediction_data(code, metadata)
+                return (metadata, data) if data is not None else None
+
+            def town_store(item, downloaded):
+                nonlocal processed_count
+                _, code, _ = item
+                metadata, data = downloaded
+                town_data = parse_prediction_data(
+                    code, data, metadata.get('datos', metadata['url']), fetched=metadata.get('fetched')
+                )
+                if not town_data:
+                    logger.warning(f"❗ No se obtuvieron datos para el municipio {code}")
+                    return
+                store_town(town_key(code), town_data)
+                processed_count += 1
 
-            # Obtener datos del municipio
-            town_data, now = fetch_prediction_station_data(code, last_request_time=now)
+            logger.info(
+                f"🚰 Modo pipeline: {len(pending)} municipios, {PIPELINE_METADATA_CONCURRENCY} hilos de metadatos "
+                f"y {PIPELINE_DOWNLOAD_CONCURRENCY} de descarga"
+            )
+            run_pipeline(pending, town_metadata, town_download, town_store)
+
+        elif mode == "async":
+            def fetch_town(item):
+                i, code, name = item
+                logger.info(f"🌐 [{i}/{total_towns}] Procesando el municipio {name}")
+                return fetch_prediction_station_data(code)
+
+            def on_town_result(item, town_data):
+                nonlocal processed_count
+                _, code, _ = item
+                if not town_data:
+                    logger.warning(f"❗ No se obtuvieron datos para el municipio {code}")
+                    return
+                store_town(town_key(code), town_data)
+                processed_count += 1
 
-            if not town_data:
-                logger.warning(f"❗ No se obtuvieron datos para el municipio {code}")
-                continue
+            logger.info(f"⚡ Modo asíncrono: {len(pending)} municipios con {concurrency} en vuelo")
+            run_ordered(pending, fetch_town, on_town_result, concurrency=concurrency)
 
-            if town_data:
-                # Mantener timestamp original o crear uno nuevo
-                town_data['ts_insert'] = existing_data_dict.get(town_id, {}).get('ts_insert', now)
-                town_data['ts_update'] = now
-                existing_data_dict[town_id] = town_data
-                processed_count += 1
+        else:
+            for i, (code, name) in enumerate(towns_codes.items(), 1):
+                town_id = town_key(code)
+                
+                # En modo resume, saltar si ya existe
+                if resume and town_id in existing_data_dict:
+                    logger.info(f"↩️ [{i}/{total_towns}] Municipio {name} ya existe. Saltando...")
+                    continue
 
-                # Guardar progreso después de cada municipio
-                with open(prediction_data_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(list(existing_data_dict.values()), f, ensure_ascii=False, indent=4)
-            else:
-                logger.warning(f"❗ No se obtuvieron datos para {name}")
+                logger.info(f"🌐 [{i}/{total_towns}] Procesando el municipio {name}")
+
+                # Obtener datos del municipio
+                town_data = fetch_prediction_station_data(code)
+
+                if not town_data:
+                    logger.warning(f"❗ No se obtuvieron datos para el municipio {code}")
+                    continue
+
+                store_town(town_id, town_data)
+                processed_count += 1
 
-            time.sleep(REQUEST_DELAY)
+        # 5. Compactar el log de segmentos en el prediction_data.json canónico
+        if storage == "log":
+            compact_prediction_data()
 
         logger.info(f"✅ Proceso completado. Municipios procesados: {processed_count}/{total_towns}")
+        log_session_stats()
+        log_rate_limiter_stats()
+        log_cache_stats()
+        finish_run()
         return list(existing_data_dict.values())
         
     except KeyError as e:
@@ -295,72 +391,59 @@ def prediction_data_by_town(resume=False, recovery=False):
     except Exception as e:
         logger.error(f"❌ Error inesperado: {str(e)}", exc_info=True)
 
-def prediction_data_from_error_journal():
-    '''Función para actualizar prediction_data.json con la información desde error_prediction.json'''
+def prediction_data_from_error_journal(storage=PREDICTION_STORAGE, concurrency=REPLAY_CONCURRENCY):
+    '''
+    Función para actualizar prediction_data.json con la información desde error_prediction.jsonl.
+    Cada municipio se pide una sola vez y en paralelo; solo se quitan del journal las entradas recuperadas.
+    '''
     try:
-        # 1. Configuración inicial
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        api_dir = os.path.dirname(script_dir)
-        prediction_data_path = os.path.join(api_dir, 'json', 'prediction_data.json')
-        error_journal_path = os.path.join(api_dir, 'error_journal', 'error_prediction.json')
-        now = datetime.now(timezone.utc).isoformat()
-        
-        # 2. Verificar que existe error_prediction.json
-        if not os.path.exists(error_journal_path):
-            logger.warning(f"❗No existe el archivo error_prediction.json")
-            return None
-        
-        
-        # 3. Usar verify_json_docs para cargar los archivos JSON
-        prediction_data = verify_json_docs(prediction_data_path, [])
-        error_entries = verify_json_docs(error_journal_path, [])
-        
-        # 4. Crea un diccionario para desde prediction_data
-        prediction_dict = {str(town.get('id')): town for town in prediction_data if 'id' in town}
-        
-        if not error_entries:
-            logger.warning(f"❗El archivo error_prediction.json está vacío")
-            return None
-        
-        logger.info(f"Procesando {len(error_entries)} entradas del journal de errores")
-        
-        # 5. Procesar cada entrada del journal de errores
-        processed_count = 0
-        
-        for entry in error_entries:
+        # 1. Cargar los datos existentes (prediction_data.json + log de segmentos)
+        prediction_dict = load_prediction_data_dict()
+
+        def entry_town(entry):
             town_code = entry.get('station_code')
             if not town_code:
                 logger.warning(f"❗Entrada sin código de municipio: {entry}")
-                continue
-            
-            # Obtener nuevos datos para este municipio
-            town_data, now = fetch_prediction_station_data(town_code, last_request_time=now)
-            
-            if town_data:
-                town_id = str(town_data.get('id', town_code))
-                town_data['ts_insert'] = prediction_dict.get(town_id, {}).get('ts_insert', now) # si existe lo conserva
-                town_data['ts_update'] = now
-                
-                # Actualizar el diccionario
-                prediction_dict[town_id] = town_data
-                processed_count += 1
-                logger.info(f"✅ Datos actualizados para el municipio {town_id}")
-                
-                # Guardar progreso por cada municipio
-                with open(prediction_data_path, 'w', encoding='utf-8') as f:
-                    json.dump(list(prediction_dict.values()), f, ensure_ascii=False, indent=4)
+                return None
+            return town_code
+
+        def store_town(town_code, town_data):
+            '''Guarda el municipio antes de que su entrada salga del journal'''
+            now = datetime.now(timezone.utc).isoformat()
+            town_id = town_key(town_data.get('id', town_code))
+            town_data['ts_insert'] = prediction_dict.get(town_id, {}).get('ts_insert', now) # si existe lo conserva
+            town_data['ts_update'] = now
+            prediction_dict[town_id] = town_data
+
+            # Guardar progreso por cada municipio
+            if storage == "log":
+                append_prediction_record(town_data)
             else:
-                logger.warning(f"❗No se pudieron recuperar datos para el municipio {town_code}")
-            
-            # Pausar entre peticiones
-            time.sleep(REQUEST_DELAY)
+                save_prediction_data(prediction_dict.values())
+
+        # 2. Repetir las peticiones del journal (sin volver a registrar los fallos: se quedan en él)
+        summary = replay_journal(
+            "error_prediction",
+            entry_town,
+            lambda town_code: fetch_prediction_station_data(town_code, journal=False),
+            store_town,
+            concurrency
+        )
+        processed_count = summary["recovered"]
+
+        if not summary["entries"]:
+            logger.warning(f"❗No existe el archivo error_prediction.jsonl o está vacío")
+            return None
         
-        # 6. Limpiar el journal de errores si se procesaron correctamente
-        if processed_count > 0:
-            os.remove(error_journal_path)
-            logger.info(f"✅ Journal de errores eliminado correctamente")
+        # 3. Compactar el log de segmentos en el prediction_data.json canónico
+        if storage == "log":
+            compact_prediction_data()
         
         logger.info(f"✅ Proceso completado. Municipios actualizados: {processed_count}")
+        log_session_stats()
+        log_rate_limiter_stats()
+        log_cache_stats()
+        finish_run()
         return list(prediction_dict.values())
         
     except KeyError as e:
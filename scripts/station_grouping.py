@@ -0,0 +1,198 @@
+import os
+import json
+import logging
+import statistics
+import threading
+from dotenv import load_dotenv
+from .http_session import AEMET_BASE_URL
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Configuración de la agrupación de estaciones (se puede sobreescribir desde el .env)
+# "fixed": grupos de GROUP_SIZE en el orden del inventario; "adaptive": grupos según las mediciones anteriores
+GROUPING_MODE = os.getenv("AEMET_GROUPING_MODE", "fixed")
+GROUP_SIZE = int(os.getenv("AEMET_GROUP_SIZE", 25))
+GROUP_MAX_STATIONS = int(os.getenv("AEMET_GROUP_MAX_STATIONS", 50))
+GROUP_MAX_BYTES = int(os.getenv("AEMET_GROUP_MAX_BYTES", 5_000_000))       # tamaño estimado de 'datos'
+GROUP_MAX_SECONDS = float(os.getenv("AEMET_GROUP_MAX_SECONDS", 15))        # por debajo del ReadTimeout (30 s)
+GROUP_MAX_URL_LENGTH = int(os.getenv("AEMET_GROUP_MAX_URL_LENGTH", 2000))
+GROUP_TARGET_DAYS = int(os.getenv("AEMET_GROUP_TARGET_DAYS", 365))         # días que se espera pedir por grupo
+
+# Estimaciones sin mediciones previas (un registro diario de la AEMET ocupa ~450 bytes)
+DEFAULT_BYTES_PER_DAY = 450
+DEFAULT_THROUGHPUT = 400_000  # bytes/s al descargar 'datos'
+# Solo las respuestas grandes miden el caudal (en las pequeñas domina la latencia fija)
+THROUGHPUT_MIN_BYTES = 100_000
+# Peso de las mediciones nuevas en la media móvil
+METRICS_SMOOTHING = 0.5
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+STATION_METRICS_PATH = os.path.join(_api_dir, 'json', 'station_metrics.json')
+
+# Longitud de la URL de valores/climatologicos/diarios sin los indicativos
+_BASE_URL_LENGTH = len(
+    f'{AEMET_BASE_URL}/valores/climatologicos/diarios/datos/'
+    'fechaini/2025-01-01T00%3A00%3A00UTC/fechafin/2025-12-31T00%3A00%3A00UTC/estacion/'
+)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def load_station_metrics():
+    '''
+    Devuelve las mediciones de station_metrics.json (se cargan una vez por proceso):
+    {"throughput": bytes/s, "stations": {indicativo: {bytes_per_day, samples, failures}}}
+    '''
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = {"throughput": None, "stations": {}}
+            if os.path.exists(STATION_METRICS_PATH):
+                try:
+                    with open(STATION_METRICS_PATH, 'r', encoding='utf-8') as f:
+                        _metrics = json.load(f)
+                except json.JSONDecodeError:
+                    logger.warning(f"❗ {STATION_METRICS_PATH} dañado. Se empieza sin mediciones")
+        return _metrics
+
+
+def _save_station_metrics():
+    '''Guarda las mediciones de forma atómica (llamar con _metrics_lock adquirido)'''
+    os.makedirs(os.path.dirname(STATION_METRICS_PATH), exist_ok=True)
+    tmp_path = STATION_METRICS_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_metrics, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, STATION_METRICS_PATH)
+
+
+def _smooth(previous, value):
+    return value if previous is None else previous + METRICS_SMOOTHING * (value - previous)
+
+
+def record_group_response(station_codes, days, records_by_station, payload_bytes, elapsed):
+    '''
+    Registra el tamaño y la latencia de la respuesta de un grupo.
+    Los bytes se reparten entre las estaciones según su número de registros;
+    la latencia solo actualiza el caudal global si la respuesta es grande.
+
+    Args:
+        station_codes: Lista de indicativos pedidos
+        days: Días del rango pedido
+        records_by_station: {indicativo: nº de registros recibidos}
+        payload_bytes: Tamaño de la respuesta de 'datos'
+        elapsed: Segundos de la petición de 'datos'
+    '''
+    if not station_codes or days <= 0:
+        return
+    metrics = load_station_metrics()
+    total_records = sum(records_by_station.values()) or 1
+
+    with _metrics_lock:
+        if payload_bytes >= THROUGHPUT_MIN_BYTES and elapsed > 0:
+            metrics['throughput'] = _smooth(metrics['throughput'], payload_bytes / elapsed)
+
+        for code in station_codes:
+            share = records_by_station.get(code, 0) / total_records
+            station = metrics['stations'].setdefault(code, {"failures": 0})
+            station['bytes_per_day'] = _smooth(station.get('bytes_per_day'), payload_bytes * share / days)
+            station['samples'] = station.get('samples', 0) + 1
+            # Un grupo que responde bien va recuperando el tamaño normal
+            station['failures'] = max(station.get('failures', 0) - 1, 0)
+        _save_station_metrics()
+
+
+def record_group_failure(station_codes):
+    '''Anota un fallo (timeout, respuesta inválida...) en cada estación del grupo'''
+    metrics = load_station_metrics()
+    with _metrics_lock:
+        for code in station_codes:
+            station = metrics['stations'].setdefault(code, {"failures": 0})
+            station['failures'] = station.get('failures', 0) + 1
+        _save_station_metrics()
+
+
+def default_bytes_per_day(stations):
+    '''Bytes/día para estaciones sin mediciones: la mediana de las estaciones medidas'''
+    known = [m['bytes_per_day'] for m in stations.values() if 'bytes_per_day' in m]
+    return statistics.median(known) if known else DEFAULT_BYTES_PER_DAY
+
+
+def estimate_station_bytes(code, stations, days=GROUP_TARGET_DAYS, default=DEFAULT_BYTES_PER_DAY):
+    '''
+    Bytes estimados de `days` días de una estación.
+    Cada fallo registrado duplica la estimación para que la estación acabe en grupos más pequeños.
+    '''
+    station = stations.get(code, {})
+    penalty = 2 ** min(station.get('failures', 0), 6)
+    return station.get('bytes_per_day', default) * days * penalty
+
+
+def build_fixed_groups(station_codes, group_size=GROUP_SIZE):
+    '''Grupos de group_size indicativos en el orden del inventario (comportamiento original)'''
+    return {
+        f"grupo_{i // group_size + 1}": ",".join(station_codes[i:i + group_size])
+        for i in range(0, len(station_codes), group_size)
+    }
+
+
+def build_adaptive_groups(
+    station_codes,
+    metrics=None,
+    days=GROUP_TARGET_DAYS,
+    max_bytes=GROUP_MAX_BYTES,
+    max_seconds=GROUP_MAX_SECONDS,
+    max_url_length=GROUP_MAX_URL_LENGTH,
+    max_stations=GROUP_MAX_STATIONS
+):
+    '''
+    Agrupa las estaciones por su coste medido (first-fit decreasing): las estaciones con mucho
+    histórico o con fallos van en grupos pequeños y las de pocos datos se juntan en grupos grandes.
+    Cada grupo respeta el tamaño estimado de la respuesta, su latencia (tamaño / caudal medido),
+    la longitud de la URL y el número máximo de estaciones.
+    '''
+    if metrics is None:
+        metrics = load_station_metrics()
+    stations = metrics.get('stations', {})
+
+    # La latencia estimada de un grupo es su tamaño entre el caudal medido
+    max_group_bytes = min(max_bytes, max_seconds * (metrics.get('throughput') or DEFAULT_THROUGHPUT))
+    default = default_bytes_per_day(stations)
+    costs = {code: estimate_station_bytes(code, stations, days, default) for code in station_codes}
+    ordered = sorted(station_codes, key=lambda code: costs[code], reverse=True)
+
+    # Cada grupo: [códigos, bytes, longitud de la URL]
+    groups = []
+    for code in ordered:
+        code_bytes = costs[code]
+        code_url = len(code) + 3  # '%2C' entre indicativos
+        for group in groups:
+            if (len(group[0]) < max_stations
+                    and group[1] + code_bytes <= max_group_bytes
+                    and group[2] + code_url <= max_url_length):
+                group[0].append(code)
+                group[1] += code_bytes
+                group[2] += code_url
+                break
+        else:
+            # Una estación que no cabe sola en los límites va en su propio grupo
+            groups.append([[code], code_bytes, _BASE_URL_LENGTH + code_url])
+
+    return {f"grupo_{i}": ",".join(group[0]) for i, group in enumerate(groups, 1)}
+
+
+def build_station_groups(station_codes, mode=GROUPING_MODE):
+    '''Agrupa los indicativos según el modo configurado ("fixed" o "adaptive")'''
+    if mode == "adaptive":
+        return build_adaptive_groups(station_codes)
+    if mode == "fixed":
+        return build_fixed_groups(station_codes)
+    raise ValueError(f"Modo de agrupación desconocido: {mode}")
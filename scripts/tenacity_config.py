@@ -5,17 +5,19 @@ from tenacity import (
     wait,
     wait_combine,
     wait_exponential,
-    retry_if_exception,
-    retry_if_exception_type,
     wait_random
 )
 from requests.exceptions import (
-    ConnectionError, Timeout, RequestException, HTTPError
+    ConnectionError, Timeout, ChunkedEncodingError, HTTPError
 )
 from http.client import RemoteDisconnected
 from xmlrpc.client import ProtocolError
+from dotenv import load_dotenv
+import os
+import time
 import socket
 import logging
+import threading
 
 # Configurar logging
 logging.basicConfig(
@@ -24,6 +26,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+load_dotenv()
+
+# Reintentos permitidos por ejecución (los 429 no cuentan: ya los espacian el pool de claves y el control AIMD)
+RETRY_BUDGET = int(os.getenv("AEMET_RETRY_BUDGET", 200))
+# Errores de servidor (5xx o fallos de red) seguidos que abren el circuito y segundos que queda abierto
+BREAKER_THRESHOLD = int(os.getenv("AEMET_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("AEMET_BREAKER_COOLDOWN", 30))
+# Cada sonda fallida duplica la pausa hasta este máximo
+BREAKER_MAX_COOLDOWN = 10 * BREAKER_COOLDOWN
+# Códigos 4xx que sí pueden resolverse reintentando
+RETRYABLE_4XX = {408, 429}
+# Solo se busca el 429 en el cuerpo JSON de las respuestas menores que esto (los avisos de la AEMET son pequeños)
+RATE_LIMIT_BODY_MAX = 2048
+
 
 class RateLimitException(Exception):
     """Excepción para errores de rate limiting con tiempo de espera."""
@@ -33,19 +49,174 @@ class RateLimitException(Exception):
         super().__init__(msg)
 
 def is_rate_limit_error(response):
-    '''Determina si la respuesta indica un error de rate limiting para hacer reintentos'''
+    '''
+    Determina si la respuesta indica un error de rate limiting para hacer reintentos.
+    El cuerpo solo se decodifica si ocupa menos de RATE_LIMIT_BODY_MAX bytes: las cargas de 'datos' no se leen dos veces.
+    '''
     if not hasattr(response, 'status_code'):
         return False
         
     if response.status_code == 429:
         return True
-        
+
+    if len(response.content or b'') >= RATE_LIMIT_BODY_MAX:
+        return False
+
     try:
         json_data = response.json()
         return json_data.get('estado') == 429 or json_data.get('status') == 429
     except (ValueError, AttributeError):
         return False
 
+def is_retryable_error(exc):
+    '''
+    Clasifica la excepción: los 429, los 5xx y los fallos de red transitorios se reintentan;
+    los 4xx permanentes (404 de un indicativo inexistente, 401 de una clave inválida...) no,
+    ni los errores de la propia petición (InvalidURL, MissingSchema, InvalidHeader...), que fallarían igual.
+    '''
+    if isinstance(exc, RateLimitException):
+        return True
+    if isinstance(exc, HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+        return status is None or status >= 500 or status in RETRYABLE_4XX
+    return isinstance(exc, (
+        ConnectionError, Timeout, ChunkedEncodingError, RemoteDisconnected, socket.gaierror, ProtocolError
+    ))
+
+
+class RetryBudget:
+    '''
+    Presupuesto global de reintentos de una ejecución, compartido por todos los hilos.
+    Agotado, los fallos van directamente al journal en lugar de seguir esperando.
+    '''
+    def __init__(self, limit=RETRY_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        with self._lock:
+            return self.used < self.limit
+
+    def spend(self):
+        with self._lock:
+            self.used += 1
+
+    def deny(self):
+        with self._lock:
+            self.denied += 1
+            first = self.denied == 1
+        if first:
+            logger.warning(f"💸 Presupuesto de reintentos agotado ({self.limit}). Los siguientes fallos van al journal")
+
+    def reset(self):
+        with self._lock:
+            self.used = 0
+            self.denied = 0
+
+
+class CircuitBreaker:
+    '''
+    Circuito compartido por todas las peticiones:
+        - cerrado: las peticiones pasan; BREAKER_THRESHOLD errores de servidor seguidos lo abren.
+        - abierto: todos los hilos esperan BREAKER_COOLDOWN segundos sin llamar a la API.
+        - semiabierto: pasa una única petición de prueba; si responde se cierra y si falla
+          se vuelve a abrir con el doble de pausa (hasta BREAKER_MAX_COOLDOWN).
+    '''
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.opened = 0
+        self.paused = 0.0
+        self._condition = threading.Condition()
+
+    def wait(self):
+        '''Bloquea mientras el circuito está abierto o hay una petición de prueba en vuelo'''
+        with self._condition:
+            while True:
+                if self.state == "closed":
+                    return
+                remaining = self.open_until - time.monotonic()
+                if self.state == "open" and remaining <= 0:
+                    self.state = "half_open"
+                    logger.info("🟡 Circuito semiabierto: enviando una petición de prueba")
+                    return
+                self._condition.wait(remaining if self.state == "open" else None)
+
+    def record_success(self):
+        with self._condition:
+            self.failures = 0
+            if self.state != "closed":
+                self.state = "closed"
+                self.cooldown = self.base_cooldown
+                logger.info("🟢 Circuito cerrado: la AEMET vuelve a responder")
+                self._condition.notify_all()
+
+    def record_failure(self):
+        with self._condition:
+            self.failures += 1
+            if self.state == "half_open":
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            elif self.state == "closed" and self.failures >= self.threshold:
+                self._open()
+
+    def _open(self):
+        '''Llamar con _condition adquirido'''
+        self.state = "open"
+        self.opened += 1
+        self.paused += self.cooldown
+        self.open_until = time.monotonic() + self.cooldown
+        self._condition.notify_all()
+        logger.warning(
+            f"🔴 Circuito abierto tras {self.failures} errores de servidor seguidos: "
+            f"pausa de {self.cooldown:.0f}s para todas las peticiones"
+        )
+
+    def stats(self):
+        with self._condition:
+            return {"state": self.state, "opened": self.opened, "paused": round(self.paused, 1)}
+
+
+_retry_budget = RetryBudget()
+_circuit_breaker = CircuitBreaker()
+
+
+def get_retry_budget():
+    '''Devuelve el presupuesto de reintentos compartido'''
+    return _retry_budget
+
+
+def get_circuit_breaker():
+    '''Devuelve el circuito compartido (lo consulta session_get antes de cada petición)'''
+    return _circuit_breaker
+
+
+def log_retry_stats():
+    '''Muestra en el log los reintentos gastados y las aperturas del circuito'''
+    budget, breaker = get_retry_budget(), get_circuit_breaker().stats()
+    logger.info(
+        f"🔁 Reintentos: {budget.used}/{budget.limit} | Denegados: {budget.denied} | "
+        f"Circuito abierto: {breaker['opened']} veces ({breaker['paused']:.0f}s en pausa)"
+    )
+    return {"retries": budget.used, "denied": budget.denied, **breaker}
+
+
+def should_retry(exc):
+    '''Reintenta si el error es recuperable y (salvo los 429) queda presupuesto'''
+    if not is_retryable_error(exc):
+        return False
+    if isinstance(exc, RateLimitException) or get_retry_budget().available():
+        return True
+    get_retry_budget().deny()
+    return False
+
 # Clase personalizada que hereda de wait.wait_base
 class wait_rate_limit(wait.wait_base):
     '''
@@ -68,25 +239,18 @@ class wait_rate_limit(wait.wait_base):
         return self.default_wait(retry_state)
 
 def custom_before_sleep(retry_state):
-    '''Configuración de mensaje personalizado en api_retry'''
+    '''Configuración de mensaje personalizado en api_retry (y gasto del presupuesto de reintentos)'''
     if retry_state.outcome.failed:
         exc = retry_state.outcome.exception()
+        if not isinstance(exc, RateLimitException):
+            get_retry_budget().spend()
         logger.warning(f"Reintentando después de {retry_state.next_action.sleep:.1f} segundos por {exc.__class__.__name__}...")
 
 # Decorador de tenacity para manejar los RateLimit y reintentar
 api_retry = retry(
     stop=stop_after_attempt(5),
     wait=wait_rate_limit(),
-    retry=(
-        retry_if_exception(lambda e: isinstance(e, RateLimitException)) |
-        retry_if_exception_type(ConnectionError) |
-        retry_if_exception_type(Timeout) |
-        retry_if_exception_type(RemoteDisconnected) |
-        retry_if_exception_type(RequestException) |
-        retry_if_exception_type(HTTPError) |
-        retry_if_exception_type(socket.gaierror) |
-        retry_if_exception_type(ProtocolError)
-    ),
+    retry=retry_if_exception(should_retry),
     before_sleep=custom_before_sleep,
     reraise=True
 )
\ No newline at end of file
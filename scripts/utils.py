@@ -6,6 +6,14 @@ from datetime import datetime
 import re
 from dotenv import load_dotenv
 from .verify_files import *
+from .http_session import session_get, AEMET_BASE_URL
+from .prediction_store import PREDICTION_DATA_PATH, load_prediction_data_dict, prediction_data_exists, town_key
+from .historical_store import HISTORICAL_STORAGE, WEATHER_DATA_PATH, WEATHER_DB_PATH, open_historical_store
+from .station_grouping import GROUPING_MODE, build_station_groups
+from .watermarks import clear_watermarks
+from .error_journal import append_journal_entry, iter_journal, journal_path
+from .http_cache import cache_get, cache_put
+from .progress_index import load_index, rebuild_index
 
 # Configurar logging
 logging.basicConfig(
@@ -16,28 +24,31 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-def obtain_and_group_stations_codes():
-    '''Función para obtener los códigos EMA desde la API, hacer grupos de 25 códigos y almacenarlos en archivos JSON'''
+def obtain_and_group_stations_codes(mode=GROUPING_MODE):
+    '''
+    Función para obtener los códigos EMA desde la API, agruparlos y almacenarlos en archivos JSON.
+    mode="fixed" hace grupos de 25 códigos; mode="adaptive" los agrupa según las mediciones de station_metrics.json
+    '''
     script_dir = os.path.dirname(os.path.abspath(__file__))
     api_dir = os.path.dirname(script_dir)
     ema_codes_route = os.path.join(api_dir, 'json', 'ema_codes.json')
     ema_codes_grouped = os.path.join(api_dir, 'json', 'codes_group.json')
 
-    api_key = os.getenv("AEMET_API_KEY")
-    all_stations_url = "https://opendata.aemet.es/opendata/api/valores/climatologicos/inventarioestaciones/todasestaciones"
+    all_stations_url = f"{AEMET_BASE_URL}/valores/climatologicos/inventarioestaciones/todasestaciones"
     
-    headers = {
-        'accept': 'application/json',
-        'api_key': api_key,
-        'cache-control': 'no-cache'
-    }
     try:
-        # Obtengo el código EMA de las Estaciones y las almaceno en un json
-        response = requests.get(all_stations_url, headers=headers).json()
-        if response.get('estado') == 200:
+        # Obtengo el código EMA de las Estaciones y las almaceno en un json (headers en la sesión compartida)
+        # El inventario cambia poco: mientras esté vigente en la caché no se pide a la API
+        data = cache_get(all_stations_url)
+        if data is None:
+            response = session_get(all_stations_url).json()
+            if response.get('estado') != 200:
+                raise requests.RequestException(f"{response.get('descripcion')}")
             data_url = response.get('datos')
-            data = requests.get(data_url).json()
+            data = session_get(data_url, keyed=False).json()
+            cache_put(all_stations_url, data)
 
+        if data:
             # Creo el diccionario con la estructura deseada
             station_dict = {station['nombre']: station['indicativo'] for station in data}
 
@@ -45,25 +56,19 @@ def obtain_and_group_stations_codes():
             with open(ema_codes_route, 'w', encoding='utf-8') as f:
                 json.dump(station_dict, f, ensure_ascii=False, indent=4)
 
-            # Con los datos obtenidos, se crea un nuevo json donde se forman los grupos de 25
-            new_grouped_dict = {}
-            group_size = 25
-            ema_codes = list(station_dict.values())
-
-            for i in range(0, len(ema_codes), group_size):
-                start = i
-                end = min(i + group_size, len(ema_codes))
-                values_group = ema_codes[start:end]
-                key = f"grupo_{i // group_size + 1}"
-                new_grouped_dict[key] = ",".join(values_group)
+            # Con los datos obtenidos, se crea un nuevo json con los grupos de estaciones
+            new_grouped_dict = build_station_groups(list(station_dict.values()), mode)
 
             with open(ema_codes_grouped, 'w', encoding='utf-8') as f:
                         json.dump(new_grouped_dict, f, ensure_ascii=False, indent=4)
 
+            # Las marcas de agua son por grupo: con grupos nuevos se recalculan desde los datos guardados
+            clear_watermarks()
+
             logger.info(f"Datos guardados correctamente en {ema_codes_route}")
-            logger.info(f"Grupos de 25 códigos creados correctamente en {ema_codes_grouped}")
+            logger.info(f"{len(new_grouped_dict)} grupos ({mode}) creados correctamente en {ema_codes_grouped}")
         else:
-            raise requests.RequestException(f"{response.get('descripcion')}")
+            raise requests.RequestException("Inventario de estaciones vacío")
 
     except requests.RequestException as e:
         logger.error(f'Error al realizar la consulta: {e}')
@@ -82,55 +87,52 @@ def date_validation(date_str: str):
     except ValueError:
         return False, "Fecha inválida. Por favor, ingrese una fecha correcta."
     
-def re_fetch_errors_journal():
-    '''Función para obtener los url de error_journal/errors.json'''
-    try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        api_dir = os.path.dirname(script_dir)
-        errors_log_dir = os.path.join(api_dir, 'error_journal', 'errors.json')
-        error_data = verify_json_docs(errors_log_dir, message="No esta creado errors.json")
-        url_to_fetch = []
-
-        for i in range(len(error_data)):
-            response = error_data[i].get("server_response", "no_data")
-            url_to_fetch.append(response[response.index("http"):len(response)])
-        return url_to_fetch
-    except ValueError as e:
-        logger.error(f"Error al cargar errors.json {str(e)}")
-
-def build_journal(name, codes_group, server_response, fetched_url, fetched_date):
-    '''Función para crear un JSON que registra los errores al hacer fetch al API'''
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    api_dir = os.path.dirname(script_dir)
-    error_journal_dir = os.path.join(api_dir, 'error_journal', f'{name}.json')
+# URL dentro del texto de un error ("... for url: https://opendata.aemet.es/...")
+_URL_PATTERN = re.compile(r"https?://[^\s'\"<>)]+")
+
+def journal_entry_url(entry):
+    '''
+    URL que hay que volver a pedir para una entrada del journal: la petición original si se registró,
+    la URL que aparece en server_response o la URL de 'datos'. None si no hay ninguna.
+    '''
+    if str(entry.get("request_url", "")).startswith("http"):
+        return entry["request_url"]
+
+    match = _URL_PATTERN.search(str(entry.get("server_response", "")))
+    if match:
+        return match.group(0)
 
-    os.makedirs(os.path.dirname(error_journal_dir), exist_ok=True)
+    url = str(entry.get("url", ""))
+    return url if url.startswith("http") else None
 
+def re_fetch_errors_journal():
+    '''Función para obtener los url (sin repetir) de error_journal/errors.jsonl, leído como stream'''
+    url_to_fetch = {}
+    for entry in iter_journal("errors"):
+        url = journal_entry_url(entry)
+        if url:
+            url_to_fetch[url] = None
+    return list(url_to_fetch)
+
+def build_journal(name, codes_group, server_response, fetched_url, fetched_date, request_url=None):
+    '''
+    Función que registra los errores al hacer fetch al API en error_journal/<name>.jsonl.
+    Cada error es una línea nueva (sin reescribir el archivo) y no se repiten entradas con el mismo código y petición.
+    request_url guarda la petición original para poder repetirla desde el journal.
+    '''
     json_format = {
         "station_code": codes_group,
         "url": fetched_url,
         "server_response": str(server_response),
         "fetched_date": fetched_date
     }
+    if request_url:
+        json_format["request_url"] = request_url
 
-    try:
-        # Verificar si el archivo existe y cargar datos (o lista vacía si no existe)
-        existing_data = verify_json_docs(
-            error_journal_dir,
-            "No existe el archivo de errores. Se creará uno nuevo."
-        )
-        if not isinstance(existing_data, list):
-            existing_data = []
-        existing_data.append(json_format)
-    except ValueError:
-        # Si el archivo no existe, empezar con una lista nueva
-        existing_data = [json_format]
-    
-    # Guardar los datos actualizados
-    with open(error_journal_dir, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, ensure_ascii=False, indent=4)
-    
-    logger.info(f"No se recibieron datos válidos. Ver --> {error_journal_dir}")
+    if append_journal_entry(name, json_format):
+        logger.info(f"No se recibieron datos válidos. Ver --> {journal_path(name)}")
+    else:
+        logger.info(f"No se recibieron datos válidos. Ya registrado en --> {journal_path(name)}")
     return None
 
 def build_url(
@@ -143,13 +145,13 @@ def build_url(
 
     if encoded_init_date != None and encoded_end_date != None and stations_codes != None:
         weather_values_url = (
-                f'https://opendata.aemet.es/opendata/api/valores/climatologicos/diarios/datos/'
+                f'{AEMET_BASE_URL}/valores/climatologicos/diarios/datos/'
                 f'fechaini/{encoded_init_date}/fechafin/{encoded_end_date}/estacion/{stations_codes}'
             )
         return(weather_values_url)
     elif town_code != None:
         weather_values_url = (
-                f'https://opendata.aemet.es/opendata/api/prediccion/especifica/municipio/diaria/{town_code}'
+                f'{AEMET_BASE_URL}/prediccion/especifica/municipio/diaria/{town_code}'
             )
         return(weather_values_url)
     
@@ -168,6 +170,33 @@ def format_historical_weather_data(station_data):
                 
     }
 
+def group_historical_records(data):
+    '''
+    Agrupa en una sola pasada los registros diarios de la AEMET por indicativo.
+    Devuelve un registro por estación con solo sus propias fechas.
+    '''
+    grouped = {}
+    for day_data in data:
+        if not isinstance(day_data, dict):
+            continue
+
+        station_code = day_data.get('indicativo', 'no_data')
+        station_info = grouped.get(station_code)
+        if station_info is None:
+            station_info = grouped[station_code] = {
+                "town_code": station_code,
+                "province": day_data.get('provincia', 'no_data'),
+                "town": day_data.get('nombre', 'no_data'),
+                "date": {}
+            }
+
+        date = day_data.get('fecha', 'no_data')
+        station_info["date"][date] = {
+            date: format_historical_weather_data(day_data)
+        }
+
+    return list(grouped.values())
+
 def format_prediction_weather_data(day_data):
     '''Función para dar formato al JSON de los valores de previsión'''
     return {
@@ -193,25 +222,27 @@ def check_missing_town_codes():
         json_dir = os.path.join(api_dir, 'json')
         
         towns_codes_path = os.path.join(json_dir, 'towns_codes.json')
-        prediction_data_path = os.path.join(json_dir, 'prediction_data.json')
         output_path = os.path.join(json_dir, 'pending_towns_codes.json')
 
         # cargamos towns_codes.json
         towns_codes = verify_json_docs(json_path_dir=towns_codes_path, message="No existe el archivo towns_codes.json")
         logger.info(f"✅ Cargados los {len(towns_codes)} codigos de pueblos de towns_codes.json")
         
-        # Cargamos prediction_data.json
-        prediction_data = verify_json_docs(json_path_dir=prediction_data_path, message="No existe el archivo prediction_data.json")
-        logger.info(f"✅ Cargados {len(prediction_data)} registros en prediction_data.json")
+        if not prediction_data_exists():
+            raise ValueError("No existe el archivo prediction_data.json")
 
-        # Extraemos los IDS existentes de prediction_data.json
-        existing_codes = [entry['id'] for entry in prediction_data if 'id' in entry]
+        # IDs ya guardados según el índice de progreso (prediction_data.json.idx), sin decodificar los datos.
+        # Si el índice no existe se construye una vez leyendo prediction_data.json (incluido el log de segmentos)
+        existing_codes = load_index(PREDICTION_DATA_PATH)
+        if existing_codes is None:
+            existing_codes = rebuild_index(PREDICTION_DATA_PATH, load_prediction_data_dict().keys())
+        logger.info(f"✅ {len(existing_codes)} municipios guardados en prediction_data.json")
         
         # Generamos el diccionario de los codigos pendientes, que no se encuentran en prediction_data.json
-        pending_towns = {}
-        for code, town in towns_codes.items():
-            if int(code) not in existing_codes:
-                pending_towns[code] = town
+        pending_towns = {
+            code: town for code, town in towns_codes.items()
+            if town_key(code) not in existing_codes
+        }
 
         logger.info(f"Pendientes {len(pending_towns)} municipios en total")
 
@@ -226,9 +257,9 @@ def check_missing_town_codes():
         logger.error(f"Error: {str(e)}")
         return None
     
-def check_missing_group_codes():
+def check_missing_group_codes(storage=HISTORICAL_STORAGE):
     """
-    Función que compara los códigos de los grupos entre codes_group.json y weather_data.json
+    Función que compara los códigos de los grupos entre codes_group.json y weather_data.json (o weather_data.db)
     y genera una lista de los grupos pendientes en pending_group_codes.json
     """
     try:
@@ -238,7 +269,6 @@ def check_missing_group_codes():
         json_dir = os.path.join(api_dir, 'json')
         
         codes_group_path = os.path.join(json_dir, 'codes_group.json')
-        weather_data_path = os.path.join(json_dir, 'weather_data.json')
         output_path = os.path.join(json_dir, 'pending_group_codes.json')
 
         # Cargar codes_group.json
@@ -246,17 +276,21 @@ def check_missing_group_codes():
                                      message="No existe el archivo codes_group.json")
         logger.info(f"✅ Cargados {len(codes_group)} grupos de estaciones de codes_group.json")
         
-        # Cargar weather_data.json (si existe)
-        weather_data = {}
-        if os.path.exists(weather_data_path):
-            weather_data = verify_json_docs(json_path_dir=weather_data_path, 
-                                          message="")
-            logger.info(f"✅ Cargados {len(weather_data)} estaciones en weather_data.json")
+        # Extraer códigos de estaciones existentes en weather_data.json / weather_data.db (si existe)
+        existing_codes = set()
+        data_path = WEATHER_DB_PATH if storage == "sqlite" else WEATHER_DATA_PATH
+        if os.path.exists(data_path):
+            # Indicativos guardados según el índice de progreso (<archivo>.idx), sin abrir los datos
+            existing_codes = load_index(data_path)
+            if existing_codes is None:
+                store = open_historical_store(storage)
+                try:
+                    existing_codes = rebuild_index(data_path, store.station_codes())
+                finally:
+                    store.close()
+            logger.info(f"✅ Cargadas {len(existing_codes)} estaciones en {os.path.basename(data_path)}")
         else:
-            logger.info("ℹ️ No existe weather_data.json, todos los grupos se consideran pendientes")
-
-        # Extraer códigos de estaciones existentes en weather_data.json
-        existing_codes = set(weather_data.keys())
+            logger.info(f"ℹ️ No existe {os.path.basename(data_path)}, todos los grupos se consideran pendientes")
 
         # Determinar qué grupos tienen estaciones pendientes
         pending_groups = {}
@@ -1,6 +1,7 @@
 import logging
 import json
 import os
+import re
 
 # Configurar logging
 logging.basicConfig(
@@ -16,4 +17,89 @@ def verify_json_docs(json_path_dir:str, message: str):
             json_info = json.load(f)
             return json_info
     else: 
-        raise ValueError(message)
\ No newline at end of file
+        raise ValueError(message)
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Caracteres que pueden continuar un número JSON
+_NUMBER_CONTINUATION = frozenset('0123456789.eE+-')
+
+def iter_json_object_items(json_path_dir: str, message: str, chunk_size: int = 1 << 16):
+    '''
+    Recorre un JSON cuyo nivel superior es un objeto devolviendo (clave, valor) de uno en uno.
+    Lee el archivo por bloques, así la memoria queda acotada por el mayor de los valores.
+    '''
+    if not os.path.exists(json_path_dir):
+        raise ValueError(message)
+
+    decoder = json.JSONDecoder()
+
+    with open(json_path_dir, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def fill(size=chunk_size):
+            '''Descarta lo ya procesado y añade el siguiente bloque al buffer'''
+            nonlocal buffer, pos, eof
+            chunk = f.read(size)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def next_char():
+            '''Salta los espacios y devuelve el siguiente carácter significativo (sin consumirlo)'''
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE.match(buffer, pos).end()
+                if pos < len(buffer):
+                    return buffer[pos]
+                if eof:
+                    raise ValueError(f"JSON incompleto en {json_path_dir}")
+                fill()
+
+        def decode():
+            '''Decodifica el siguiente valor, leyendo más bloques si está cortado'''
+            nonlocal pos
+            size = chunk_size
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # Un número cortado por el bloque se decodifica como su prefijo ('12' de '12.5', '1' de '1e3'):
+                    # si acaba al final del buffer o le sigue algo que lo continúa, hay que leer más
+                    truncated = (
+                        isinstance(value, (int, float)) and not isinstance(value, bool)
+                        and (end == len(buffer) or buffer[end] in _NUMBER_CONTINUATION)
+                    )
+                    if eof or (end < len(buffer) and not truncated):
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill(size)
+                size *= 2
+
+        if next_char() != '{':
+            raise ValueError(f"{json_path_dir} no contiene un objeto JSON")
+        pos += 1
+
+        if next_char() == '}':
+            return
+
+        while True:
+            next_char()
+            key = decode()
+            if next_char() != ':':
+                raise ValueError(f"JSON mal formado en {json_path_dir}")
+            pos += 1
+            next_char()
+            value = decode()
+            yield key, value
+
+            separator = next_char()
+            pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"JSON mal formado en {json_path_dir}")
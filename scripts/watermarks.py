@@ -0,0 +1,86 @@
+import os
+import json
+import logging
+import threading
+from datetime import date, timedelta
+from dotenv import load_dotenv
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s --> %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Días que se vuelven a pedir por detrás de la marca (0 = solo los días que faltan)
+HISTORICAL_OVERLAP_DAYS = int(os.getenv("AEMET_HISTORICAL_OVERLAP_DAYS", 0))
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+_api_dir = os.path.dirname(_script_dir)
+WATERMARKS_PATH = os.path.join(_api_dir, 'json', 'historical_watermarks.json')
+
+_watermarks_lock = threading.Lock()
+
+
+def load_watermarks(path=WATERMARKS_PATH):
+    '''Devuelve {grupo: última fecha almacenada (YYYY-MM-DD)} o un diccionario vacío si no existe'''
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        logger.warning(f"❗ {path} dañado. Las marcas se recalcularán desde los datos almacenados")
+        return {}
+
+
+def save_watermarks(watermarks, path=WATERMARKS_PATH):
+    '''Guarda las marcas de agua de forma atómica (archivo temporal + replace)'''
+    with _watermarks_lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(watermarks, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def clear_watermarks(path=WATERMARKS_PATH):
+    '''Elimina las marcas de agua (al regenerar los datos históricos desde cero)'''
+    with _watermarks_lock:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def group_watermark(group, station_codes, store, watermarks):
+    '''
+    Última fecha completa de un grupo de estaciones.
+    Usa la marca guardada; si no existe, la calcula desde el almacenamiento como la menor
+    de las últimas fechas de las estaciones que tienen datos (las que nunca publican no la frenan).
+    None (rango completo desde el inicio) si ninguna estación del grupo tiene datos.
+    '''
+    if group in watermarks:
+        return watermarks[group]
+
+    last_dates = [last_date for last_date in map(store.station_last_date, station_codes) if last_date]
+    return min(last_dates) if last_dates else None
+
+
+def result_watermark(result, station_codes, end_date, failed_codes=()):
+    '''
+    Marca de agua de una respuesta agrupada correcta: la menor de las últimas fechas de las estaciones pedidas,
+    para que una estación que publica con retraso vuelva a pedirse en la siguiente ejecución.
+    Una estación que no aparece en la respuesta no tiene datos hasta end_date (YYYY-MM-DD): cuenta como al día.
+    None si alguna estación se quedó fuera por un error (failed_codes): su hueco no se debe saltar.
+    '''
+    if not station_codes or set(failed_codes) & set(station_codes):
+        return None
+    last_dates = {station.get('town_code'): max(station['date']) for station in result if station.get('date')}
+    return min(last_dates.get(code, end_date) for code in station_codes)
+
+
+def incremental_start_date(watermark, overlap_days=HISTORICAL_OVERLAP_DAYS):
+    '''Primer día que hay que pedir a partir de la marca de agua (YYYY-MM-DD)'''
+    start = date.fromisoformat(watermark[:10]) + timedelta(days=1 - overlap_days)
+    return start.isoformat()
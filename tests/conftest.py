@@ -0,0 +1,19 @@
+import pytest
+from scripts import error_journal
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    '''Journals en un directorio temporal, sin las claves cargadas por otros tests'''
+    monkeypatch.setattr(error_journal, "ERROR_JOURNAL_DIR", str(tmp_path / "error_journal"))
+    monkeypatch.setattr(error_journal, "_journal_keys", {})
+    return tmp_path / "error_journal"
+
+
+@pytest.fixture
+def station_metrics(tmp_path, monkeypatch):
+    '''station_metrics.json en un directorio temporal (lo escriben los fallos y respuestas de grupos)'''
+    from scripts import station_grouping
+    monkeypatch.setattr(station_grouping, "STATION_METRICS_PATH", str(tmp_path / "station_metrics.json"))
+    monkeypatch.setattr(station_grouping, "_metrics", None)
+    return station_grouping
@@ -0,0 +1,31 @@
+import threading
+import time
+from scripts.async_engine import run_ordered
+
+
+def test_results_are_delivered_in_order():
+    delivered = []
+    run_ordered(
+        [3, 1, 2, 0], lambda n: time.sleep(n / 100) or n * 10, lambda item, result: delivered.append((item, result)),
+        concurrency=4
+    )
+    assert delivered == [(3, 30), (1, 10), (2, 20), (0, 0)]
+
+
+def test_concurrency_above_the_default_executor_limit_is_honoured():
+    concurrency = 48   # más que min(32, CPUs + 4), el máximo del pool por defecto del loop
+    lock = threading.Lock()
+    everyone_in = threading.Barrier(concurrency, timeout=5)
+    peak = {"in_flight": 0, "max": 0}
+
+    def worker(item):
+        with lock:
+            peak["in_flight"] += 1
+            peak["max"] = max(peak["max"], peak["in_flight"])
+        everyone_in.wait()   # solo pasa si los 48 están en vuelo a la vez
+        with lock:
+            peak["in_flight"] -= 1
+        return item
+
+    run_ordered(list(range(concurrency)), worker, lambda item, result: None, concurrency=concurrency)
+    assert peak["max"] == concurrency
@@ -0,0 +1,62 @@
+import re
+import pytest
+import requests
+from scripts import backfill, fetch_station_data, scriptv3
+from scripts.error_journal import iter_journal
+from scripts.historical_store import JSONHistoricalStore
+
+_WINDOW = re.compile(r'fechaini/(\d{4}-\d{2}-\d{2})')
+
+
+class FakeAemet:
+    '''api_request simulada: las ventanas que empiezan en `failing` fallan en los metadatos'''
+    def __init__(self, failing):
+        self.failing = set(failing)
+        self.requested = []
+
+    def __call__(self, url, headers=None, timeout=None, stats=None, keyed=True):
+        if url.startswith("datos://"):
+            day = url[len("datos://"):]
+            return [{"indicativo": code, "fecha": day, "tmed": "10,0"} for code in ("A", "B")]
+        window_start = _WINDOW.search(url).group(1)
+        self.requested.append(window_start)
+        if window_start in self.failing:
+            raise requests.ConnectionError("servidor caído")
+        return {"estado": 200, "datos": f"datos://{window_start}"}
+
+
+@pytest.fixture
+def backfill_env(tmp_path, monkeypatch, journal_dir, station_metrics):
+    store_path = str(tmp_path / "weather_data.json")
+    monkeypatch.setattr(backfill, "verify_json_docs", lambda **_: {"grupo_1": "A,B"})
+    monkeypatch.setattr(backfill, "open_historical_store", lambda storage: JSONHistoricalStore(store_path))
+    monkeypatch.setattr(backfill, "load_watermarks", lambda: {})
+    monkeypatch.setattr(backfill, "save_watermarks", lambda watermarks: None)
+    monkeypatch.setattr(
+        scriptv3, "open_historical_store", lambda storage, must_exist=False: JSONHistoricalStore(store_path)
+    )
+    monkeypatch.setattr(fetch_station_data, "api_key_configured", lambda: True)
+    return store_path
+
+
+def test_every_failed_window_is_journaled_and_replayed(backfill_env, monkeypatch):
+    aemet = FakeAemet(failing={"2025-01-01", "2025-01-21"})
+    monkeypatch.setattr(fetch_station_data, "api_request", aemet)
+
+    summary = backfill.backfill_historical("2025-01-01", "2025-01-30", storage="json", window_days=10, concurrency=1)
+
+    assert sorted(start for _, start, _ in summary["failed_windows"]) == ["2025-01-01", "2025-01-21"]
+    journaled = sorted(_WINDOW.search(entry["request_url"]).group(1) for entry in iter_journal("errors"))
+    assert journaled == ["2025-01-01", "2025-01-21"]
+
+    # La AEMET vuelve: la recuperación pide las dos ventanas y las quita del journal
+    aemet.failing.clear()
+    aemet.requested.clear()
+    replay = scriptv3.data_from_error_journal(storage="json", concurrency=1)
+
+    assert sorted(aemet.requested) == ["2025-01-01", "2025-01-21"]
+    assert replay["recovered"] == 2
+    assert list(iter_journal("errors")) == []
+    assert JSONHistoricalStore(backfill_env).station_dates("A") == {
+        "2025-01-01", "2025-01-11", "2025-01-21"
+    }
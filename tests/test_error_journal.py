@@ -0,0 +1,36 @@
+from scripts.error_journal import iter_journal
+from scripts.journal_replay import replay_journal
+from scripts.utils import build_journal, journal_entry_url
+
+WINDOW_1 = "https://opendata.aemet.es/opendata/api/valores/climatologicos/diarios/datos/fechaini/2025-01-01/fechafin/2025-01-31/estacion/A%2CB"
+WINDOW_2 = "https://opendata.aemet.es/opendata/api/valores/climatologicos/diarios/datos/fechaini/2025-02-01/fechafin/2025-02-28/estacion/A%2CB"
+
+
+def journal_failure(request_url, url="URL no disponible"):
+    build_journal("errors", "A%2CB", "timeout", url, "2025-04-10T00:00:00+00:00", request_url=request_url)
+
+
+def test_failed_windows_of_one_group_are_kept_apart(journal_dir):
+    journal_failure(WINDOW_1)
+    journal_failure(WINDOW_2)
+    journal_failure(WINDOW_1)
+    assert [entry["request_url"] for entry in iter_journal("errors")] == [WINDOW_1, WINDOW_2]
+
+
+def test_entries_without_request_url_are_keyed_on_url(journal_dir):
+    journal_failure(None, url="https://opendata.aemet.es/opendata/sh/1")
+    journal_failure(None, url="https://opendata.aemet.es/opendata/sh/2")
+    journal_failure(None, url="https://opendata.aemet.es/opendata/sh/1")
+    assert len(list(iter_journal("errors"))) == 2
+
+
+def test_replay_requests_every_failed_window(journal_dir):
+    journal_failure(WINDOW_1)
+    journal_failure(WINDOW_2)
+    stored = []
+
+    summary = replay_journal("errors", journal_entry_url, lambda url: [url], lambda url, result: stored.append(url))
+
+    assert sorted(stored) == [WINDOW_1, WINDOW_2]
+    assert summary["recovered"] == 2
+    assert list(iter_journal("errors")) == []
@@ -0,0 +1,39 @@
+import requests
+import pytest
+from scripts import fetch_station_data
+from scripts.error_journal import iter_journal
+
+
+@pytest.fixture
+def aemet_down(monkeypatch, journal_dir, station_metrics):
+    '''Todas las peticiones de metadatos fallan'''
+    def api_request(url, **_):
+        raise requests.ConnectionError("servidor caído")
+    monkeypatch.setattr(fetch_station_data, "api_request", api_request)
+    monkeypatch.setattr(fetch_station_data, "api_key_configured", lambda: True)
+    return station_metrics
+
+
+def failures(station_grouping, codes):
+    stations = station_grouping.load_station_metrics()['stations']
+    return {code: stations.get(code, {}).get('failures', 0) for code in codes}
+
+
+def test_adaptive_split_counts_one_failure_per_station(aemet_down):
+    codes = ["A", "B", "C", "D"]
+    failed = []
+    result = fetch_station_data.fetch_historical_group(
+        "2025-01-01T00%3A00%3A00UTC", "2025-01-31T00%3A00%3A00UTC", codes, split_on_failure=True, failed=failed
+    )
+
+    assert result is None
+    assert sorted(failed) == codes
+    assert failures(aemet_down, codes) == {code: 1 for code in codes}
+    assert sorted(entry["station_code"] for entry in iter_journal("errors")) == codes
+
+
+def test_fixed_group_failure_is_counted_once(aemet_down):
+    fetch_station_data.fetch_historical_group(
+        "2025-01-01T00%3A00%3A00UTC", "2025-01-31T00%3A00%3A00UTC", ["A", "B"], split_on_failure=False
+    )
+    assert failures(aemet_down, ["A", "B"]) == {"A": 1, "B": 1}
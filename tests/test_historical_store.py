@@ -0,0 +1,112 @@
+import pytest
+
+from scripts import progress_index
+from scripts.historical_store import JSONHistoricalStore, SQLiteHistoricalStore
+
+
+def station(code, values_by_date):
+    return {
+        "town_code": code, "province": "MADRID", "town": "RETIRO",
+        "date": {date: {date: values} for date, values in values_by_date.items()}
+    }
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def open_store(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_index, '_indexes', {})
+    monkeypatch.setattr(progress_index, '_stamps', {})
+    opened = []
+
+    def _open(fresh=False, must_exist=False):
+        if request.param == "json":
+            store = JSONHistoricalStore(str(tmp_path / 'weather_data.json'), fresh=fresh, must_exist=must_exist)
+        else:
+            store = SQLiteHistoricalStore(str(tmp_path / 'weather_data.db'), fresh=fresh, must_exist=must_exist)
+        opened.append(store)
+        return store
+
+    yield _open
+    for store in opened:
+        try:
+            store.close()
+        except Exception:
+            pass
+
+
+def reopen(store, open_store, **kwargs):
+    store.close()
+    return open_store(**kwargs)
+
+
+def test_merge_adds_only_new_dates(open_store):
+    store = open_store()
+    assert store.merge_station(station("3195", {"2025-01-01": {"tmed": "1"}}), now="t1") == 1
+    assert store.merge_station(
+        station("3195", {"2025-01-01": {"tmed": "9"}, "2025-01-02": {"tmed": "2"}}), now="t2"
+    ) == 1
+    store.commit()
+
+    store = reopen(store, open_store)
+    days = store["3195"]["date"]
+    assert days["2025-01-01"]["values"] == {"2025-01-01": {"tmed": "1"}}
+    assert days["2025-01-02"]["ts_insert"] == "t2"
+    assert store.station_last_date("3195") == "2025-01-02"
+    assert store.station_dates("3195") == {"2025-01-01", "2025-01-02"}
+
+
+def test_overwrite_keeps_ts_insert(open_store):
+    store = open_store()
+    store.merge_station(station("3195", {"2025-01-01": {"tmed": "1"}}), now="t1")
+    assert store.merge_station(station("3195", {"2025-01-01": {"tmed": "5"}}), now="t2", overwrite=True) == 1
+    store.commit()
+
+    store = reopen(store, open_store)
+    day = store["3195"]["date"]["2025-01-01"]
+    assert day["values"] == {"2025-01-01": {"tmed": "5"}}
+    assert (day["ts_insert"], day["ts_update"]) == ("t1", "t2")
+
+
+def test_fresh_starts_empty_and_resets_ts_insert(open_store):
+    store = open_store()
+    store.merge_station(station("3195", {"2025-01-01": {"tmed": "1"}}), now="t1")
+    store.merge_station(station("0076", {"2025-01-01": {"tmed": "3"}}), now="t1")
+    store.commit()
+
+    store = reopen(store, open_store, fresh=True)
+    assert store.station_codes() == set()
+    assert "3195" not in store
+    store.merge_station(station("3195", {"2025-01-01": {"tmed": "2"}}), now="t2")
+    store.commit()
+
+    store = reopen(store, open_store)
+    assert store.station_codes() == {"3195"}
+    assert store["3195"]["date"]["2025-01-01"]["ts_insert"] == "t2"
+    assert progress_index.load_index(store.path) == {"3195"}
+
+
+def test_fresh_keeps_previous_data_until_commit(open_store, monkeypatch):
+    store = open_store()
+    store.merge_station(station("3195", {"2025-01-01": {"tmed": "1"}}), now="t1")
+    store.commit()
+    store.close()
+
+    # Una ejecución desde cero que falla antes de guardar nada no borra los datos anteriores
+    fresh = open_store(fresh=True)
+    if isinstance(fresh, SQLiteHistoricalStore):
+        fresh.conn.close()
+
+    store = open_store()
+    assert store.station_codes() == {"3195"}
+
+
+def test_must_exist(open_store):
+    with pytest.raises(ValueError):
+        open_store(must_exist=True)
+
+
+def test_unknown_station(open_store):
+    store = open_store()
+    assert store.station_last_date("9999") is None
+    assert store.station_dates("9999") == set()
+    with pytest.raises(KeyError):
+        store["9999"]
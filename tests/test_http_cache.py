@@ -0,0 +1,25 @@
+from scripts.http_cache import ResponseCache
+
+INVENTORY_URL = "https://opendata.aemet.es/opendata/api/valores/climatologicos/inventarioestaciones/todasestaciones"
+
+
+def test_hit_returns_original_fetch_time(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put(INVENTORY_URL, [{"indicativo": "3195"}], fetched=1700000000.0)
+    assert cache.get_entry(INVENTORY_URL) == ([{"indicativo": "3195"}], 1700000000.0)
+    assert cache.get(INVENTORY_URL) == [{"indicativo": "3195"}]
+
+
+def test_fetch_time_survives_reopening(tmp_path):
+    ResponseCache(str(tmp_path)).put(INVENTORY_URL, [1], fetched=1700000000.0)
+    assert ResponseCache(str(tmp_path)).get_entry(INVENTORY_URL)[1] == 1700000000.0
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    urls = [f"{INVENTORY_URL}?page={i}" for i in range(3)]
+    for url in urls:
+        cache.put(url, ["x" * 100])
+    assert cache.get(urls[0]) is None
+    assert cache.get(urls[2]) == ["x" * 100]
+    assert cache.stats()["bytes"] <= 250
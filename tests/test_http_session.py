@@ -0,0 +1,56 @@
+import pytest
+import requests
+from scripts import http_session, key_pool
+
+
+class FakeResponse:
+    status_code = 200
+    content = b'{"estado": 200}'
+    headers = {}
+
+
+@pytest.fixture
+def sent_headers(monkeypatch):
+    '''Sesión con la clave "pool-key" que anota las cabeceras de cada petición; restaura la sesión y el pool'''
+    monkeypatch.setattr(key_pool, "_pool", key_pool._pool)
+    monkeypatch.setattr(http_session, "_session", http_session._session)
+    session = http_session.configure_session(api_key="pool-key")
+    sent = []
+
+    def fake_get(url, headers=None, timeout=None):
+        # Cabeceras que saldrían de verdad: las de la sesión combinadas con las de la petición
+        sent.append(session.prepare_request(requests.Request('GET', url, headers=headers)).headers)
+        return FakeResponse()
+
+    monkeypatch.setattr(session, "get", fake_get)
+    yield sent
+    session.close()
+
+
+def test_session_defaults_carry_no_key(sent_headers):
+    assert 'api_key' not in http_session.get_session().headers
+
+
+def test_metadata_requests_take_the_key_from_the_pool(sent_headers):
+    http_session.session_get("http://localhost/metadatos")
+    assert sent_headers[0]['api_key'] == "pool-key"
+    assert key_pool.get_key_pool().stats()[0]['requests'] == 1
+
+
+@pytest.mark.parametrize("datos_rate_limited", [True, False])
+def test_datos_downloads_go_without_a_key(sent_headers, monkeypatch, datos_rate_limited):
+    monkeypatch.setattr(http_session, "DATOS_RATE_LIMITED", datos_rate_limited)
+    pool = key_pool.get_key_pool()
+    tokens_before = pool.keys[0].bucket.stats()['requests']
+
+    http_session.session_get("http://localhost/datos", keyed=False)
+
+    assert 'api_key' not in sent_headers[0]
+    # Ni la clave ni su limitador cuentan la descarga; solo el limitador propio si AEMET_DATOS_RATE_LIMITED
+    assert pool.stats()[0]['requests'] == 0
+    assert pool.keys[0].bucket.stats()['requests'] == tokens_before
+    assert pool.keyless.stats()['requests'] == (1 if datos_rate_limited else 0)
+
+
+def test_pool_is_restored_after_the_fixture():
+    assert "pool-key" not in [api_key.key for api_key in key_pool.get_key_pool().keys]
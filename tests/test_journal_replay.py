@@ -0,0 +1,53 @@
+from scripts.error_journal import append_journal_entry, iter_journal
+from scripts.journal_replay import replay_journal
+from scripts.utils import journal_entry_url
+
+BASE = "https://opendata.aemet.es/opendata/api/valores/climatologicos/diarios/datos"
+
+
+def journal(station_code, request_url):
+    append_journal_entry("errors", {
+        "station_code": station_code,
+        "url": "URL no disponible",
+        "server_response": "timeout",
+        "fetched_date": "2025-04-10T00:00:00+00:00",
+        "request_url": request_url
+    })
+
+
+def test_entries_with_the_same_target_are_requested_once(journal_dir):
+    journal("A", f"{BASE}/1")
+    journal("B", f"{BASE}/1")
+    journal("A", f"{BASE}/2")
+    calls = []
+
+    def worker(url):
+        calls.append(url)
+        return [url]
+
+    summary = replay_journal("errors", journal_entry_url, worker, lambda url, result: None)
+
+    assert sorted(calls) == [f"{BASE}/1", f"{BASE}/2"]
+    assert (summary["entries"], summary["targets"], summary["recovered"]) == (3, 2, 2)
+    assert list(iter_journal("errors")) == []
+
+
+def test_only_recovered_entries_leave_the_journal(journal_dir):
+    journal("A", f"{BASE}/ok")
+    journal("A", f"{BASE}/empty")
+    journal("A", f"{BASE}/error")
+    journal("A", "URL no disponible")
+    stored = []
+
+    def worker(url):
+        if url.endswith("/error"):
+            raise RuntimeError("sigue caído")
+        return [url] if url.endswith("/ok") else None
+
+    summary = replay_journal("errors", journal_entry_url, worker, lambda url, result: stored.append(url))
+
+    assert stored == [f"{BASE}/ok"]
+    assert (summary["recovered"], summary["failed"], summary["skipped"]) == (1, 2, 1)
+    assert {entry["request_url"] for entry in iter_journal("errors")} == {
+        f"{BASE}/empty", f"{BASE}/error", "URL no disponible"
+    }
@@ -0,0 +1,93 @@
+import pytest
+
+from scripts import key_pool, rate_control
+from scripts.key_pool import ApiKeyPool, load_api_keys
+from scripts.rate_limiter import TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    # Limitador propio para no tocar el global ni esperar en los tests
+    bucket = TokenBucket(rate=100, burst=100)
+    monkeypatch.setattr(key_pool, 'get_rate_limiter', lambda: bucket)
+    monkeypatch.setattr(key_pool, 'load_rate_state', lambda: {})
+    monkeypatch.setattr(rate_control, 'DECREASE_HOLD', 0)
+    return bucket
+
+
+def test_load_api_keys_drops_empty_and_repeated(monkeypatch):
+    monkeypatch.setenv("AEMET_API_KEYS", " key-a ,,key-b,key-a ")
+    assert load_api_keys() == ["key-a", "key-b"]
+
+    monkeypatch.delenv("AEMET_API_KEYS")
+    monkeypatch.setenv("AEMET_API_KEY", "key-c")
+    assert load_api_keys() == ["key-c"]
+
+
+def test_requests_are_spread_across_keys(limiter):
+    pool = ApiKeyPool(["key-a", "key-b"], autotune=False)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.key, second.key} == {"key-a", "key-b"}
+    # La primera clave usa el limitador global; las demás uno propio con la misma tasa
+    assert pool.keys[0].bucket is limiter
+    assert pool.keys[1].bucket.rate == limiter.rate
+
+    pool.release(first, "success")
+    pool.release(second, "success")
+    assert [api_key.in_flight for api_key in pool.keys] == [0, 0]
+
+
+def test_rate_limited_key_is_paused(limiter):
+    pool = ApiKeyPool(["key-a", "key-b"], autotune=False)
+
+    api_key = pool.acquire()
+    pool.release(api_key, "rate_limited", cooldown=60)
+    other = next(candidate for candidate in pool.keys if candidate is not api_key)
+
+    assert api_key.rate_limited == 1
+    assert api_key.cooldown_remaining() > 59
+    assert [pool.acquire() for _ in range(3)] == [other] * 3
+    # Aún queda una clave disponible: no hay que esperar para reintentar
+    assert pool.retry_delay() == 0
+
+
+def test_retry_delay_waits_for_the_only_key():
+    pool = ApiKeyPool(["key-a"], autotune=False)
+    pool.release(pool.acquire(), "rate_limited", cooldown=60)
+
+    assert 59 < pool.retry_delay() <= 60
+
+
+def test_autotune_only_slows_the_congested_key():
+    pool = ApiKeyPool(["key-a", "key-b"], autotune=True)
+    key_a, key_b = pool.keys
+    initial = key_b.bucket.rate
+
+    pool.release(pool.acquire(), "rate_limited", cooldown=0)
+    congested = key_a if key_a.rate_limited else key_b
+    healthy = key_b if congested is key_a else key_a
+
+    assert congested.bucket.rate == pytest.approx(initial * rate_control.RATE_DECREASE)
+    assert healthy.bucket.rate == initial
+    assert set(pool.rate_states()) == {rate_control.key_id("key-a"), rate_control.key_id("key-b")}
+
+
+def test_keyless_downloads_do_not_spend_key_tokens(limiter):
+    pool = ApiKeyPool(["key-a", "key-b"], autotune=False)
+
+    for _ in range(5):
+        pool.acquire_keyless()
+
+    assert pool.keyless.rate == limiter.rate * 2
+    assert pool.keyless.stats()['requests'] == 5
+    assert [api_key.bucket.stats()['requests'] for api_key in pool.keys] == [0, 0]
+
+
+def test_pool_without_keys_uses_global_limiter(limiter):
+    pool = ApiKeyPool([], autotune=False)
+
+    assert pool.acquire() is None
+    assert limiter.stats()['requests'] == 1
+    pool.release(None, "success")
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from scripts.pipeline import run_pipeline
+
+
+def test_every_item_is_stored():
+    stored = {}
+
+    stats = run_pipeline(
+        range(50),
+        metadata_stage=lambda item: f"datos://{item}",
+        download_stage=lambda item, url: {"url": url, "item": item},
+        store_stage=stored.__setitem__,
+        metadata_concurrency=3, download_concurrency=4, queue_size=2
+    )
+
+    assert stored == {item: {"url": f"datos://{item}", "item": item} for item in range(50)}
+    assert (stats["items"], stats["stored"], stats["dropped"]) == (50, 50, 0)
+
+
+def test_none_and_errors_drop_the_item():
+    stored = []
+
+    def metadata(item):
+        return None if item == 1 else item
+
+    def download(item, value):
+        if item == 2:
+            raise ConnectionError("datos")
+        return None if item == 3 else value
+
+    def store(item, payload):
+        if item == 4:
+            raise ValueError("guardado")
+        stored.append(item)
+
+    stats = run_pipeline(range(8), metadata, download, store, metadata_concurrency=2, download_concurrency=2)
+
+    assert sorted(stored) == [0, 5, 6, 7]
+    assert (stats["stored"], stats["dropped"]) == (4, 4)
+
+
+def test_store_runs_in_calling_thread():
+    threads = set()
+
+    run_pipeline(
+        range(10), lambda item: item, lambda item, value: value,
+        lambda item, payload: threads.add(threading.current_thread()),
+        metadata_concurrency=2, download_concurrency=2
+    )
+
+    assert threads == {threading.current_thread()}
+
+
+@pytest.mark.parametrize("metadata_concurrency,download_concurrency", [(1, 4), (4, 1), (0, 0)])
+def test_stage_sizes_do_not_lose_items(metadata_concurrency, download_concurrency):
+    stored = []
+
+    stats = run_pipeline(
+        range(20), lambda item: item, lambda item, value: value, lambda item, payload: stored.append(item),
+        metadata_concurrency=metadata_concurrency, download_concurrency=download_concurrency, queue_size=1
+    )
+
+    assert sorted(stored) == list(range(20))
+    assert stats["stored"] == 20
+
+
+def test_empty_input():
+    assert run_pipeline([], None, None, None) is None
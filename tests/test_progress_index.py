@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from scripts import progress_index
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    # Cada test empieza sin índices en memoria (como un proceso nuevo)
+    monkeypatch.setattr(progress_index, '_indexes', {})
+    monkeypatch.setattr(progress_index, '_stamps', {})
+    path = tmp_path / 'weather_data.json'
+    path.write_text('{"A": {}, "B": {}}', encoding='utf-8')
+    return str(path)
+
+
+def new_process(monkeypatch):
+    monkeypatch.setattr(progress_index, '_indexes', {})
+    monkeypatch.setattr(progress_index, '_stamps', {})
+
+
+def test_index_is_kept_while_data_file_is_unchanged(data_path, monkeypatch):
+    progress_index.rebuild_index(data_path, {'A', 'B'})
+    new_process(monkeypatch)
+
+    assert progress_index.load_index(data_path) == {'A', 'B'}
+
+
+def test_rewritten_data_file_invalidates_index(data_path, monkeypatch):
+    progress_index.rebuild_index(data_path, {'A', 'B'})
+    # Otro proceso (o una copia de seguridad) reescribe el archivo de datos sin pasar por el índice
+    with open(data_path, 'w', encoding='utf-8') as f:
+        f.write('{}')
+    new_process(monkeypatch)
+
+    assert progress_index.load_index(data_path) is None
+
+
+def test_missing_data_file_invalidates_index(data_path, monkeypatch):
+    progress_index.rebuild_index(data_path, {'A', 'B'})
+    os.remove(data_path)
+    new_process(monkeypatch)
+
+    assert progress_index.load_index(data_path) is None
+
+
+def test_index_without_stamp_is_rebuilt(data_path, monkeypatch):
+    # Índice escrito por una versión anterior: solo claves
+    with open(progress_index.index_path(data_path), 'w', encoding='utf-8') as f:
+        f.write('A\nB\n')
+
+    assert progress_index.load_index(data_path) is None
+
+
+def test_mark_done_restamps_after_each_write(data_path, monkeypatch):
+    progress_index.rebuild_index(data_path, {'A', 'B'})
+
+    with open(data_path, 'w', encoding='utf-8') as f:
+        f.write('{"A": {}, "B": {}, "C": {}}')
+    assert progress_index.mark_done(data_path, ['C']) == 1
+
+    # Reescritura sin claves nuevas: el índice se vuelve a sellar igualmente
+    with open(data_path, 'w', encoding='utf-8') as f:
+        f.write('{"A": {"date": {}}, "B": {}, "C": {}}')
+    assert progress_index.mark_done(data_path, ['A']) == 0
+
+    new_process(monkeypatch)
+    assert progress_index.load_index(data_path) == {'A', 'B', 'C'}
+
+
+def test_stamp_index_only_writes_when_data_changed(data_path):
+    progress_index.rebuild_index(data_path, {'A', 'B'})
+    idx = progress_index.index_path(data_path)
+    size = os.path.getsize(idx)
+
+    progress_index.stamp_index(data_path)
+    assert os.path.getsize(idx) == size
+
+    with open(data_path, 'a', encoding='utf-8') as f:
+        f.write(' ')
+    progress_index.stamp_index(data_path)
+    assert os.path.getsize(idx) > size
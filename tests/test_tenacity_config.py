@@ -0,0 +1,77 @@
+import time
+import threading
+
+import pytest
+import requests
+from requests import exceptions
+from scripts.tenacity_config import CircuitBreaker, RateLimitException, is_retryable_error
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return exceptions.HTTPError(response=response)
+
+
+@pytest.mark.parametrize("exc", [
+    exceptions.ConnectionError(), exceptions.ConnectTimeout(), exceptions.ReadTimeout(),
+    exceptions.ChunkedEncodingError(), RateLimitException(retry_after=1),
+    http_error(429), http_error(408), http_error(503)
+])
+def test_transient_errors_are_retried(exc):
+    assert is_retryable_error(exc)
+
+
+@pytest.mark.parametrize("exc", [
+    exceptions.InvalidURL(), exceptions.MissingSchema(), exceptions.InvalidHeader(), exceptions.InvalidSchema(),
+    exceptions.RequestException(), http_error(401), http_error(404), ValueError()
+])
+def test_permanent_errors_are_not_retried(exc):
+    assert not is_retryable_error(exc)
+
+
+def test_breaker_opens_after_threshold_consecutive_failures():
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 1
+
+
+def test_breaker_half_open_probe_reopens_with_longer_pause():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05, max_cooldown=0.15)
+    breaker.record_failure()
+
+    start = time.monotonic()
+    breaker.wait()
+    assert time.monotonic() - start >= 0.04
+    assert breaker.state == "half_open"
+
+    breaker.record_failure()
+    assert (breaker.state, breaker.cooldown) == ("open", 0.1)
+    breaker.wait()
+    breaker.record_failure()
+    assert breaker.cooldown == 0.15
+
+
+def test_breaker_probe_blocks_other_requests_until_it_closes():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.01)
+    breaker.record_failure()
+    breaker.wait()
+
+    waiter = threading.Thread(target=breaker.wait)
+    waiter.start()
+    waiter.join(0.1)
+    # Con la petición de prueba en vuelo los demás hilos esperan
+    assert waiter.is_alive()
+
+    breaker.record_success()
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert (breaker.state, breaker.cooldown, breaker.failures) == ("closed", 0.01, 0)
@@ -0,0 +1,39 @@
+import json
+import pytest
+from scripts.verify_files import iter_json_object_items
+
+DOCUMENTS = [
+    {"a": -2.5},
+    {"a": 12.5, "b": 1e3, "c": -0.0, "d": 2E-5, "e": 7},
+    {"a": [1.25, -3, 4.5e+2], "b": {"c": 0.001}, "d": True, "e": None, "f": "1,5"},
+    {"ESTACION": {"date": {"2025-01-01": {"values": {"tmed": 12.5, "hr": 85}}}}, "x": 123456789.125},
+]
+
+
+def write(tmp_path, text):
+    path = tmp_path / "data.json"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("indent", [None, 4])
+def test_matches_json_load_for_every_chunk_size(tmp_path, document, indent):
+    path = write(tmp_path, json.dumps(document, indent=indent))
+    with open(path, encoding="utf-8") as f:
+        expected = json.load(f)
+
+    for chunk_size in range(1, 40):
+        assert dict(iter_json_object_items(path, "no existe", chunk_size=chunk_size)) == expected
+
+
+def test_number_split_at_default_chunk_size(tmp_path):
+    # '12.' queda al final del primer bloque de 65536 caracteres
+    path = write(tmp_path, '{"a": ' + ' ' * 65527 + '12.5}')
+    assert dict(iter_json_object_items(path, "no existe")) == {"a": 12.5}
+
+
+def test_malformed_json_still_fails(tmp_path):
+    path = write(tmp_path, '{"a": 12.5 "b": 1}')
+    with pytest.raises(ValueError):
+        dict(iter_json_object_items(path, "no existe", chunk_size=3))
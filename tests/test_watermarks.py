@@ -0,0 +1,52 @@
+from scripts.watermarks import group_watermark, result_watermark
+
+
+class FakeStore:
+    def __init__(self, last_dates):
+        self.last_dates = last_dates
+
+    def station_last_date(self, station_code):
+        return self.last_dates.get(station_code)
+
+
+def station(code, *dates):
+    return {"town_code": code, "date": {d: {} for d in dates}}
+
+
+def test_group_watermark_uses_stored_mark():
+    assert group_watermark("G1", ["A", "B"], FakeStore({}), {"G1": "2025-03-01"}) == "2025-03-01"
+
+
+def test_group_watermark_is_min_last_date_when_every_station_has_data():
+    store = FakeStore({"A": "2025-03-05", "B": "2025-03-02"})
+    assert group_watermark("G1", ["A", "B"], store, {}) == "2025-03-02"
+
+
+def test_group_watermark_ignores_stations_that_never_reported():
+    store = FakeStore({"A": "2025-03-05", "B": "2025-03-02"})
+    assert group_watermark("G1", ["A", "B", "C"], store, {}) == "2025-03-02"
+
+
+def test_group_watermark_is_none_when_no_station_has_data():
+    assert group_watermark("G1", ["A", "B"], FakeStore({}), {}) is None
+
+
+def test_result_watermark_covers_every_requested_station():
+    result = [station("A", "2025-03-01", "2025-03-04"), station("B", "2025-03-03")]
+    assert result_watermark(result, ["A", "B"], "2025-03-04") == "2025-03-03"
+
+
+def test_permanently_empty_station_does_not_hold_the_group_back():
+    # C nunca publica: no aparece en ninguna respuesta ni en el almacenamiento
+    result = [station("A", "2025-03-04"), station("B", "2025-03-04"), station("C")]
+    watermark = result_watermark(result, ["A", "B", "C"], "2025-03-04")
+    assert watermark == "2025-03-04"
+
+    # En la siguiente ejecución incremental el grupo ya está al día, y la marca reconstruida también avanza
+    assert group_watermark("G1", ["A", "B", "C"], FakeStore({}), {"G1": watermark}) >= "2025-03-04"
+    assert group_watermark("G1", ["A", "B", "C"], FakeStore({"A": "2025-03-04", "B": "2025-03-04"}), {}) == "2025-03-04"
+
+
+def test_result_watermark_is_none_when_a_station_failed():
+    result = [station("A", "2025-03-04")]
+    assert result_watermark(result, ["A", "B"], "2025-03-04", failed_codes=["B"]) is None